@@ -0,0 +1,382 @@
+"""
+Режим нескольких процессов-воркеров.
+Фронт-процесс получает обновления (long polling или webhook) и пересылает
+их воркерам по хешу user_id, так что обновления одного пользователя всегда
+обрабатывает один воркер и по порядку. Воркеры — обычные экземпляры бота в
+режиме webhook на локальных портах; состояние диалогов хранится в общей БД
+(SQLitePersistence), а фоновые службы (планировщик, таймер напоминаний,
+отправка outbox) работают только в выбранном ведущем воркере.
+"""
+
+import asyncio
+import logging
+import os
+import secrets
+import signal
+import socket
+import sys
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Optional
+
+import aiohttp
+from telegram import Bot, Update
+from telegram.error import TelegramError
+
+from database import AsyncDatabase
+from webhook import SECRET_HEADER, UpdateReceiver, WebhookServer
+
+logger = logging.getLogger(__name__)
+
+# Переменные окружения, которые фронт передаёт воркерам
+WORKER_SECRET_ENV = "TASKBOT_WORKER_SECRET"
+
+
+class LeaderElection:
+    """
+    Выбор ведущего процесса через аренду в таблице leases.
+
+    Процесс, захвативший аренду, вызывает on_elected и продлевает её каждые
+    RENEW_INTERVAL секунд; не сумев продлить (аренду перехватили или БД
+    недоступна) — вызывает on_demoted. Аренда истекает через TTL, поэтому
+    после падения ведущего его место займёт другой процесс.
+    """
+
+    LEASE_NAME = "leader"
+    TTL = timedelta(seconds=15)
+    RENEW_INTERVAL = 5.0
+
+    def __init__(
+        self,
+        db: AsyncDatabase,
+        on_elected: Callable[[], Awaitable[None]],
+        on_demoted: Callable[[], Awaitable[None]],
+    ) -> None:
+        self.db = db
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.holder = f"{socket.gethostname()}:{os.getpid()}"
+        self.is_leader = False
+        self._runner: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """Первая попытка захвата — сразу, дальше — по расписанию."""
+        await self._tick()
+        if not self.is_leader:
+            logger.info("Ведущий процесс уже выбран, %s ждёт своей очереди", self.holder)
+        self._runner = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Останавливает службы ведущего и освобождает аренду."""
+        if self._runner is not None:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+        if self.is_leader:
+            self.is_leader = False
+            await self.on_demoted()
+            await self.db.release_lease(self.LEASE_NAME, self.holder)
+
+    async def _run(self) -> None:
+        """Продление или захват аренды."""
+        while True:
+            await asyncio.sleep(self.RENEW_INTERVAL)
+            try:
+                await self._tick()
+            except Exception as e:
+                logger.error("Ошибка выбора ведущего процесса: %s", e)
+
+    async def _tick(self) -> None:
+        """Одна попытка захвата или продления аренды."""
+        acquired = await self.db.acquire_lease(self.LEASE_NAME, self.holder, self.TTL)
+        if acquired and not self.is_leader:
+            self.is_leader = True
+            logger.info("Процесс %s стал ведущим", self.holder)
+            await self.on_elected()
+        elif not acquired and self.is_leader:
+            self.is_leader = False
+            logger.warning("Процесс %s потерял аренду ведущего", self.holder)
+            await self.on_demoted()
+
+
+class ExternalChangeWatcher:
+    """
+    Опрос изменений, записанных другими процессами.
+    Слушатели Database срабатывают только на записи своего процесса;
+    наблюдатель раз в interval секунд вызывает poll_external_changes,
+    чтобы таймер напоминаний и отправка outbox ведущего узнавали о задачах
+    и сообщениях, созданных другими воркерами.
+    """
+
+    def __init__(self, db: AsyncDatabase, interval: float = 1.0) -> None:
+        self.db = db
+        self.interval = interval
+        self._runner: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Запускает опрос."""
+        self._runner = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Останавливает опрос."""
+        if self._runner is not None:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+
+    async def _run(self) -> None:
+        """Основной цикл опроса."""
+        while True:
+            try:
+                await self.db.poll_external_changes()
+            except Exception as e:
+                logger.error("Ошибка проверки изменений других процессов: %s", e)
+            await asyncio.sleep(self.interval)
+
+
+class UpdateRouter:
+    """
+    Пересылка обновлений воркерам по хешу user_id (без пользователя — чата).
+
+    У каждого воркера своя очередь и отправитель, который пересылает
+    обновления строго по одному, сохраняя порядок. route() возвращает
+    управление, когда воркер принял обновление; пока воркер недоступен
+    (например, перезапускается), пересылка повторяется с задержкой.
+    """
+
+    RETRY_BASE = 0.5
+    RETRY_MAX = 10.0
+
+    def __init__(self, bot: Bot, worker_urls: list[str], secret: str) -> None:
+        self.bot = bot
+        self.worker_urls = worker_urls
+        self.secret = secret
+        self._queues: list[asyncio.Queue] = []
+        self._senders: list[asyncio.Task] = []
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def start(self) -> None:
+        """Запускает отправителей."""
+        self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30))
+        self._queues = [asyncio.Queue() for _ in self.worker_urls]
+        self._senders = [
+            asyncio.create_task(self._sender(i)) for i in range(len(self.worker_urls))
+        ]
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Дожидается пересылки очередей (не дольше timeout) и останавливает отправителей."""
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(queue.join() for queue in self._queues)), timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warning("Фронт остановлен, не переслано обновлений: %s",
+                           sum(queue.qsize() for queue in self._queues))
+        for task in self._senders:
+            task.cancel()
+        await asyncio.gather(*self._senders, return_exceptions=True)
+        if self._session is not None:
+            await self._session.close()
+
+    def worker_for(self, data: dict[str, Any]) -> int:
+        """Номер воркера для обновления."""
+        update = Update.de_json(data, self.bot)
+        if update is not None and update.effective_user is not None:
+            key = update.effective_user.id
+        elif update is not None and update.effective_chat is not None:
+            key = update.effective_chat.id
+        else:
+            key = data.get("update_id", 0)
+        return key % len(self.worker_urls)
+
+    async def route(self, data: dict[str, Any]) -> None:
+        """Пересылает обновление своему воркеру и ждёт, пока тот его примет."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queues[self.worker_for(data)].put((data, future))
+        await future
+
+    async def _sender(self, index: int) -> None:
+        """Пересылает обновления очереди воркера index по одному."""
+        queue = self._queues[index]
+        url = self.worker_urls[index]
+        while True:
+            data, future = await queue.get()
+            delay = self.RETRY_BASE
+            while True:
+                try:
+                    async with self._session.post(
+                        url, json=data, headers={SECRET_HEADER: self.secret}
+                    ) as response:
+                        if response.status == 200:
+                            break
+                        if response.status == 400:
+                            logger.error("Воркер %s отклонил обновление %s",
+                                         index, data.get("update_id"))
+                            break
+                        error = f"HTTP {response.status}"
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    error = str(e) or type(e).__name__
+                logger.warning("Воркер %s недоступен (%s), повтор через %s с",
+                               index, error, delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.RETRY_MAX)
+            if not future.done():
+                future.set_result(None)
+            queue.task_done()
+
+
+class WorkerSupervisor:
+    """Запуск воркеров и перезапуск упавших."""
+
+    RESTART_DELAY = 1.0
+    STOP_TIMEOUT = 30.0
+
+    def __init__(self, workers: int, secret: str) -> None:
+        self.workers = workers
+        self.secret = secret
+        self._processes: list[Optional[asyncio.subprocess.Process]] = [None] * workers
+        self._monitors: list[asyncio.Task] = []
+        self._stopping = False
+
+    def start(self) -> None:
+        """Запускает воркеры."""
+        self._monitors = [
+            asyncio.create_task(self._monitor(i)) for i in range(self.workers)
+        ]
+
+    async def stop(self) -> None:
+        """Останавливает воркеры: SIGTERM, а через STOP_TIMEOUT — SIGKILL."""
+        self._stopping = True
+        for process in self._processes:
+            if process is not None and process.returncode is None:
+                process.terminate()
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*self._monitors, return_exceptions=True),
+                self.STOP_TIMEOUT,
+            )
+        except asyncio.TimeoutError:
+            for process in self._processes:
+                if process is not None and process.returncode is None:
+                    logger.warning("Воркер (pid %s) не остановился, завершаем", process.pid)
+                    process.kill()
+            await asyncio.gather(*self._monitors, return_exceptions=True)
+
+    async def _monitor(self, index: int) -> None:
+        """Держит воркер index запущенным до остановки."""
+        env = {**os.environ, WORKER_SECRET_ENV: self.secret}
+        main_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+        while not self._stopping:
+            # Своя группа процессов: Ctrl+C в терминале получает только фронт,
+            # а воркеры он останавливает сам, переслав им принятые обновления
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, main_path, "--worker", str(index),
+                env=env, start_new_session=True,
+            )
+            self._processes[index] = process
+            logger.info("Воркер %s запущен (pid %s)", index, process.pid)
+            code = await process.wait()
+            if not self._stopping:
+                logger.error("Воркер %s завершился с кодом %s, перезапуск", index, code)
+                await asyncio.sleep(self.RESTART_DELAY)
+
+
+# Запуск фронт-процесса с воркерами
+def run_cluster(
+    bot: Bot,
+    workers: int,
+    base_port: int,
+    make_server: Optional[Callable[[UpdateReceiver], WebhookServer]] = None,
+    webhook_url: str = "",
+) -> None:
+    """
+    Запускает workers воркеров на портах base_port + i и пересылает им
+    обновления до SIGINT/SIGTERM. Без make_server обновления забираются
+    long polling; иначе их принимает сервер make_server(приёмник), а
+    webhook_url (если задан) регистрируется через setWebhook.
+    """
+    asyncio.run(_serve_cluster(bot, workers, base_port, make_server, webhook_url))
+
+
+async def _serve_cluster(
+    bot: Bot,
+    workers: int,
+    base_port: int,
+    make_server: Optional[Callable[[UpdateReceiver], WebhookServer]],
+    webhook_url: str,
+) -> None:
+    """Асинхронная часть run_cluster."""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    secret = secrets.token_urlsafe(32)
+    supervisor = WorkerSupervisor(workers, secret)
+    router = UpdateRouter(
+        bot, [f"http://127.0.0.1:{base_port + i}/telegram" for i in range(workers)], secret
+    )
+    webhook_server = make_server(router.route) if make_server is not None else None
+    async with bot:
+        supervisor.start()
+        await router.start()
+        if webhook_server is not None:
+            await webhook_server.start()
+            if webhook_url:
+                await bot.set_webhook(
+                    url=webhook_url,
+                    secret_token=webhook_server.secret_token,
+                    allowed_updates=Update.ALL_TYPES,
+                    drop_pending_updates=False,
+                )
+            intake = asyncio.create_task(stop_event.wait())
+        else:
+            intake = asyncio.create_task(_poll(bot, router, stop_event))
+        logger.info("Фронт запущен, воркеров: %s", workers)
+
+        await stop_event.wait()
+        logger.info("Получен сигнал остановки")
+        if webhook_server is not None:
+            await webhook_server.stop()
+        await intake
+        await router.stop()
+        await supervisor.stop()
+
+
+async def _poll(bot: Bot, router: UpdateRouter, stop_event: asyncio.Event) -> None:
+    """
+    Long polling: пачка обновлений подтверждается (offset) только после того,
+    как все её обновления приняты воркерами.
+    """
+    await bot.delete_webhook(drop_pending_updates=False)
+    offset: Optional[int] = None
+    while not stop_event.is_set():
+        fetch = asyncio.create_task(bot.get_updates(
+            offset=offset, timeout=30, allowed_updates=Update.ALL_TYPES
+        ))
+        stop = asyncio.create_task(stop_event.wait())
+        await asyncio.wait((fetch, stop), return_when=asyncio.FIRST_COMPLETED)
+        stop.cancel()
+        if not fetch.done():
+            fetch.cancel()
+            break
+        try:
+            updates = fetch.result()
+        except TelegramError as e:
+            logger.error("Ошибка получения обновлений: %s", e)
+            await asyncio.sleep(1)
+            continue
+        if updates:
+            await asyncio.gather(*(router.route(update.to_dict()) for update in updates))
+            offset = updates[-1].update_id + 1
+    # Подтверждаем последнюю пачку, чтобы после перезапуска она не пришла снова
+    if offset is not None:
+        try:
+            await bot.get_updates(offset=offset, timeout=0, limit=1)
+        except TelegramError as e:
+            logger.warning("Не удалось подтвердить последние обновления: %s", e)
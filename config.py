@@ -13,9 +13,82 @@ load_dotenv()
 # Токен бота Telegram
 BOT_TOKEN: str = os.getenv("BOT_TOKEN", "")
 
+# Способ получения обновлений: "polling" (long polling) или "webhook"
+# (локальный HTTP-сервер, см. webhook.py)
+BOT_MODE: str = os.getenv("BOT_MODE", "polling").lower()
+
+# Режим webhook: адрес и порт локального сервера, путь, секретный токен
+# (заголовок X-Telegram-Bot-Api-Secret-Token) и публичный URL для setWebhook
+# (пусто — webhook уже зарегистрирован или обновления шлёт прокси/тест)
+WEBHOOK_LISTEN: str = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT: int = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH: str = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET: str = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_URL: str = os.getenv("WEBHOOK_URL", "")
+
+# Несколько процессов: фронт пересылает обновления WORKERS воркерам
+# (по хешу user_id) на локальные порты WORKER_BASE_PORT + i; 1 — один процесс
+WORKERS: int = int(os.getenv("WORKERS", "1"))
+WORKER_BASE_PORT: int = int(os.getenv("WORKER_BASE_PORT", "8100"))
+
+# Адрес Bot API (пусто — api.telegram.org); например, локальный
+# scripts/fake_bot_api.py для проверки без Telegram
+TELEGRAM_API_BASE_URL: str = os.getenv("TELEGRAM_API_BASE_URL", "").rstrip("/")
+
+# Как часто user_data и состояния диалогов сохраняются в БД, секунды
+PERSISTENCE_INTERVAL: float = float(os.getenv("PERSISTENCE_INTERVAL", "5"))
+
+# Сколько обновлений обрабатывается параллельно (1 — по одному, как в
+# python-telegram-bot по умолчанию); обновления одного пользователя всегда
+# выполняются по очереди. Включается явно, например UPDATE_CONCURRENCY=16
+UPDATE_CONCURRENCY: int = int(os.getenv("UPDATE_CONCURRENCY", "1"))
+
 # Путь к базе данных SQLite
 DATABASE_PATH: str = os.getenv("DATABASE_PATH", "taskbot.db")
 
+# Пул соединений SQLite: 0 — одно общее соединение (rollback journal),
+# N > 0 — режим WAL с одним писателем и N соединениями только для чтения.
+# WAL включается явно: он меняет файл БД и добавляет файлы -wal и -shm
+DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "0"))
+
+# Настройки производительности SQLite (PRAGMA synchronous / cache_size / mmap_size)
+DB_SYNCHRONOUS: str = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+DB_CACHE_SIZE: int = int(os.getenv("DB_CACHE_SIZE", "-16000"))
+DB_MMAP_SIZE: int = int(os.getenv("DB_MMAP_SIZE", str(64 * 1024 * 1024)))
+
+# Групповой коммит частых записей: интервал сброса в мс (0 — выключен)
+# и максимальный размер пакета
+DB_GROUP_COMMIT_MS: int = int(os.getenv("DB_GROUP_COMMIT_MS", "0"))
+DB_GROUP_COMMIT_MAX: int = int(os.getenv("DB_GROUP_COMMIT_MAX", "64"))
+
+# Очередь исходящих сообщений: общий лимит бота (сообщений в секунду)
+# и число параллельных отправок
+OUTBOX_RATE: float = float(os.getenv("OUTBOX_RATE", "30"))
+OUTBOX_WORKERS: int = int(os.getenv("OUTBOX_WORKERS", "8"))
+
+# Объединение уведомлений о статусах и комментариях в сводку: сколько секунд
+# ждать следующих событий для того же получателя и дольше какого срока
+# не задерживать первое (0 — каждое уведомление отправляется сразу).
+# Окно — задержка каждого такого уведомления: при 60 с получатель узнаёт о
+# смене статуса через минуту, зато серия правок приходит одним сообщением
+NOTIFY_COALESCE_WINDOW: int = int(os.getenv("NOTIFY_COALESCE_WINDOW", "0"))
+NOTIFY_COALESCE_MAX_DELAY: int = int(os.getenv("NOTIFY_COALESCE_MAX_DELAY", "300"))
+
+# Сколько секунд хранить в памяти активную команду, роль и тариф пользователя
+# (0 — каждый раз читать из БД)
+IDENTITY_CACHE_TTL: float = float(os.getenv("IDENTITY_CACHE_TTL", "30"))
+
+# Inline-режим (@бот текст): пауза в наборе (секунды), после которой бот
+# отвечает на последний запрос, и срок хранения ответов в кэше (секунды)
+INLINE_DEBOUNCE: float = float(os.getenv("INLINE_DEBOUNCE", "0.3"))
+INLINE_CACHE_TTL: int = int(os.getenv("INLINE_CACHE_TTL", "10"))
+
+# Напоминания о дедлайнах по умолчанию: минуты до дедлайна через запятую
+# (команды могут задать свои через /reminders)
+DEFAULT_REMINDER_OFFSETS: list[int] = [
+    int(m) for m in os.getenv("DEFAULT_REMINDER_OFFSETS", "1440,180,0").split(",")
+]
+
 # Часовой пояс по умолчанию
 DEFAULT_TIMEZONE: str = os.getenv("DEFAULT_TIMEZONE", "Europe/Moscow")
 
@@ -3,113 +3,912 @@
 Содержит класс Database с CRUD-операциями для всех сущностей.
 """
 
+import asyncio
+import functools
+import json
+import queue
+import re
 import sqlite3
 import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from typing import Any, Optional
+from typing import Any, Callable, Iterable, Iterator, NamedTuple, Optional
+
+import pytz
+
+from config import DEFAULT_TIMEZONE
 
 logger = logging.getLogger(__name__)
 
 
+# Текст для полнотекстового индекса: unicode61 не сводит «ё» к «е»
+def _fts_fold_sql(expr: str) -> str:
+    """SQL-выражение expr с заменой «ё» на «е» (так же нормализуется запрос)."""
+    return f"replace(replace({expr}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+# Канонические имена часовых поясов пользователей
+def _canonicalize_timezones(conn: sqlite3.Connection) -> None:
+    """
+    Заменяет сохранённые пояса на канонические имена pytz ("europe/moscow" →
+    "Europe/Moscow"): по ним сводка выбирает когорту. Пустые и неизвестные
+    пояса заменяются на DEFAULT_TIMEZONE.
+    """
+    for (stored,) in conn.execute("SELECT DISTINCT timezone FROM users").fetchall():
+        try:
+            canonical = pytz.timezone(stored).zone if stored else DEFAULT_TIMEZONE
+        except pytz.UnknownTimeZoneError:
+            logger.warning(
+                "Неизвестный часовой пояс: %s, заменён на %s", stored, DEFAULT_TIMEZONE
+            )
+            canonical = DEFAULT_TIMEZONE
+        if canonical != stored:
+            conn.execute(
+                "UPDATE users SET timezone = ? WHERE timezone IS ?", (canonical, stored)
+            )
+
+
+# Миграции схемы: элемент i переводит базу с версии i на i + 1
+# (текущая версия хранится в PRAGMA user_version); строка — SQL-скрипт,
+# функция — миграция данных, которую не выразить в SQL
+SCHEMA_MIGRATIONS: list[str | Callable[[sqlite3.Connection], None]] = [
+    # 1: составные индексы под реальные запросы вместо одноколоночных
+    """
+    DROP INDEX IF EXISTS idx_tasks_team;
+    DROP INDEX IF EXISTS idx_tasks_assignee;
+    DROP INDEX IF EXISTS idx_tasks_status;
+    DROP INDEX IF EXISTS idx_tasks_deadline;
+    -- Задачи команды по статусу и дедлайну (активные, просроченные)
+    CREATE INDEX IF NOT EXISTS idx_tasks_team_status_deadline
+        ON tasks(team_id, status, deadline);
+    -- Списки задач команды в порядке дедлайна, /today, /week
+    CREATE INDEX IF NOT EXISTS idx_tasks_team_deadline
+        ON tasks(team_id, deadline);
+    -- Задачи исполнителя в команде
+    CREATE INDEX IF NOT EXISTS idx_tasks_assignee_team_status_deadline
+        ON tasks(assignee_id, team_id, status, deadline);
+    -- Частичный индекс активных задач для сканирования напоминаний
+    CREATE INDEX IF NOT EXISTS idx_tasks_active_deadline
+        ON tasks(deadline) WHERE status IN ('todo', 'in_progress');
+    CREATE INDEX IF NOT EXISTS idx_comments_task
+        ON comments(task_id, created_at);
+    CREATE INDEX IF NOT EXISTS idx_reminders_task_type
+        ON reminders(task_id, reminder_type);
+    """,
+    # 2: дедлайны в едином формате ГГГГ-ММ-ДДTЧЧ:ММ:СС для диапазонных сравнений
+    """
+    UPDATE tasks SET deadline = strftime('%Y-%m-%dT%H:%M:%S', deadline)
+    WHERE deadline IS NOT NULL
+    AND strftime('%Y-%m-%dT%H:%M:%S', deadline) IS NOT NULL
+    AND deadline != strftime('%Y-%m-%dT%H:%M:%S', deadline);
+    """,
+    # 3: не более одного напоминания каждого типа на задачу
+    """
+    DELETE FROM reminders WHERE reminder_id NOT IN (
+        SELECT MIN(reminder_id) FROM reminders GROUP BY task_id, reminder_type
+    );
+    DROP INDEX IF EXISTS idx_reminders_task_type;
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_reminders_task_type_unique
+        ON reminders(task_id, reminder_type);
+    """,
+    # 4: смещения напоминаний команды в минутах до дедлайна ("1440,180,0");
+    # NULL — значения по умолчанию из конфигурации
+    """
+    ALTER TABLE teams ADD COLUMN reminder_offsets TEXT;
+    """,
+    # 5: пользователи по часовому поясу — для сводок по когортам поясов
+    """
+    CREATE INDEX IF NOT EXISTS idx_users_timezone ON users(timezone);
+    """,
+    # 6: надёжная очередь уведомлений: сообщение пишется в одной транзакции
+    # с вызвавшим его изменением и удаляется после отправки и срока хранения
+    """
+    CREATE TABLE IF NOT EXISTS outbox (
+        message_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        idempotency_key TEXT NOT NULL UNIQUE,
+        chat_id INTEGER NOT NULL,
+        text TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        sent_at TEXT,
+        last_error TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_outbox_pending
+        ON outbox(next_attempt_at) WHERE status = 'pending';
+    CREATE INDEX IF NOT EXISTS idx_outbox_done
+        ON outbox(created_at) WHERE status != 'pending';
+    """,
+    # 7: объединение уведомлений получателю в сводку: digest — строка события
+    # для сводки (NULL — сообщение не объединяется), task_id — задача события
+    """
+    ALTER TABLE outbox ADD COLUMN task_id INTEGER;
+    ALTER TABLE outbox ADD COLUMN digest TEXT;
+    CREATE INDEX IF NOT EXISTS idx_outbox_coalesce
+        ON outbox(chat_id, created_at) WHERE status = 'pending' AND digest IS NOT NULL;
+    """,
+    # 8: несколько процессов-воркеров: общее состояние диалогов (user_data и
+    # ConversationHandler), аренды для выбора ведущего и поиск задач,
+    # изменённых другими процессами
+    """
+    CREATE TABLE IF NOT EXISTS user_data (
+        user_id INTEGER PRIMARY KEY,
+        data TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS conversations (
+        name TEXT NOT NULL,
+        conversation_key TEXT NOT NULL,
+        state TEXT NOT NULL,
+        PRIMARY KEY (name, conversation_key)
+    );
+    CREATE TABLE IF NOT EXISTS leases (
+        name TEXT PRIMARY KEY,
+        holder TEXT NOT NULL,
+        expires_at TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_tasks_updated ON tasks(updated_at);
+    """,
+    # 9: явно выбранная активная команда пользователя; до выбора — первая
+    # по времени вступления, как раньше возвращал get_user_active_team
+    """
+    ALTER TABLE users ADD COLUMN active_team_id INTEGER
+        REFERENCES teams(team_id) ON DELETE SET NULL;
+    UPDATE users SET active_team_id = (
+        SELECT tm.team_id FROM team_members tm
+        WHERE tm.user_id = users.user_id ORDER BY tm.id LIMIT 1
+    );
+    """,
+    # 10: полнотекстовый поиск задач (/search): название, описание, теги и
+    # комментарии; team — токен команды вида t<team_id>, по которому запрос
+    # ограничивается командой внутри самого индекса. rowid совпадает с task_id,
+    # индекс поддерживают триггеры на tasks и comments
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+        title, description, tags, comments, team,
+        tokenize = 'unicode61 remove_diacritics 2'
+    );
+    -- Ранжирование bm25: название весомее описания и тегов, комментарии —
+    -- слабее всего; столбец команды на ранг не влияет
+    INSERT INTO tasks_fts (tasks_fts, rank) VALUES ('rank', 'bm25(10.0, 3.0, 5.0, 1.0, 0.0)');
+    INSERT INTO tasks_fts (rowid, title, description, tags, comments, team)
+    SELECT t.task_id, {_fts_fold_sql("t.title")}, {_fts_fold_sql("t.description")},
+           {_fts_fold_sql("t.tags")},
+           COALESCE((SELECT {_fts_fold_sql("group_concat(c.text, ' ')")}
+                     FROM comments c WHERE c.task_id = t.task_id), ''),
+           't' || t.team_id
+    FROM tasks t;
+    CREATE TRIGGER IF NOT EXISTS trg_tasks_fts_insert
+    AFTER INSERT ON tasks
+    BEGIN
+        INSERT INTO tasks_fts (rowid, title, description, tags, comments, team)
+        VALUES (NEW.task_id, {_fts_fold_sql("NEW.title")}, {_fts_fold_sql("NEW.description")},
+                {_fts_fold_sql("NEW.tags")}, '', 't' || NEW.team_id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_tasks_fts_update
+    AFTER UPDATE OF title, description, tags, team_id ON tasks
+    BEGIN
+        UPDATE tasks_fts SET
+            title = {_fts_fold_sql("NEW.title")},
+            description = {_fts_fold_sql("NEW.description")},
+            tags = {_fts_fold_sql("NEW.tags")},
+            team = 't' || NEW.team_id
+        WHERE rowid = NEW.task_id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_tasks_fts_delete
+    AFTER DELETE ON tasks
+    BEGIN
+        DELETE FROM tasks_fts WHERE rowid = OLD.task_id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_comments_fts_insert
+    AFTER INSERT ON comments
+    BEGIN
+        UPDATE tasks_fts SET comments = ltrim(comments || ' ' || {_fts_fold_sql("NEW.text")})
+        WHERE rowid = NEW.task_id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_comments_fts_delete
+    AFTER DELETE ON comments
+    BEGIN
+        UPDATE tasks_fts SET comments = COALESCE((
+            SELECT {_fts_fold_sql("group_concat(c.text, ' ')")}
+            FROM comments c WHERE c.task_id = OLD.task_id
+        ), '')
+        WHERE rowid = OLD.task_id;
+    END;
+    """,
+    # 11: поиск по началу слов названия для inline-режима: запрос приходит
+    # на каждое нажатие клавиши, поэтому префиксы до 6 символов (дальше слово
+    # обычно уже набрано целиком) хранятся в индексе готовыми
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS task_titles_fts USING fts5(
+        title, team,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '1 2 3 4 5 6'
+    );
+    INSERT INTO task_titles_fts (rowid, title, team)
+    SELECT task_id, {_fts_fold_sql("title")}, 't' || team_id FROM tasks;
+    CREATE TRIGGER IF NOT EXISTS trg_tasks_titles_fts_insert
+    AFTER INSERT ON tasks
+    BEGIN
+        INSERT INTO task_titles_fts (rowid, title, team)
+        VALUES (NEW.task_id, {_fts_fold_sql("NEW.title")}, 't' || NEW.team_id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_tasks_titles_fts_update
+    AFTER UPDATE OF title, team_id ON tasks
+    BEGIN
+        UPDATE task_titles_fts SET
+            title = {_fts_fold_sql("NEW.title")},
+            team = 't' || NEW.team_id
+        WHERE rowid = NEW.task_id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_tasks_titles_fts_delete
+    AFTER DELETE ON tasks
+    BEGIN
+        DELETE FROM task_titles_fts WHERE rowid = OLD.task_id;
+    END;
+    """,
+    # 12: канонические имена часовых поясов (раньше /timezone сохранял
+    # введённую строку как есть)
+    _canonicalize_timezones,
+]
+
+# Не более стольких слов запроса учитывается при поиске задач
+SEARCH_MAX_TERMS = 8
+
+# Формат хранения дедлайнов: строки сравниваются в хронологическом порядке
+DEADLINE_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+
+# Приведение дедлайна к формату хранения
+def normalize_deadline(value: str | datetime | None) -> str | None:
+    """Возвращает дедлайн в формате DEADLINE_FORMAT или None."""
+    if value is None or value == "":
+        return None
+    dt = value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+    return dt.strftime(DEADLINE_FORMAT)
+
+
+# Начало текущих суток в часовом поясе пользователя
+def local_day_start(timezone: str | None = None) -> datetime:
+    """
+    Полночь текущего дня в указанном часовом поясе (без tzinfo,
+    как и хранимые дедлайны). Без пояса — по времени сервера.
+    """
+    now = datetime.now()
+    if timezone:
+        try:
+            now = datetime.now(pytz.timezone(timezone)).replace(tzinfo=None)
+        except pytz.UnknownTimeZoneError:
+            logger.warning("Неизвестный часовой пояс: %s", timezone)
+    return now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+# Часовой пояс, в котором хранится дедлайн задачи
+def _deadline_zone(timezone: str | None) -> Any:
+    """Пояс исполнителя; пустой или неизвестный — DEFAULT_TIMEZONE."""
+    try:
+        return pytz.timezone(timezone or DEFAULT_TIMEZONE)
+    except pytz.UnknownTimeZoneError:
+        return pytz.timezone(DEFAULT_TIMEZONE)
+
+
+# Текущее время исполнителя — шкала, в которой хранятся дедлайны его задач
+def local_now(timezone: str | None) -> datetime:
+    """
+    Текущее время (без tzinfo) в часовом поясе исполнителя. Дедлайн задачи
+    хранится в местном времени исполнителя: он просрочен, когда раньше этого
+    значения. Пустой или неизвестный пояс — DEFAULT_TIMEZONE.
+    """
+    return datetime.now(_deadline_zone(timezone)).replace(tzinfo=None)
+
+
+# Перевод местного времени исполнителя в UTC
+def local_to_utc(local: datetime, timezone: str | None) -> datetime:
+    """
+    Переводит местное время (без tzinfo) в часовом поясе timezone в UTC
+    (без tzinfo). Пустой или неизвестный пояс — DEFAULT_TIMEZONE.
+    """
+    return _deadline_zone(timezone).localize(local).astimezone(pytz.utc).replace(tzinfo=None)
+
+
+# Наибольшее опережение местного времени относительно UTC (UTC+14)
+MAX_UTC_OFFSET = timedelta(hours=14)
+
+# Условие «задача просрочена» для запросов к tasks: дедлайн раньше местного
+# времени исполнителя (SQL-функция local_now). Параметр — overdue_bound():
+# верхняя граница для поиска по индексу дедлайнов
+OVERDUE_CONDITION = """deadline < ?
+    AND deadline < local_now(
+        (SELECT u.timezone FROM users u WHERE u.user_id = tasks.assignee_id)
+    )"""
+
+
+# Граница дедлайнов для OVERDUE_CONDITION
+def overdue_bound() -> str:
+    """Местное время самого восточного пояса: дедлайны позже — нигде не прошли."""
+    now = datetime.now(pytz.utc).replace(tzinfo=None) + MAX_UTC_OFFSET
+    return now.strftime(DEADLINE_FORMAT)
+
+
+# SQL-функция local_now(timezone) для соединений с БД
+def _sql_local_now(timezone: str | None) -> str:
+    """local_now в формате хранения дедлайнов."""
+    return local_now(timezone).strftime(DEADLINE_FORMAT)
+
+
+# Разбиение SQL-скрипта на отдельные операторы
+def _split_sql(script: str) -> list[str]:
+    """
+    Операторы скрипта по одному (executescript не подходит: он фиксирует
+    открытую транзакцию). Граница оператора определяется sqlite3.complete_statement,
+    поэтому точки с запятой внутри триггеров и строк не разрывают оператор.
+    """
+    statements, current = [], ""
+    for line in script.splitlines(keepends=True):
+        current += line
+        if sqlite3.complete_statement(current):
+            if current.strip().strip(";").strip():
+                statements.append(current.strip())
+            current = ""
+    return statements
+
+
+# Слова поискового запроса в том виде, в каком они лежат в индексе
+def _search_terms(query: str) -> list[str]:
+    """
+    Слова запроса (буквы и цифры) в нижнем регистре, «ё» сведена к «е».
+    Остальные символы отбрасываются, поэтому синтаксис FTS5 из запроса
+    не исполняется.
+    """
+    return re.findall(r"\w+", query.lower().replace("ё", "е"))[:SEARCH_MAX_TERMS]
+
+
+# Построитель уведомлений для записи: по ID созданной или изменённой сущности
+# возвращает тройки (chat_id, текст, строка сводки), которые пишутся в outbox
+# той же транзакцией; строка сводки None — сообщение не объединяется с другими
+NotifyBuilder = Callable[[int], list[tuple[int, str, Optional[str]]]]
+
+
+class TaskListItem(NamedTuple):
+    """Задача в списке: только поля, которые показывает строка списка."""
+
+    task_id: int
+    title: str
+    priority: str
+    status: str
+    deadline: Optional[str]
+
+
+# Колонки задач для списков (list_view=True) — без описания и прочих полей
+TASK_LIST_COLUMNS = ", ".join(TaskListItem._fields)
+
+
+# Фабрика строк курсора для списков: кортеж сразу, без sqlite3.Row
+def _task_list_item(cursor: sqlite3.Cursor, row: tuple) -> TaskListItem:
+    """Строка результата как TaskListItem."""
+    return TaskListItem._make(row)
+
+
+# SQL изменения счётчиков task_counters / task_done_daily для строки задачи
+def _counter_delta_sql(row: str, delta: int) -> str:
+    """
+    Возвращает операторы, прибавляющие delta к счётчикам строки row
+    (NEW или OLD) внутри триггера на таблице tasks.
+    """
+    return f"""
+        INSERT INTO task_counters (team_id, assignee_id, status, cnt, on_time)
+        VALUES (
+            {row}.team_id, COALESCE({row}.assignee_id, 0), {row}.status, {delta},
+            CASE WHEN {row}.status = 'done'
+                 AND ({row}.completed_at <= {row}.deadline OR {row}.deadline IS NULL)
+                 THEN {delta} ELSE 0 END
+        )
+        ON CONFLICT (team_id, assignee_id, status) DO UPDATE SET
+            cnt = cnt + excluded.cnt,
+            on_time = on_time + excluded.on_time;
+        INSERT INTO task_done_daily (team_id, assignee_id, day, cnt)
+        SELECT {row}.team_id, COALESCE({row}.assignee_id, 0), DATE({row}.completed_at), {delta}
+        WHERE {row}.status = 'done' AND {row}.completed_at IS NOT NULL
+        ON CONFLICT (team_id, assignee_id, day) DO UPDATE SET
+            cnt = cnt + excluded.cnt;"""
+
+
 class Database:
     """Класс для работы с SQLite базой данных."""
 
-    def __init__(self, db_path: str) -> None:
-        """Инициализация подключения к БД."""
+    # Частые записи, которые AsyncDatabase может объединять в групповой коммит
+    GROUP_COMMIT_METHODS = frozenset({
+        "add_user",
+        "create_task",
+        "update_task_status",
+        "add_comment",
+    })
+
+    # Предел записей кэша участия (пользователей и команд)
+    IDENTITY_CACHE_SIZE = 10000
+    # Предел LRU-кэша имён пользователей
+    NAME_CACHE_SIZE = 4096
+
+    def __init__(
+        self,
+        db_path: str,
+        pool_size: int = 0,
+        synchronous: str = "NORMAL",
+        cache_size: int = -16000,
+        mmap_size: int = 0,
+        coalesce_window: float = 0.0,
+        coalesce_max_delay: float = 0.0,
+        identity_ttl: float = 0.0,
+    ) -> None:
+        """
+        Инициализация подключения к БД.
+
+        При pool_size > 0 база переводится в режим WAL: все записи идут через
+        одно соединение-писатель, а чтение — через пул из pool_size
+        соединений только для чтения, которые не блокируются записью.
+        При pool_size = 0 используется одно общее соединение.
+
+        coalesce_window — сколько секунд уведомление со строкой сводки ждёт
+        следующих для того же получателя, coalesce_max_delay — дольше этого
+        первое из них не ждёт (0 — уведомления не объединяются).
+
+        identity_ttl — сколько секунд хранить в памяти активную команду и роль
+        пользователя, данные команды и имена пользователей (0 — без кэша).
+        Изменения этого процесса сбрасывают кэш сразу, других процессов —
+        видны через ttl.
+        """
         self.db_path = db_path
+        self.coalesce_window = timedelta(seconds=coalesce_window)
+        self.coalesce_max_delay = timedelta(seconds=max(coalesce_max_delay, coalesce_window))
+        self._write_lock = threading.RLock()
+        self._in_batch = False
+        # Слушатели событий по видам: "task" — изменения задач, "outbox" — новые сообщения
+        self._listeners: dict[str, list[Callable[..., None]]] = {
+            "task": [], "outbox": [],
+            "identity": [self._forget_identities], "user": [self._forget_names],
+        }
+        self._pending_events: list[tuple[str, tuple]] = []
+        # Последнее значение PRAGMA data_version (см. poll_external_changes)
+        self._data_version: Optional[int] = None
+        # Кэш участия: user_id → (активная команда, роль), team_id → команда;
+        # значения хранятся с моментом истечения (time.monotonic())
+        self.identity_ttl = identity_ttl
+        self._identity_lock = threading.Lock()
+        self._identity_generation = 0
+        self._identities: dict[int, tuple[float, tuple[Optional[int], Optional[str]]]] = {}
+        self._teams: dict[int, tuple[float, Optional[sqlite3.Row]]] = {}
+        # LRU-кэш имён: user_id → (срок, строка user_id, first_name, username)
+        self._names: OrderedDict[int, tuple[float, sqlite3.Row]] = OrderedDict()
+        self._readers: queue.Queue[sqlite3.Connection] | None = None
+        self.pool_size = pool_size if db_path != ":memory:" else 0
+
         self.conn = sqlite3.connect(db_path, check_same_thread=False)
         self.conn.row_factory = sqlite3.Row
+        self.conn.create_function("local_now", 1, _sql_local_now)
         self.conn.execute("PRAGMA foreign_keys = ON")
+        if self.pool_size > 0:
+            self.conn.execute("PRAGMA journal_mode = WAL")
+            self._apply_pragmas(self.conn, synchronous, cache_size, mmap_size)
         self._create_tables()
-        logger.info("База данных инициализирована: %s", db_path)
+        self._migrate()
+
+        # Пул соединений только для чтения
+        if self.pool_size > 0:
+            self._readers = queue.Queue()
+            for _ in range(self.pool_size):
+                reader = sqlite3.connect(
+                    f"file:{db_path}?mode=ro", uri=True, check_same_thread=False
+                )
+                reader.row_factory = sqlite3.Row
+                reader.create_function("local_now", 1, _sql_local_now)
+                reader.execute("PRAGMA query_only = ON")
+                self._apply_pragmas(reader, synchronous, cache_size, mmap_size)
+                self._readers.put(reader)
+        logger.info(
+            "База данных инициализирована: %s (читателей в пуле: %s)",
+            db_path, self.pool_size,
+        )
+
+    @staticmethod
+    def _apply_pragmas(
+        conn: sqlite3.Connection, synchronous: str, cache_size: int, mmap_size: int
+    ) -> None:
+        """Настройка производительности соединения."""
+        conn.execute(f"PRAGMA synchronous = {synchronous}")
+        conn.execute(f"PRAGMA cache_size = {int(cache_size)}")
+        conn.execute(f"PRAGMA mmap_size = {int(mmap_size)}")
+
+    @contextmanager
+    def _read(self) -> Iterator[sqlite3.Connection]:
+        """Выдаёт соединение для чтения: из пула или общее."""
+        if self._readers is None:
+            with self._write_lock:
+                yield self.conn
+            return
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+
+    @contextmanager
+    def _write(self) -> Iterator[sqlite3.Connection]:
+        """
+        Выдаёт соединение-писатель под блокировкой.
+        Фиксирует транзакцию при успехе и откатывает при ошибке.
+        Внутри batch() операция оформляется точкой сохранения, а
+        коммит выполняет сам пакет.
+        """
+        with self._write_lock:
+            if self._in_batch:
+                self.conn.execute("SAVEPOINT op")
+                try:
+                    yield self.conn
+                except Exception:
+                    self.conn.execute("ROLLBACK TO op")
+                    self.conn.execute("RELEASE op")
+                    raise
+                self.conn.execute("RELEASE op")
+                return
+            try:
+                yield self.conn
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """Объединяет все записи внутри блока в одну транзакцию с одним коммитом."""
+        with self._write_lock:
+            # Вложенный пакет входит в уже открытый
+            if self._in_batch:
+                yield
+                return
+            self.conn.execute("BEGIN")
+            self._in_batch = True
+            try:
+                yield
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                self._pending_events.clear()
+                raise
+            finally:
+                self._in_batch = False
+            events, self._pending_events = self._pending_events, []
+        # Слушатели узнают об изменениях только после коммита пакета
+        for kind, args in events:
+            self._notify(kind, *args)
+
+    def run_batch(self, calls: list[Callable[[], Any]]) -> list[Any]:
+        """
+        Выполняет вызовы одной транзакцией.
+        Исключение отдельного вызова возвращается на его месте в списке результатов.
+        """
+        results: list[Any] = []
+        with self.batch():
+            for call in calls:
+                try:
+                    results.append(call())
+                except Exception as e:
+                    results.append(e)
+        return results
+
+    def add_task_listener(self, callback: Callable[[Optional[int]], None]) -> None:
+        """
+        Подписка на изменения задач.
+        callback(task_id) вызывается после фиксации create_task, update_task и
+        update_task_status в потоке, выполнившем запись; task_id = None —
+        изменилось сразу много задач (например, настройки команды).
+        """
+        self._listeners["task"].append(callback)
+
+    def add_outbox_listener(self, callback: Callable[[], None]) -> None:
+        """Подписка на новые сообщения в outbox: callback() после их фиксации."""
+        self._listeners["outbox"].append(callback)
+
+    def remove_listener(self, callback: Callable[..., None]) -> None:
+        """Отписка слушателя, добавленного add_task_listener или add_outbox_listener."""
+        for callbacks in self._listeners.values():
+            if callback in callbacks:
+                callbacks.remove(callback)
+
+    def _notify(self, kind: str, *args: Any) -> None:
+        """Оповещение слушателей; внутри batch() — откладывается до коммита."""
+        with self._write_lock:
+            if self._in_batch:
+                self._pending_events.append((kind, args))
+                return
+        for callback in self._listeners[kind]:
+            try:
+                callback(*args)
+            except Exception as e:
+                logger.error("Ошибка слушателя событий БД (%s): %s", kind, e)
+
+    def _notify_task_changed(self, task_id: Optional[int]) -> None:
+        """Оповещение слушателей изменений задач."""
+        self._notify("task", task_id)
+
+    # ─── Кэш участия ────────────────────────────────────────────────
+
+    def _identity_changed(
+        self, user_ids: tuple[int, ...] = (), team_ids: tuple[int, ...] = ()
+    ) -> None:
+        """Сброс кэша участия пользователей и команд (внутри batch() — после коммита)."""
+        self._notify("identity", user_ids, team_ids)
+
+    def _forget_identities(self, user_ids: tuple[int, ...], team_ids: tuple[int, ...]) -> None:
+        """Удаляет записи из кэша участия."""
+        with self._identity_lock:
+            # Чтения, начатые до сброса, не должны вернуть в кэш старые данные
+            self._identity_generation += 1
+            for user_id in user_ids:
+                self._identities.pop(user_id, None)
+            for team_id in team_ids:
+                self._teams.pop(team_id, None)
+
+    def _forget_names(self, user_id: int) -> None:
+        """Удаляет имя пользователя из кэша имён."""
+        with self._identity_lock:
+            self._identity_generation += 1
+            self._names.pop(user_id, None)
+
+    def _cache_get(self, cache: dict[int, tuple[float, Any]], key: int) -> tuple[bool, Any, int]:
+        """Поиск в кэше участия: (найдено, значение, поколение для _cache_put)."""
+        with self._identity_lock:
+            entry = cache.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                return True, entry[1], self._identity_generation
+            return False, None, self._identity_generation
+
+    def _cache_put(
+        self, cache: dict[int, tuple[float, Any]], key: int, value: Any, generation: int
+    ) -> None:
+        """Сохраняет значение, если кэш не сбрасывали с начала его чтения."""
+        if self.identity_ttl <= 0:
+            return
+        with self._identity_lock:
+            if generation != self._identity_generation:
+                return
+            now = time.monotonic()
+            if len(cache) >= self.IDENTITY_CACHE_SIZE:
+                for stale in [k for k, (expires, _) in cache.items() if expires <= now]:
+                    del cache[stale]
+                if len(cache) >= self.IDENTITY_CACHE_SIZE:
+                    cache.clear()
+            cache[key] = (now + self.identity_ttl, value)
+
+    def _get_identity(self, user_id: int) -> tuple[Optional[int], Optional[str]]:
+        """Активная команда пользователя и его роль в ней."""
+        found, identity, generation = self._cache_get(self._identities, user_id)
+        if found:
+            return identity
+        # Поиск по первичному ключу users и уникальному (team_id, user_id)
+        with self._read() as conn:
+            row = conn.execute(
+                """SELECT tm.team_id, tm.role FROM users u
+                   JOIN team_members tm
+                       ON tm.team_id = u.active_team_id AND tm.user_id = u.user_id
+                   WHERE u.user_id = ?""",
+                (user_id,),
+            ).fetchone()
+        identity = (row["team_id"], row["role"]) if row else (None, None)
+        self._cache_put(self._identities, user_id, identity, generation)
+        return identity
+
+    def _insert_outbox(
+        self,
+        conn: sqlite3.Connection,
+        messages: list[tuple[str, int, str, Optional[str]]],
+        task_id: Optional[int] = None,
+    ) -> int:
+        """
+        Запись сообщений (ключ идемпотентности, chat_id, текст, строка сводки)
+        в outbox в текущей транзакции. Сообщения с уже известным ключом
+        пропускаются. Сообщения со строкой сводки откладываются на окно
+        объединения: каждое новое сдвигает отправку всех ещё не забранных
+        сообщений получателя, но не дальше coalesce_max_delay от первого.
+        """
+        if not messages:
+            return 0
+        now = datetime.now()
+        created = now.strftime(DEADLINE_FORMAT)
+        cursor = conn.executemany(
+            """INSERT INTO outbox
+               (idempotency_key, chat_id, text, task_id, digest, next_attempt_at, created_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT (idempotency_key) DO NOTHING""",
+            [(key, chat_id, text, task_id, digest, created, created)
+             for key, chat_id, text, digest in messages],
+        )
+        added = cursor.rowcount
+        chats = {chat_id for _, chat_id, _, digest in messages if digest is not None}
+        if added and chats and self.coalesce_window:
+            due = (now + self.coalesce_window).strftime(DEADLINE_FORMAT)
+            max_delay = f"+{int(self.coalesce_max_delay.total_seconds())} seconds"
+            conn.executemany(
+                """UPDATE outbox SET next_attempt_at = MIN(?, (
+                       SELECT strftime('%Y-%m-%dT%H:%M:%S', MIN(created_at), ?)
+                       FROM outbox
+                       WHERE chat_id = ? AND status = 'pending'
+                       AND digest IS NOT NULL AND attempts = 0
+                   ))
+                   WHERE chat_id = ? AND status = 'pending'
+                   AND digest IS NOT NULL AND attempts = 0""",
+                [(due, max_delay, chat_id, chat_id) for chat_id in chats],
+            )
+        return added
+
+    def _insert_notifications(
+        self,
+        conn: sqlite3.Connection,
+        event: str,
+        entity_id: int,
+        notify: Optional[NotifyBuilder],
+        task_id: Optional[int] = None,
+    ) -> bool:
+        """Запись уведомлений события в outbox; ключ — событие и получатель."""
+        if notify is None:
+            return False
+        messages = [
+            (f"{event}:{chat_id}", chat_id, text, digest)
+            for chat_id, text, digest in notify(entity_id)
+        ]
+        return self._insert_outbox(conn, messages, task_id) > 0
 
     def _create_tables(self) -> None:
         """Создание таблиц, если они не существуют."""
-        cursor = self.conn.cursor()
-        cursor.executescript("""
-            -- Таблица пользователей
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                first_name TEXT,
-                last_name TEXT,
-                timezone TEXT DEFAULT 'Europe/Moscow',
-                language_code TEXT DEFAULT 'ru',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-
-            -- Таблица команд
-            CREATE TABLE IF NOT EXISTS teams (
-                team_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                owner_id INTEGER NOT NULL,
-                invite_code TEXT UNIQUE NOT NULL,
-                subscription_type TEXT DEFAULT 'free',
-                subscription_expires TIMESTAMP,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (owner_id) REFERENCES users(user_id)
-            );
-
-            -- Таблица участников команд
-            CREATE TABLE IF NOT EXISTS team_members (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                team_id INTEGER NOT NULL,
-                user_id INTEGER NOT NULL,
-                role TEXT DEFAULT 'member',
-                joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (team_id) REFERENCES teams(team_id) ON DELETE CASCADE,
-                FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
-                UNIQUE(team_id, user_id)
-            );
-
-            -- Таблица задач
-            CREATE TABLE IF NOT EXISTS tasks (
-                task_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                team_id INTEGER NOT NULL,
-                title TEXT NOT NULL,
-                description TEXT,
-                assignee_id INTEGER,
-                author_id INTEGER NOT NULL,
-                deadline TIMESTAMP,
-                priority TEXT DEFAULT 'medium',
-                status TEXT DEFAULT 'todo',
-                tags TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                completed_at TIMESTAMP,
-                FOREIGN KEY (team_id) REFERENCES teams(team_id) ON DELETE CASCADE,
-                FOREIGN KEY (assignee_id) REFERENCES users(user_id),
-                FOREIGN KEY (author_id) REFERENCES users(user_id)
-            );
-
-            -- Таблица комментариев к задачам
-            CREATE TABLE IF NOT EXISTS comments (
-                comment_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                task_id INTEGER NOT NULL,
-                user_id INTEGER NOT NULL,
-                text TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (task_id) REFERENCES tasks(task_id) ON DELETE CASCADE,
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
-            );
-
-            -- Таблица отправленных напоминаний
-            CREATE TABLE IF NOT EXISTS reminders (
-                reminder_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                task_id INTEGER NOT NULL,
-                reminder_type TEXT NOT NULL,
-                sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (task_id) REFERENCES tasks(task_id) ON DELETE CASCADE
-            );
-
-            -- Индексы для оптимизации
-            CREATE INDEX IF NOT EXISTS idx_tasks_team ON tasks(team_id);
-            CREATE INDEX IF NOT EXISTS idx_tasks_assignee ON tasks(assignee_id);
-            CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status);
-            CREATE INDEX IF NOT EXISTS idx_tasks_deadline ON tasks(deadline);
-            CREATE INDEX IF NOT EXISTS idx_team_members_user ON team_members(user_id);
-        """)
-        self.conn.commit()
+        with self._write() as conn:
+            conn.executescript("""
+                -- Таблица пользователей
+                CREATE TABLE IF NOT EXISTS users (
+                    user_id INTEGER PRIMARY KEY,
+                    username TEXT,
+                    first_name TEXT,
+                    last_name TEXT,
+                    timezone TEXT DEFAULT 'Europe/Moscow',
+                    language_code TEXT DEFAULT 'ru',
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+
+                -- Таблица команд
+                CREATE TABLE IF NOT EXISTS teams (
+                    team_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    owner_id INTEGER NOT NULL,
+                    invite_code TEXT UNIQUE NOT NULL,
+                    subscription_type TEXT DEFAULT 'free',
+                    subscription_expires TIMESTAMP,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (owner_id) REFERENCES users(user_id)
+                );
+
+                -- Таблица участников команд
+                CREATE TABLE IF NOT EXISTS team_members (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    team_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    role TEXT DEFAULT 'member',
+                    joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (team_id) REFERENCES teams(team_id) ON DELETE CASCADE,
+                    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
+                    UNIQUE(team_id, user_id)
+                );
+
+                -- Таблица задач
+                CREATE TABLE IF NOT EXISTS tasks (
+                    task_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    team_id INTEGER NOT NULL,
+                    title TEXT NOT NULL,
+                    description TEXT,
+                    assignee_id INTEGER,
+                    author_id INTEGER NOT NULL,
+                    deadline TIMESTAMP,
+                    priority TEXT DEFAULT 'medium',
+                    status TEXT DEFAULT 'todo',
+                    tags TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    completed_at TIMESTAMP,
+                    FOREIGN KEY (team_id) REFERENCES teams(team_id) ON DELETE CASCADE,
+                    FOREIGN KEY (assignee_id) REFERENCES users(user_id),
+                    FOREIGN KEY (author_id) REFERENCES users(user_id)
+                );
+
+                -- Таблица комментариев к задачам
+                CREATE TABLE IF NOT EXISTS comments (
+                    comment_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    task_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    text TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (task_id) REFERENCES tasks(task_id) ON DELETE CASCADE,
+                    FOREIGN KEY (user_id) REFERENCES users(user_id)
+                );
+
+                -- Таблица отправленных напоминаний
+                CREATE TABLE IF NOT EXISTS reminders (
+                    reminder_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    task_id INTEGER NOT NULL,
+                    reminder_type TEXT NOT NULL,
+                    sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (task_id) REFERENCES tasks(task_id) ON DELETE CASCADE
+                );
+
+                -- Индексы для оптимизации (индексы задач — в SCHEMA_MIGRATIONS)
+                CREATE INDEX IF NOT EXISTS idx_team_members_user ON team_members(user_id);
+
+                -- Счётчики задач по (команда, исполнитель, статус);
+                -- assignee_id = 0 — задачи без исполнителя
+                CREATE TABLE IF NOT EXISTS task_counters (
+                    team_id INTEGER NOT NULL,
+                    assignee_id INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    cnt INTEGER NOT NULL DEFAULT 0,
+                    on_time INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (team_id, assignee_id, status)
+                ) WITHOUT ROWID;
+
+                -- Выполненные задачи по дням завершения
+                CREATE TABLE IF NOT EXISTS task_done_daily (
+                    team_id INTEGER NOT NULL,
+                    assignee_id INTEGER NOT NULL,
+                    day TEXT NOT NULL,
+                    cnt INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (team_id, assignee_id, day)
+                ) WITHOUT ROWID;
+            """)
+            # Триггеры поддерживают счётчики в той же транзакции, что и запись задачи
+            conn.executescript(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_tasks_counters_insert
+                AFTER INSERT ON tasks
+                BEGIN {_counter_delta_sql("NEW", 1)}
+                END;
+
+                CREATE TRIGGER IF NOT EXISTS trg_tasks_counters_delete
+                AFTER DELETE ON tasks
+                BEGIN {_counter_delta_sql("OLD", -1)}
+                END;
+
+                CREATE TRIGGER IF NOT EXISTS trg_tasks_counters_update
+                AFTER UPDATE OF team_id, assignee_id, status, deadline, completed_at ON tasks
+                BEGIN {_counter_delta_sql("OLD", -1)} {_counter_delta_sql("NEW", 1)}
+                END;
+            """)
+            # Счётчики появились в уже заполненной базе — считаем их с нуля
+            counters_empty = conn.execute(
+                "SELECT 1 FROM task_counters LIMIT 1"
+            ).fetchone() is None
+            has_tasks = conn.execute("SELECT 1 FROM tasks LIMIT 1").fetchone() is not None
+        if counters_empty and has_tasks:
+            self.rebuild_counters()
+
+    def _migrate(self) -> None:
+        """
+        Применение недостающих миграций схемы по PRAGMA user_version.
+        Каждая миграция выполняется под BEGIN IMMEDIATE с повторной проверкой
+        версии: процессы-воркеры, стартующие одновременно, не применят её дважды.
+        """
+        with self._write() as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for target in range(version + 1, len(SCHEMA_MIGRATIONS) + 1):
+            with self._write() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                if conn.execute("PRAGMA user_version").fetchone()[0] >= target:
+                    continue
+                migration = SCHEMA_MIGRATIONS[target - 1]
+                if callable(migration):
+                    migration(conn)
+                else:
+                    for statement in _split_sql(migration):
+                        conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {target}")
+            logger.info("Схема БД обновлена до версии %s", target)
 
     # ─── Пользователи ──────────────────────────────────────────────
 
@@ -123,49 +922,121 @@ class Database:
     ) -> None:
         """Регистрация нового пользователя или обновление существующего."""
         try:
-            self.conn.execute(
-                """INSERT INTO users (user_id, username, first_name, last_name, language_code)
-                   VALUES (?, ?, ?, ?, ?)
-                   ON CONFLICT(user_id) DO UPDATE SET
-                       username = excluded.username,
-                       first_name = excluded.first_name,
-                       last_name = excluded.last_name""",
-                (user_id, username, first_name, last_name, language_code),
-            )
-            self.conn.commit()
+            with self._write() as conn:
+                conn.execute(
+                    """INSERT INTO users (user_id, username, first_name, last_name, language_code)
+                       VALUES (?, ?, ?, ?, ?)
+                       ON CONFLICT(user_id) DO UPDATE SET
+                           username = excluded.username,
+                           first_name = excluded.first_name,
+                           last_name = excluded.last_name""",
+                    (user_id, username, first_name, last_name, language_code),
+                )
+            self._notify("user", user_id)
             logger.info("Пользователь %s зарегистрирован / обновлён", user_id)
         except sqlite3.Error as e:
             logger.error("Ошибка регистрации пользователя: %s", e)
 
     def get_user(self, user_id: int) -> Optional[sqlite3.Row]:
         """Получение пользователя по ID."""
-        return self.conn.execute(
-            "SELECT * FROM users WHERE user_id = ?", (user_id,)
-        ).fetchone()
+        with self._read() as conn:
+            return conn.execute(
+                "SELECT * FROM users WHERE user_id = ?", (user_id,)
+            ).fetchone()
+
+    def get_display_names(self, user_ids: Iterable[int]) -> dict[int, sqlite3.Row]:
+        """
+        Имена пользователей (user_id, first_name, username) по ID.
+        Берутся из LRU-кэша, недостающие читаются одним запросом.
+        """
+        names: dict[int, sqlite3.Row] = {}
+        missing = []
+        with self._identity_lock:
+            generation = self._identity_generation
+            now = time.monotonic()
+            for user_id in set(user_ids):
+                entry = self._names.get(user_id)
+                if entry is not None and entry[0] > now:
+                    self._names.move_to_end(user_id)
+                    names[user_id] = entry[1]
+                else:
+                    missing.append(user_id)
+        if not missing:
+            return names
+
+        placeholders = ",".join("?" * len(missing))
+        with self._read() as conn:
+            rows = conn.execute(
+                f"""SELECT user_id, first_name, username FROM users
+                    WHERE user_id IN ({placeholders})""",
+                missing,
+            ).fetchall()
+        found = {row["user_id"]: row for row in rows}
+        names.update(found)
+
+        if self.identity_ttl > 0:
+            with self._identity_lock:
+                if generation == self._identity_generation:
+                    expires = time.monotonic() + self.identity_ttl
+                    for user_id, row in found.items():
+                        self._names[user_id] = (expires, row)
+                        self._names.move_to_end(user_id)
+                    while len(self._names) > self.NAME_CACHE_SIZE:
+                        self._names.popitem(last=False)
+        return names
+
+    def get_user_timezone(self, user_id: int) -> Optional[str]:
+        """Получение часового пояса пользователя."""
+        with self._read() as conn:
+            row = conn.execute(
+                "SELECT timezone FROM users WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return row["timezone"] if row else None
 
     def set_user_timezone(self, user_id: int, timezone: str) -> None:
-        """Установка часового пояса пользователя."""
-        self.conn.execute(
-            "UPDATE users SET timezone = ? WHERE user_id = ?", (timezone, user_id)
-        )
-        self.conn.commit()
+        """
+        Установка часового пояса пользователя. Дедлайны его задач хранятся в
+        местном времени, поэтому их напоминания пересчитываются.
+        """
+        with self._write() as conn:
+            conn.execute(
+                "UPDATE users SET timezone = ? WHERE user_id = ?", (timezone, user_id)
+            )
+            # Время напоминаний активных задач исполнителя изменилось —
+            # отмечаем их и для таймера в другом процессе
+            task_ids = [
+                row["task_id"] for row in conn.execute(
+                    """UPDATE tasks SET updated_at = ?
+                       WHERE assignee_id = ? AND status IN ('todo', 'in_progress')
+                       RETURNING task_id""",
+                    (datetime.now().isoformat(), user_id),
+                )
+            ]
+        for task_id in task_ids:
+            self._notify_task_changed(task_id)
 
     # ─── Команды ────────────────────────────────────────────────────
 
     def create_team(self, name: str, owner_id: int, invite_code: str) -> int:
         """Создание новой команды. Возвращает team_id."""
         try:
-            cursor = self.conn.execute(
-                "INSERT INTO teams (name, owner_id, invite_code) VALUES (?, ?, ?)",
-                (name, owner_id, invite_code),
-            )
-            team_id = cursor.lastrowid
-            # Добавляем владельца как участника с ролью owner
-            self.conn.execute(
-                "INSERT INTO team_members (team_id, user_id, role) VALUES (?, ?, 'owner')",
-                (team_id, owner_id),
-            )
-            self.conn.commit()
+            with self._write() as conn:
+                cursor = conn.execute(
+                    "INSERT INTO teams (name, owner_id, invite_code) VALUES (?, ?, ?)",
+                    (name, owner_id, invite_code),
+                )
+                team_id = cursor.lastrowid
+                # Добавляем владельца как участника с ролью owner
+                conn.execute(
+                    "INSERT INTO team_members (team_id, user_id, role) VALUES (?, ?, 'owner')",
+                    (team_id, owner_id),
+                )
+                # Новая команда становится активной для владельца
+                conn.execute(
+                    "UPDATE users SET active_team_id = ? WHERE user_id = ?",
+                    (team_id, owner_id),
+                )
+            self._identity_changed(user_ids=(owner_id,))
             logger.info("Команда '%s' создана (ID=%s) владельцем %s", name, team_id, owner_id)
             return team_id
         except sqlite3.Error as e:
@@ -174,43 +1045,91 @@ class Database:
 
     def get_team(self, team_id: int) -> Optional[sqlite3.Row]:
         """Получение команды по ID."""
-        return self.conn.execute(
-            "SELECT * FROM teams WHERE team_id = ?", (team_id,)
-        ).fetchone()
+        found, team, generation = self._cache_get(self._teams, team_id)
+        if found:
+            return team
+        with self._read() as conn:
+            team = conn.execute(
+                "SELECT * FROM teams WHERE team_id = ?", (team_id,)
+            ).fetchone()
+        self._cache_put(self._teams, team_id, team, generation)
+        return team
 
     def get_team_by_invite(self, invite_code: str) -> Optional[sqlite3.Row]:
         """Получение команды по инвайт-коду."""
-        return self.conn.execute(
-            "SELECT * FROM teams WHERE invite_code = ?", (invite_code,)
-        ).fetchone()
+        with self._read() as conn:
+            return conn.execute(
+                "SELECT * FROM teams WHERE invite_code = ?", (invite_code,)
+            ).fetchone()
 
     def get_user_teams(self, user_id: int) -> list[sqlite3.Row]:
-        """Получение всех команд пользователя."""
-        return self.conn.execute(
-            """SELECT t.* FROM teams t
-               JOIN team_members tm ON t.team_id = tm.team_id
-               WHERE tm.user_id = ?""",
-            (user_id,),
-        ).fetchall()
+        """Получение всех команд пользователя в порядке вступления."""
+        with self._read() as conn:
+            return conn.execute(
+                """SELECT t.* FROM teams t
+                   JOIN team_members tm ON t.team_id = tm.team_id
+                   WHERE tm.user_id = ?
+                   ORDER BY tm.id""",
+                (user_id,),
+            ).fetchall()
 
     def get_user_active_team(self, user_id: int) -> Optional[sqlite3.Row]:
-        """Получение первой (активной) команды пользователя."""
-        teams = self.get_user_teams(user_id)
-        return teams[0] if teams else None
+        """Получение активной команды пользователя."""
+        team_id, _ = self._get_identity(user_id)
+        return self.get_team(team_id) if team_id is not None else None
+
+    def set_active_team(self, user_id: int, team_id: int) -> bool:
+        """Выбор активной команды; пользователь должен состоять в ней."""
+        try:
+            with self._write() as conn:
+                cursor = conn.execute(
+                    """UPDATE users SET active_team_id = ?
+                       WHERE user_id = ? AND EXISTS (
+                           SELECT 1 FROM team_members WHERE team_id = ? AND user_id = ?
+                       )""",
+                    (team_id, user_id, team_id, user_id),
+                )
+            if not cursor.rowcount:
+                return False
+            self._identity_changed(user_ids=(user_id,))
+            return True
+        except sqlite3.Error as e:
+            logger.error("Ошибка выбора активной команды: %s", e)
+            return False
 
     # ─── Участники команд ──────────────────────────────────────────
 
     def add_team_member(
-        self, team_id: int, user_id: int, role: str = "member"
+        self,
+        team_id: int,
+        user_id: int,
+        role: str = "member",
+        notify: Optional[NotifyBuilder] = None,
     ) -> bool:
-        """Добавление участника в команду."""
+        """
+        Добавление участника в команду.
+        notify(team_id) — уведомления, записываемые в outbox вместе с участником.
+        """
         try:
-            self.conn.execute(
-                "INSERT INTO team_members (team_id, user_id, role) VALUES (?, ?, ?)",
-                (team_id, user_id, role),
-            )
-            self.conn.commit()
+            with self._write() as conn:
+                cursor = conn.execute(
+                    """INSERT INTO team_members (team_id, user_id, role) VALUES (?, ?, ?)
+                       RETURNING joined_at""",
+                    (team_id, user_id, role),
+                )
+                joined_at = cursor.fetchone()["joined_at"]
+                # Команда, в которую пользователь только что вступил, становится активной
+                conn.execute(
+                    "UPDATE users SET active_team_id = ? WHERE user_id = ?",
+                    (team_id, user_id),
+                )
+                queued = self._insert_notifications(
+                    conn, f"member:{team_id}:{user_id}:{joined_at}", team_id, notify
+                )
+            self._identity_changed(user_ids=(user_id,))
             logger.info("Пользователь %s добавлен в команду %s", user_id, team_id)
+            if queued:
+                self._notify("outbox")
             return True
         except sqlite3.IntegrityError:
             logger.warning("Пользователь %s уже в команде %s", user_id, team_id)
@@ -222,11 +1141,21 @@ class Database:
     def remove_team_member(self, team_id: int, user_id: int) -> bool:
         """Удаление участника из команды."""
         try:
-            self.conn.execute(
-                "DELETE FROM team_members WHERE team_id = ? AND user_id = ?",
-                (team_id, user_id),
-            )
-            self.conn.commit()
+            with self._write() as conn:
+                conn.execute(
+                    "DELETE FROM team_members WHERE team_id = ? AND user_id = ?",
+                    (team_id, user_id),
+                )
+                # Вместо покинутой активной команды — первая из оставшихся
+                conn.execute(
+                    """UPDATE users SET active_team_id = (
+                           SELECT tm.team_id FROM team_members tm
+                           WHERE tm.user_id = users.user_id ORDER BY tm.id LIMIT 1
+                       )
+                       WHERE user_id = ? AND active_team_id = ?""",
+                    (user_id, team_id),
+                )
+            self._identity_changed(user_ids=(user_id,))
             return True
         except sqlite3.Error as e:
             logger.error("Ошибка удаления участника: %s", e)
@@ -234,27 +1163,34 @@ class Database:
 
     def get_team_members(self, team_id: int) -> list[sqlite3.Row]:
         """Получение всех участников команды."""
-        return self.conn.execute(
-            """SELECT u.*, tm.role FROM users u
-               JOIN team_members tm ON u.user_id = tm.user_id
-               WHERE tm.team_id = ?
-               ORDER BY tm.role DESC, tm.joined_at""",
-            (team_id,),
-        ).fetchall()
+        with self._read() as conn:
+            return conn.execute(
+                """SELECT u.*, tm.role FROM users u
+                   JOIN team_members tm ON u.user_id = tm.user_id
+                   WHERE tm.team_id = ?
+                   ORDER BY tm.role DESC, tm.joined_at""",
+                (team_id,),
+            ).fetchall()
 
     def get_member_role(self, team_id: int, user_id: int) -> Optional[str]:
         """Получение роли пользователя в команде."""
-        row = self.conn.execute(
-            "SELECT role FROM team_members WHERE team_id = ? AND user_id = ?",
-            (team_id, user_id),
-        ).fetchone()
+        # Роль в активной команде (или отсутствие команд) известна из кэша
+        found, identity, _ = self._cache_get(self._identities, user_id)
+        if found and identity[0] in (team_id, None):
+            return identity[1]
+        with self._read() as conn:
+            row = conn.execute(
+                "SELECT role FROM team_members WHERE team_id = ? AND user_id = ?",
+                (team_id, user_id),
+            ).fetchone()
         return row["role"] if row else None
 
     def get_team_member_count(self, team_id: int) -> int:
         """Количество участников в команде."""
-        row = self.conn.execute(
-            "SELECT COUNT(*) as cnt FROM team_members WHERE team_id = ?", (team_id,)
-        ).fetchone()
+        with self._read() as conn:
+            row = conn.execute(
+                "SELECT COUNT(*) as cnt FROM team_members WHERE team_id = ?", (team_id,)
+            ).fetchone()
         return row["cnt"]
 
     # ─── Задачи ─────────────────────────────────────────────────────
@@ -268,92 +1204,259 @@ class Database:
         assignee_id: int | None = None,
         deadline: str | None = None,
         priority: str = "medium",
+        notify: Optional[NotifyBuilder] = None,
     ) -> int:
-        """Создание новой задачи. Возвращает task_id."""
+        """
+        Создание новой задачи. Возвращает task_id.
+        notify(task_id) — уведомления, записываемые в outbox вместе с задачей.
+        """
         try:
-            cursor = self.conn.execute(
-                """INSERT INTO tasks
-                   (team_id, title, description, assignee_id, author_id, deadline, priority)
-                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                (team_id, title, description, assignee_id, author_id, deadline, priority),
-            )
-            self.conn.commit()
-            task_id = cursor.lastrowid
+            deadline = normalize_deadline(deadline)
+            with self._write() as conn:
+                # updated_at в том же формате, что и при изменениях: по нему
+                # другие процессы находят новые и изменённые задачи
+                cursor = conn.execute(
+                    """INSERT INTO tasks
+                       (team_id, title, description, assignee_id, author_id, deadline,
+                        priority, updated_at)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                    (team_id, title, description, assignee_id, author_id, deadline,
+                     priority, datetime.now().isoformat()),
+                )
+                task_id = cursor.lastrowid
+                queued = self._insert_notifications(
+                    conn, f"task:{task_id}:created", task_id, notify, task_id
+                )
             logger.info("Задача #%s создана в команде %s", task_id, team_id)
+            self._notify_task_changed(task_id)
+            if queued:
+                self._notify("outbox")
             return task_id
-        except sqlite3.Error as e:
+        except (sqlite3.Error, ValueError) as e:
             logger.error("Ошибка создания задачи: %s", e)
             return 0
 
     def get_task(self, task_id: int) -> Optional[sqlite3.Row]:
         """Получение задачи по ID."""
-        return self.conn.execute(
-            "SELECT * FROM tasks WHERE task_id = ?", (task_id,)
-        ).fetchone()
+        with self._read() as conn:
+            return conn.execute(
+                "SELECT * FROM tasks WHERE task_id = ?", (task_id,)
+            ).fetchone()
 
     def get_user_tasks(
-        self, user_id: int, team_id: int, status_filter: str | None = None
-    ) -> list[sqlite3.Row]:
-        """Получение задач пользователя в команде."""
-        query = "SELECT * FROM tasks WHERE assignee_id = ? AND team_id = ?"
+        self,
+        user_id: int,
+        team_id: int,
+        status_filter: str | None = None,
+        limit: int | None = None,
+        after: int | None = None,
+        before: int | None = None,
+        list_view: bool = False,
+    ) -> Optional[list[Any]]:
+        """
+        Получение задач пользователя в команде.
+        С limit — одна страница списка (см. _get_tasks_page; None — задачи
+        after / before больше нет); list_view — строки TaskListItem вместо
+        полных строк задач.
+        """
+        where = "assignee_id = ? AND team_id = ?"
         params: list[Any] = [user_id, team_id]
-        # Фильтруем по статусу, если указан
-        if status_filter:
-            query += " AND status = ?"
-            params.append(status_filter)
-        query += " ORDER BY deadline ASC NULLS LAST"
-        return self.conn.execute(query, params).fetchall()
+        return self._get_tasks(where, params, status_filter, limit, after, before, list_view)
 
     def get_team_tasks(
-        self, team_id: int, status_filter: str | None = None
-    ) -> list[sqlite3.Row]:
-        """Получение всех задач команды."""
-        query = "SELECT * FROM tasks WHERE team_id = ?"
-        params: list[Any] = [team_id]
-        # Фильтруем по статусу, если указан
+        self,
+        team_id: int,
+        status_filter: str | None = None,
+        limit: int | None = None,
+        after: int | None = None,
+        before: int | None = None,
+        list_view: bool = False,
+    ) -> Optional[list[Any]]:
+        """
+        Получение всех задач команды.
+        С limit — одна страница списка (см. _get_tasks_page; None — задачи
+        after / before больше нет); list_view — строки TaskListItem вместо
+        полных строк задач.
+        """
+        return self._get_tasks(
+            "team_id = ?", [team_id], status_filter, limit, after, before, list_view
+        )
+
+    @staticmethod
+    def _select_tasks(
+        conn: sqlite3.Connection, sql: str, params: Iterable[Any], list_view: bool
+    ) -> list[Any]:
+        """
+        Выполняет запрос задач. sql начинается с «SELECT {columns}»: при
+        list_view выбираются только TASK_LIST_COLUMNS, и строки сразу
+        собираются в TaskListItem.
+        """
+        cursor = conn.cursor()
+        if list_view:
+            cursor.row_factory = _task_list_item
+        columns = TASK_LIST_COLUMNS if list_view else "*"
+        return cursor.execute(sql.format(columns=columns), list(params)).fetchall()
+
+    def _get_tasks(
+        self,
+        where: str,
+        params: list[Any],
+        status_filter: str | None,
+        limit: int | None,
+        after: int | None,
+        before: int | None,
+        list_view: bool,
+    ) -> Optional[list[Any]]:
+        """Задачи по условию where: все сразу или страница из limit задач."""
+        # Фильтруем по статусу, если указан; в постраничных списках
+        # отменённые задачи не показываются
         if status_filter:
-            query += " AND status = ?"
-            params.append(status_filter)
-        query += " ORDER BY deadline ASC NULLS LAST"
-        return self.conn.execute(query, params).fetchall()
-
-    def get_tasks_today(self, team_id: int) -> list[sqlite3.Row]:
-        """Получение задач на сегодня."""
-        today = datetime.now().strftime("%Y-%m-%d")
-        return self.conn.execute(
-            """SELECT * FROM tasks
-               WHERE team_id = ? AND DATE(deadline) = ?
-               AND status NOT IN ('done', 'cancelled')
-               ORDER BY deadline ASC""",
-            (team_id, today),
-        ).fetchall()
-
-    def get_tasks_week(self, team_id: int) -> list[sqlite3.Row]:
-        """Получение задач на текущую неделю."""
-        today = datetime.now()
-        week_end = today + timedelta(days=7)
-        return self.conn.execute(
-            """SELECT * FROM tasks
-               WHERE team_id = ?
-               AND deadline BETWEEN ? AND ?
-               AND status NOT IN ('done', 'cancelled')
-               ORDER BY deadline ASC""",
-            (team_id, today.strftime("%Y-%m-%d"), week_end.strftime("%Y-%m-%d")),
-        ).fetchall()
-
-    def update_task_status(self, task_id: int, status: str) -> bool:
-        """Обновление статуса задачи."""
+            where += " AND status = ?"
+            params = [*params, status_filter]
+        elif limit is not None:
+            where += " AND status IN ('todo', 'in_progress', 'done')"
+        if limit is not None:
+            return self._get_tasks_page(where, params, limit, after, before, list_view)
+        with self._read() as conn:
+            return self._select_tasks(
+                conn,
+                f"SELECT {{columns}} FROM tasks WHERE {where} ORDER BY deadline ASC NULLS LAST",
+                params,
+                list_view,
+            )
+
+    def _get_tasks_page(
+        self,
+        where: str,
+        params: list[Any],
+        limit: int,
+        after: int | None = None,
+        before: int | None = None,
+        list_view: bool = False,
+    ) -> Optional[list[Any]]:
+        """
+        Страница задач в порядке (deadline, task_id), задачи без дедлайна — в конце.
+        after / before — task_id задачи, сразу после (до) которой начинается
+        страница; без них — первая страница. Если задачи-закладки больше нет
+        (её удалили), возвращается None: позицию в списке не восстановить. Позиция ищется по ключу, а не
+        через OFFSET, поэтому читаются только строки страницы. Задачи с
+        дедлайном и без читаются отдельными запросами по индексу: NULLS LAST
+        в одном запросе требует сортировки всех задач.
+        """
+        base = f"SELECT {{columns}} FROM tasks WHERE {where}"
+        cursor_id = after if after is not None else before
+        with self._read() as conn:
+            deadline = None
+            if cursor_id is not None:
+                row = conn.execute(
+                    "SELECT deadline FROM tasks WHERE task_id = ?", (cursor_id,)
+                ).fetchone()
+                if row is None:
+                    return None
+                deadline = row["deadline"]
+
+            # Вперёд: задачи с дедлайном, затем без него
+            if before is None:
+                rows: list[Any] = []
+                if cursor_id is None or deadline is not None:
+                    sql, args = base + " AND deadline IS NOT NULL", list(params)
+                    if cursor_id is not None:
+                        sql += " AND (deadline, task_id) > (?, ?)"
+                        args += [deadline, cursor_id]
+                    rows = self._select_tasks(
+                        conn, sql + " ORDER BY deadline, task_id LIMIT ?",
+                        [*args, limit], list_view,
+                    )
+                if len(rows) < limit:
+                    sql, args = base + " AND deadline IS NULL", list(params)
+                    if cursor_id is not None and deadline is None:
+                        sql += " AND task_id > ?"
+                        args.append(cursor_id)
+                    rows += self._select_tasks(
+                        conn, sql + " ORDER BY task_id LIMIT ?",
+                        [*args, limit - len(rows)], list_view,
+                    )
+                return rows
+
+            # Назад: в обратном порядке от закладки, затем разворачиваем
+            rows = []
+            if deadline is None:
+                rows = self._select_tasks(
+                    conn,
+                    base + " AND deadline IS NULL AND task_id < ?"
+                    " ORDER BY task_id DESC LIMIT ?",
+                    [*params, cursor_id, limit],
+                    list_view,
+                )
+            if len(rows) < limit:
+                sql, args = base + " AND deadline IS NOT NULL", list(params)
+                if deadline is not None:
+                    sql += " AND (deadline, task_id) < (?, ?)"
+                    args += [deadline, cursor_id]
+                rows += self._select_tasks(
+                    conn, sql + " ORDER BY deadline DESC, task_id DESC LIMIT ?",
+                    [*args, limit - len(rows)], list_view,
+                )
+            return rows[::-1]
+
+    def get_tasks_today(
+        self, team_id: int, timezone: str | None = None, list_view: bool = False
+    ) -> list[Any]:
+        """Получение задач на сегодня (по часовому поясу пользователя)."""
+        start = local_day_start(timezone)
+        return self._get_active_tasks_between(
+            team_id, start, start + timedelta(days=1), list_view
+        )
+
+    def get_tasks_week(
+        self, team_id: int, timezone: str | None = None, list_view: bool = False
+    ) -> list[Any]:
+        """Получение задач на неделю: сегодня и следующие 7 дней целиком."""
+        start = local_day_start(timezone)
+        return self._get_active_tasks_between(
+            team_id, start, start + timedelta(days=8), list_view
+        )
+
+    def _get_active_tasks_between(
+        self, team_id: int, start: datetime, end: datetime, list_view: bool = False
+    ) -> list[Any]:
+        """Активные задачи команды с дедлайном в полуинтервале [start, end)."""
+        with self._read() as conn:
+            return self._select_tasks(
+                conn,
+                """SELECT {columns} FROM tasks
+                   WHERE team_id = ?
+                   AND deadline >= ? AND deadline < ?
+                   AND status NOT IN ('done', 'cancelled')
+                   ORDER BY deadline ASC""",
+                (team_id, start.strftime(DEADLINE_FORMAT), end.strftime(DEADLINE_FORMAT)),
+                list_view,
+            )
+
+    def update_task_status(
+        self, task_id: int, status: str, notify: Optional[NotifyBuilder] = None
+    ) -> bool:
+        """
+        Обновление статуса задачи.
+        notify(task_id) — уведомления, записываемые в outbox вместе со статусом.
+        """
         try:
             now = datetime.now().isoformat()
             completed_at = now if status == "done" else None
-            self.conn.execute(
-                """UPDATE tasks SET status = ?, updated_at = ?,
-                   completed_at = COALESCE(?, completed_at)
-                   WHERE task_id = ?""",
-                (status, now, completed_at, task_id),
-            )
-            self.conn.commit()
+            with self._write() as conn:
+                conn.execute(
+                    """UPDATE tasks SET status = ?, updated_at = ?,
+                       completed_at = COALESCE(?, completed_at)
+                       WHERE task_id = ?""",
+                    (status, now, completed_at, task_id),
+                )
+                queued = self._insert_notifications(
+                    conn, f"task:{task_id}:status:{status}:{now}", task_id, notify, task_id
+                )
             logger.info("Статус задачи #%s изменён на '%s'", task_id, status)
+            self._notify_task_changed(task_id)
+            if queued:
+                self._notify("outbox")
             return True
         except sqlite3.Error as e:
             logger.error("Ошибка обновления статуса: %s", e)
@@ -367,23 +1470,26 @@ class Database:
             # Проверяем что есть что обновлять
             if not fields:
                 return False
+            if "deadline" in fields:
+                fields["deadline"] = normalize_deadline(fields["deadline"])
             fields["updated_at"] = datetime.now().isoformat()
             set_clause = ", ".join(f"{k} = ?" for k in fields)
             values = list(fields.values()) + [task_id]
-            self.conn.execute(
-                f"UPDATE tasks SET {set_clause} WHERE task_id = ?", values
-            )
-            self.conn.commit()
+            with self._write() as conn:
+                conn.execute(
+                    f"UPDATE tasks SET {set_clause} WHERE task_id = ?", values
+                )
+            self._notify_task_changed(task_id)
             return True
-        except sqlite3.Error as e:
+        except (sqlite3.Error, ValueError) as e:
             logger.error("Ошибка обновления задачи: %s", e)
             return False
 
     def delete_task(self, task_id: int) -> bool:
         """Удаление задачи."""
         try:
-            self.conn.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
-            self.conn.commit()
+            with self._write() as conn:
+                conn.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
             logger.info("Задача #%s удалена", task_id)
             return True
         except sqlite3.Error as e:
@@ -392,205 +1498,483 @@ class Database:
 
     def get_active_tasks_count(self, team_id: int) -> int:
         """Количество активных задач в команде."""
-        row = self.conn.execute(
-            """SELECT COUNT(*) as cnt FROM tasks
-               WHERE team_id = ? AND status IN ('todo', 'in_progress')""",
-            (team_id,),
-        ).fetchone()
+        with self._read() as conn:
+            row = conn.execute(
+                """SELECT COUNT(*) as cnt FROM tasks
+                   WHERE team_id = ? AND status IN ('todo', 'in_progress')""",
+                (team_id,),
+            ).fetchone()
         return row["cnt"]
 
+    def search_tasks(self, team_id: int, query: str, limit: int = 10) -> list[TaskListItem]:
+        """
+        Полнотекстовый поиск задач команды по названию, описанию, тегам и
+        комментариям. Задача должна содержать все слова запроса; результаты
+        упорядочены по релевантности (bm25), лучшие — первыми.
+        """
+        terms = _search_terms(query)
+        if not terms:
+            return []
+        match = "team:t{} AND {{title description tags comments}}: ({})".format(
+            team_id, " AND ".join(f'"{term}"' for term in terms)
+        )
+        try:
+            with self._read() as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = _task_list_item
+                return cursor.execute(
+                    """SELECT t.task_id, t.title, t.priority, t.status, t.deadline
+                       FROM tasks_fts JOIN tasks t ON t.task_id = tasks_fts.rowid
+                       WHERE tasks_fts MATCH ?
+                       ORDER BY tasks_fts.rank
+                       LIMIT ?""",
+                    (match, limit),
+                ).fetchall()
+        except sqlite3.Error as e:
+            logger.error("Ошибка поиска задач: %s", e)
+            return []
+
+    def search_task_titles(
+        self, team_id: int, query: str, limit: int = 20
+    ) -> list[sqlite3.Row]:
+        """
+        Поиск по мере набора для inline-режима: задачи команды, в названии
+        которых для каждого слова запроса есть слово, начинающееся с него.
+        Новые задачи — первыми; пустой запрос — последние задачи команды.
+        """
+        match = f"team:t{team_id}" + "".join(
+            f' AND title: "{term}"*' for term in _search_terms(query)
+        )
+        try:
+            with self._read() as conn:
+                return conn.execute(
+                    """SELECT t.*,
+                              (SELECT u.timezone FROM users u WHERE u.user_id = t.assignee_id
+                              ) AS assignee_timezone
+                       FROM task_titles_fts
+                       JOIN tasks t ON t.task_id = task_titles_fts.rowid
+                       WHERE task_titles_fts MATCH ?
+                       ORDER BY task_titles_fts.rowid DESC
+                       LIMIT ?""",
+                    (match, limit),
+                ).fetchall()
+        except sqlite3.Error as e:
+            logger.error("Ошибка поиска задач по названию: %s", e)
+            return []
+
     # ─── Комментарии ────────────────────────────────────────────────
 
-    def add_comment(self, task_id: int, user_id: int, text: str) -> int:
-        """Добавление комментария к задаче."""
+    def add_comment(
+        self,
+        task_id: int,
+        user_id: int,
+        text: str,
+        notify: Optional[NotifyBuilder] = None,
+    ) -> int:
+        """
+        Добавление комментария к задаче.
+        notify(comment_id) — уведомления, записываемые в outbox вместе с комментарием.
+        """
         try:
-            cursor = self.conn.execute(
-                "INSERT INTO comments (task_id, user_id, text) VALUES (?, ?, ?)",
-                (task_id, user_id, text),
-            )
-            self.conn.commit()
-            return cursor.lastrowid
+            with self._write() as conn:
+                cursor = conn.execute(
+                    "INSERT INTO comments (task_id, user_id, text) VALUES (?, ?, ?)",
+                    (task_id, user_id, text),
+                )
+                comment_id = cursor.lastrowid
+                queued = self._insert_notifications(
+                    conn, f"comment:{comment_id}", comment_id, notify, task_id
+                )
+            if queued:
+                self._notify("outbox")
+            return comment_id
         except sqlite3.Error as e:
             logger.error("Ошибка добавления комментария: %s", e)
             return 0
 
     def get_task_comments(self, task_id: int) -> list[sqlite3.Row]:
         """Получение комментариев к задаче."""
-        return self.conn.execute(
-            """SELECT c.*, u.first_name, u.username FROM comments c
-               JOIN users u ON c.user_id = u.user_id
-               WHERE c.task_id = ?
-               ORDER BY c.created_at ASC""",
-            (task_id,),
-        ).fetchall()
+        with self._read() as conn:
+            return conn.execute(
+                """SELECT c.*, u.first_name, u.username FROM comments c
+                   JOIN users u ON c.user_id = u.user_id
+                   WHERE c.task_id = ?
+                   ORDER BY c.created_at ASC""",
+                (task_id,),
+            ).fetchall()
+
+    def get_task_view(
+        self, task_id: int, viewer_id: int, comments_limit: int = 5
+    ) -> Optional[dict[str, Any]]:
+        """
+        Всё для карточки задачи: задача, роль смотрящего в её команде и
+        последние comments_limit комментариев — одним запросом; имена автора,
+        исполнителя и комментаторов — из кэша имён (get_display_names).
+        Возвращает словарь task, viewer_role, assignee, author, comments
+        или None, если задачи нет.
+        """
+        with self._read() as conn:
+            row = conn.execute(
+                """SELECT t.*,
+                       (SELECT u.timezone FROM users u WHERE u.user_id = t.assignee_id
+                       ) AS assignee_timezone,
+                       (SELECT tm.role FROM team_members tm
+                        WHERE tm.team_id = t.team_id AND tm.user_id = :viewer_id
+                       ) AS viewer_role,
+                       (SELECT json_group_array(json_array(c.user_id, c.text))
+                        FROM (SELECT user_id, text FROM comments
+                              WHERE task_id = t.task_id
+                              ORDER BY created_at DESC, comment_id DESC
+                              LIMIT :comments_limit) c
+                       ) AS recent_comments
+                   FROM tasks t
+                   WHERE t.task_id = :task_id""",
+                {"task_id": task_id, "viewer_id": viewer_id, "comments_limit": comments_limit},
+            ).fetchone()
+        if row is None:
+            return None
+
+        # Комментарии выбраны от новых к старым — показываем по порядку
+        recent = json.loads(row["recent_comments"])[::-1]
+        user_ids = {row["author_id"], *(user_id for user_id, _ in recent)}
+        if row["assignee_id"]:
+            user_ids.add(row["assignee_id"])
+        names = self.get_display_names(user_ids)
+
+        comments = []
+        for user_id, text in recent:
+            name = names.get(user_id)
+            comments.append({
+                "user_id": user_id,
+                "text": text,
+                "first_name": name["first_name"] if name else None,
+                "username": name["username"] if name else None,
+            })
+        return {
+            "task": row,
+            "viewer_role": row["viewer_role"],
+            "assignee": names.get(row["assignee_id"]) if row["assignee_id"] else None,
+            "author": names.get(row["author_id"]),
+            "comments": comments,
+        }
 
     # ─── Напоминания ────────────────────────────────────────────────
 
-    def is_reminder_sent(self, task_id: int, reminder_type: str) -> bool:
-        """Проверка, было ли отправлено напоминание."""
-        row = self.conn.execute(
-            "SELECT 1 FROM reminders WHERE task_id = ? AND reminder_type = ?",
-            (task_id, reminder_type),
-        ).fetchone()
-        return row is not None
-
-    def mark_reminder_sent(self, task_id: int, reminder_type: str) -> None:
-        """Отметка об отправленном напоминании."""
+    def get_reminder_schedule(
+        self, since: str, task_ids: list[int] | None = None
+    ) -> list[sqlite3.Row]:
+        """
+        Активные задачи с исполнителем и дедлайном не раньше since для таймера
+        напоминаний: смещения напоминаний команды (reminder_offsets), часовой
+        пояс исполнителя (timezone), в котором хранится дедлайн, и уже
+        отправленные типы через запятую (sent_types).
+        task_ids — ограничить выборку указанными задачами.
+        """
+        query = """SELECT t.task_id, t.title, t.assignee_id, t.deadline,
+                          tm.reminder_offsets, u.timezone,
+                          (SELECT group_concat(r.reminder_type) FROM reminders r
+                           WHERE r.task_id = t.task_id) as sent_types
+                   FROM tasks t
+                   {join} teams tm ON t.team_id = tm.team_id
+                   LEFT JOIN users u ON u.user_id = t.assignee_id
+                   WHERE t.status IN ('todo', 'in_progress')
+                   AND t.deadline >= ?
+                   AND t.assignee_id IS NOT NULL"""
+        params: list[Any] = [since]
+        if task_ids is None:
+            query = query.format(join="JOIN")
+        else:
+            if not task_ids:
+                return []
+            # CROSS JOIN фиксирует порядок: сначала задачи по первичному ключу,
+            # иначе при немногих командах планировщик обходит их все
+            query = query.format(join="CROSS JOIN")
+            query += f" AND t.task_id IN ({', '.join('?' for _ in task_ids)})"
+            params.extend(task_ids)
+        with self._read() as conn:
+            return conn.execute(query, params).fetchall()
+
+    def claim_reminders(
+        self, reminders: list[tuple[int, str, int, str]]
+    ) -> set[tuple[int, str]]:
+        """
+        Отмечает напоминания (task_id, тип, chat_id, текст) отправленными и
+        ставит их сообщения в outbox одной транзакцией.
+        Уникальный индекс (task_id, reminder_type) пропускает уже занятые пары;
+        возвращаются только пары, занятые этим вызовом.
+        """
+        claimed: set[tuple[int, str]] = set()
+        if not reminders:
+            return claimed
         try:
-            self.conn.execute(
-                "INSERT INTO reminders (task_id, reminder_type) VALUES (?, ?)",
-                (task_id, reminder_type),
-            )
-            self.conn.commit()
+            with self._write() as conn:
+                # Ограничение SQLite на число параметров — пишем пачками
+                for i in range(0, len(reminders), 400):
+                    chunk = reminders[i:i + 400]
+                    values = ", ".join("(?, ?)" for _ in chunk)
+                    rows = conn.execute(
+                        f"""INSERT INTO reminders (task_id, reminder_type)
+                            VALUES {values}
+                            ON CONFLICT (task_id, reminder_type) DO NOTHING
+                            RETURNING task_id, reminder_type""",
+                        [v for task_id, rtype, _, _ in chunk for v in (task_id, rtype)],
+                    ).fetchall()
+                    claimed.update((r["task_id"], r["reminder_type"]) for r in rows)
+                self._insert_outbox(conn, [
+                    (f"reminder:{task_id}:{rtype}:{chat_id}", chat_id, text, None)
+                    for task_id, rtype, chat_id, text in reminders
+                    if (task_id, rtype) in claimed
+                ])
         except sqlite3.Error as e:
-            logger.error("Ошибка записи напоминания: %s", e)
+            logger.error("Ошибка записи напоминаний: %s", e)
+            return set()
+        if claimed:
+            self._notify("outbox")
+        return claimed
+
+    def get_overdue_tasks(self, list_view: bool = False) -> list[Any]:
+        """
+        Получение просроченных задач (list_view — строки TaskListItem):
+        дедлайн прошёл в часовом поясе исполнителя.
+        """
+        with self._read() as conn:
+            return self._select_tasks(
+                conn,
+                f"""SELECT {{columns}} FROM tasks
+                   WHERE status IN ('todo', 'in_progress')
+                   AND {OVERDUE_CONDITION}
+                   ORDER BY deadline ASC""",
+                (overdue_bound(),),
+                list_view,
+            )
 
-    def get_upcoming_tasks(
-        self, start: str, end: str
+    def get_daily_summary(
+        self,
+        day_start: datetime,
+        now: datetime,
+        timezones: list[str] | None = None,
+        overdue_limit: int = 5,
     ) -> list[sqlite3.Row]:
-        """Получение задач с дедлайнами в указанном временном окне."""
-        return self.conn.execute(
-            """SELECT t.*, tm.name as team_name FROM tasks t
-               JOIN teams tm ON t.team_id = tm.team_id
-               WHERE t.status IN ('todo', 'in_progress')
-               AND t.deadline BETWEEN ? AND ?""",
-            (start, end),
-        ).fetchall()
-
-    def get_overdue_tasks(self) -> list[sqlite3.Row]:
-        """Получение просроченных задач."""
-        now = datetime.now().isoformat()
-        return self.conn.execute(
-            """SELECT * FROM tasks
-               WHERE status IN ('todo', 'in_progress')
-               AND deadline < ?
-               ORDER BY deadline ASC""",
-            (now,),
-        ).fetchall()
+        """
+        Задачи для ежедневной сводки одним запросом.
+        Возвращает активные задачи участников команд: на сегодня
+        ([day_start, day_start + 1 день), is_today = 1) и не более overdue_limit
+        самых старых просроченных на исполнителя (is_overdue = 1) — с названием
+        команды, упорядоченные по исполнителю, команде и дедлайну.
+        timezones — только исполнители из этих часовых поясов (когорта сводки).
+        """
+        params: dict[str, Any] = {
+            "start": day_start.strftime(DEADLINE_FORMAT),
+            "end": (day_start + timedelta(days=1)).strftime(DEADLINE_FORMAT),
+            "now": now.strftime(DEADLINE_FORMAT),
+            "limit": overdue_limit,
+        }
+        source = """tasks t
+                       JOIN team_members tm ON tm.team_id = t.team_id
+                                           AND tm.user_id = t.assignee_id"""
+        cohort_filter = ""
+        # Когорта: обходим только её пользователей по индексу поясов,
+        # CROSS JOIN закрепляет порядок соединения
+        if timezones is not None:
+            if not timezones:
+                return []
+            names = []
+            for i, tz in enumerate(timezones):
+                params[f"tz{i}"] = tz
+                names.append(f":tz{i}")
+            source = "users u CROSS JOIN team_members tm CROSS JOIN tasks t"
+            cohort_filter = f"""AND u.timezone IN ({', '.join(names)})
+                       AND tm.user_id = u.user_id
+                       AND t.team_id = tm.team_id AND t.assignee_id = tm.user_id"""
+        with self._read() as conn:
+            return conn.execute(
+                f"""WITH due AS (
+                       SELECT t.assignee_id, t.team_id, t.task_id, t.title,
+                              t.priority, t.deadline,
+                              t.deadline >= :start as is_today,
+                              t.deadline < :now as is_overdue,
+                              ROW_NUMBER() OVER (
+                                  PARTITION BY t.assignee_id, t.deadline < :now
+                                  ORDER BY t.deadline
+                              ) as overdue_rank
+                       FROM {source}
+                       WHERE t.status IN ('todo', 'in_progress')
+                       AND t.deadline < :end
+                       AND (t.deadline >= :start OR t.deadline < :now)
+                       {cohort_filter}
+                   )
+                   SELECT due.*, te.name as team_name
+                   FROM due
+                   JOIN teams te ON due.team_id = te.team_id
+                   WHERE due.is_today OR due.overdue_rank <= :limit
+                   ORDER BY due.assignee_id, due.team_id, due.deadline""",
+                params,
+            ).fetchall()
+
+    def get_team_members_with_teams(self) -> list[sqlite3.Row]:
+        """Получение всех пар (участник, команда) с названием команды."""
+        with self._read() as conn:
+            return conn.execute(
+                """SELECT DISTINCT tm.user_id, tm.team_id, t.name as team_name
+                   FROM team_members tm
+                   JOIN teams t ON tm.team_id = t.team_id"""
+            ).fetchall()
 
     # ─── Статистика ─────────────────────────────────────────────────
 
     def get_team_stats(self, team_id: int) -> dict[str, Any]:
         """Получение статистики команды."""
-        week_ago = (datetime.now() - timedelta(days=7)).isoformat()
-        month_ago = (datetime.now() - timedelta(days=30)).isoformat()
-
-        # Общее количество задач
-        total = self.conn.execute(
-            "SELECT COUNT(*) as cnt FROM tasks WHERE team_id = ?", (team_id,)
-        ).fetchone()["cnt"]
-
-        # Активные задачи
-        active = self.get_active_tasks_count(team_id)
-
-        # Выполнено за неделю
-        done_week = self.conn.execute(
-            """SELECT COUNT(*) as cnt FROM tasks
-               WHERE team_id = ? AND status = 'done' AND completed_at >= ?""",
-            (team_id, week_ago),
-        ).fetchone()["cnt"]
-
-        # Выполнено за месяц
-        done_month = self.conn.execute(
-            """SELECT COUNT(*) as cnt FROM tasks
-               WHERE team_id = ? AND status = 'done' AND completed_at >= ?""",
-            (team_id, month_ago),
-        ).fetchone()["cnt"]
-
-        # Просроченные задачи
-        now = datetime.now().isoformat()
-        overdue = self.conn.execute(
-            """SELECT COUNT(*) as cnt FROM tasks
-               WHERE team_id = ? AND status IN ('todo', 'in_progress')
-               AND deadline < ?""",
-            (team_id, now),
-        ).fetchone()["cnt"]
-
-        # Топ-3 активных участников за неделю
-        top_members = self.conn.execute(
-            """SELECT u.first_name, u.username, COUNT(*) as cnt
-               FROM tasks t JOIN users u ON t.assignee_id = u.user_id
-               WHERE t.team_id = ? AND t.status = 'done' AND t.completed_at >= ?
-               GROUP BY t.assignee_id
-               ORDER BY cnt DESC LIMIT 3""",
-            (team_id, week_ago),
-        ).fetchall()
+        week_ago = (datetime.now() - timedelta(days=7)).strftime("%Y-%m-%d")
+        month_ago = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
+
+        with self._read() as conn:
+            # Всего и активные — из счётчиков по статусам
+            counts = conn.execute(
+                """SELECT
+                       COALESCE(SUM(cnt), 0) AS total,
+                       COALESCE(SUM(CASE WHEN status IN ('todo', 'in_progress')
+                                    THEN cnt ELSE 0 END), 0) AS active
+                   FROM task_counters WHERE team_id = ?""",
+                (team_id,),
+            ).fetchone()
+
+            # Выполнено за неделю и за месяц — из дневных корзин
+            done = conn.execute(
+                """SELECT
+                       COALESCE(SUM(CASE WHEN day >= ? THEN cnt ELSE 0 END), 0) AS done_week,
+                       COALESCE(SUM(cnt), 0) AS done_month
+                   FROM task_done_daily WHERE team_id = ? AND day >= ?""",
+                (week_ago, team_id, month_ago),
+            ).fetchone()
+
+            # Просроченные зависят от текущего времени исполнителя — считаем по индексу
+            overdue = conn.execute(
+                f"""SELECT COUNT(*) as cnt FROM tasks
+                   WHERE team_id = ? AND status IN ('todo', 'in_progress')
+                   AND {OVERDUE_CONDITION}""",
+                (team_id, overdue_bound()),
+            ).fetchone()["cnt"]
+
+            # Топ-3 активных участников за неделю
+            top_members = conn.execute(
+                """SELECT u.first_name, u.username, SUM(d.cnt) as cnt
+                   FROM task_done_daily d JOIN users u ON d.assignee_id = u.user_id
+                   WHERE d.team_id = ? AND d.day >= ?
+                   GROUP BY d.assignee_id
+                   HAVING SUM(d.cnt) > 0
+                   ORDER BY cnt DESC LIMIT 3""",
+                (team_id, week_ago),
+            ).fetchall()
 
         return {
-            "total": total,
-            "active": active,
-            "done_week": done_week,
-            "done_month": done_month,
+            "total": counts["total"],
+            "active": counts["active"],
+            "done_week": done["done_week"],
+            "done_month": done["done_month"],
             "overdue": overdue,
             "top_members": top_members,
         }
 
     def get_user_stats(self, user_id: int, team_id: int) -> dict[str, Any]:
         """Получение личной статистики пользователя."""
-        week_ago = (datetime.now() - timedelta(days=7)).isoformat()
-        now = datetime.now().isoformat()
-
-        # Выполнено задач
-        done = self.conn.execute(
-            """SELECT COUNT(*) as cnt FROM tasks
-               WHERE assignee_id = ? AND team_id = ? AND status = 'done'""",
-            (user_id, team_id),
-        ).fetchone()["cnt"]
-
-        # В работе
-        in_progress = self.conn.execute(
-            """SELECT COUNT(*) as cnt FROM tasks
-               WHERE assignee_id = ? AND team_id = ? AND status = 'in_progress'""",
-            (user_id, team_id),
-        ).fetchone()["cnt"]
-
-        # Ожидают выполнения
-        todo = self.conn.execute(
-            """SELECT COUNT(*) as cnt FROM tasks
-               WHERE assignee_id = ? AND team_id = ? AND status = 'todo'""",
-            (user_id, team_id),
-        ).fetchone()["cnt"]
-
-        # Выполнено за неделю
-        done_week = self.conn.execute(
-            """SELECT COUNT(*) as cnt FROM tasks
-               WHERE assignee_id = ? AND team_id = ? AND status = 'done'
-               AND completed_at >= ?""",
-            (user_id, team_id, week_ago),
-        ).fetchone()["cnt"]
-
-        # Просроченные
-        overdue = self.conn.execute(
-            """SELECT COUNT(*) as cnt FROM tasks
-               WHERE assignee_id = ? AND team_id = ?
-               AND status IN ('todo', 'in_progress') AND deadline < ?""",
-            (user_id, team_id, now),
-        ).fetchone()["cnt"]
+        return self.get_stats_for_users(team_id, [user_id])[user_id]
+
+    def get_stats_for_users(
+        self, team_id: int, user_ids: list[int]
+    ) -> dict[int, dict[str, Any]]:
+        """Личная статистика нескольких участников команды за один переход в БД."""
+        if not user_ids:
+            return {}
+        week_ago = (datetime.now() - timedelta(days=7)).strftime("%Y-%m-%d")
+        placeholders = ", ".join("?" for _ in user_ids)
+
+        stats: dict[int, dict[str, Any]] = {
+            uid: {"done": 0, "in_progress": 0, "todo": 0, "done_week": 0,
+                  "overdue": 0, "on_time": 0}
+            for uid in user_ids
+        }
+        with self._read() as conn:
+            # Счётчики по статусам
+            for row in conn.execute(
+                f"""SELECT assignee_id, status, cnt, on_time FROM task_counters
+                    WHERE team_id = ? AND assignee_id IN ({placeholders})""",
+                (team_id, *user_ids),
+            ):
+                if row["status"] in ("done", "in_progress", "todo"):
+                    stats[row["assignee_id"]][row["status"]] += row["cnt"]
+                if row["status"] == "done":
+                    stats[row["assignee_id"]]["on_time"] += row["on_time"]
+
+            # Выполнено за неделю
+            for row in conn.execute(
+                f"""SELECT assignee_id, SUM(cnt) AS cnt FROM task_done_daily
+                    WHERE team_id = ? AND assignee_id IN ({placeholders}) AND day >= ?
+                    GROUP BY assignee_id""",
+                (team_id, *user_ids, week_ago),
+            ):
+                stats[row["assignee_id"]]["done_week"] = row["cnt"]
+
+            # Просроченные
+            for row in conn.execute(
+                f"""SELECT assignee_id, COUNT(*) AS cnt FROM tasks
+                    WHERE assignee_id IN ({placeholders}) AND team_id = ?
+                    AND status IN ('todo', 'in_progress') AND {OVERDUE_CONDITION}
+                    GROUP BY assignee_id""",
+                (*user_ids, team_id, overdue_bound()),
+            ):
+                stats[row["assignee_id"]]["overdue"] = row["cnt"]
 
         # Процент выполнения в срок
-        total_done = self.conn.execute(
-            """SELECT COUNT(*) as cnt FROM tasks
-               WHERE assignee_id = ? AND team_id = ? AND status = 'done'""",
-            (user_id, team_id),
-        ).fetchone()["cnt"]
-
-        on_time = self.conn.execute(
-            """SELECT COUNT(*) as cnt FROM tasks
-               WHERE assignee_id = ? AND team_id = ? AND status = 'done'
-               AND (completed_at <= deadline OR deadline IS NULL)""",
-            (user_id, team_id),
-        ).fetchone()["cnt"]
+        for item in stats.values():
+            on_time = item.pop("on_time")
+            item["on_time_pct"] = round(on_time / item["done"] * 100) if item["done"] > 0 else 0
+        return stats
+
+    def rebuild_counters(self) -> int:
+        """
+        Пересчитывает счётчики задач с нуля по таблице tasks.
+        Возвращает число строк счётчиков, расходившихся с фактическими данными.
+        """
+        fresh_counters_sql = """
+            SELECT team_id, COALESCE(assignee_id, 0) AS assignee_id, status,
+                   COUNT(*) AS cnt,
+                   SUM(CASE WHEN status = 'done'
+                            AND (completed_at <= deadline OR deadline IS NULL)
+                            THEN 1 ELSE 0 END) AS on_time
+            FROM tasks GROUP BY 1, 2, 3"""
+        fresh_daily_sql = """
+            SELECT team_id, COALESCE(assignee_id, 0) AS assignee_id,
+                   DATE(completed_at) AS day, COUNT(*) AS cnt
+            FROM tasks WHERE status = 'done' AND completed_at IS NOT NULL
+            GROUP BY 1, 2, 3"""
+
+        with self._write() as conn:
+            # Сравниваем текущие ненулевые счётчики с пересчитанными
+            current = {tuple(r) for r in conn.execute(
+                "SELECT team_id, assignee_id, status, cnt, on_time "
+                "FROM task_counters WHERE cnt != 0"
+            )} | {tuple(r) for r in conn.execute(
+                "SELECT team_id, assignee_id, day, cnt FROM task_done_daily WHERE cnt != 0"
+            )}
+            fresh = {tuple(r) for r in conn.execute(fresh_counters_sql)} | {
+                tuple(r) for r in conn.execute(fresh_daily_sql)
+            }
+            mismatched = len(current ^ fresh)
+
+            conn.execute("DELETE FROM task_counters")
+            conn.execute("DELETE FROM task_done_daily")
+            conn.execute(
+                "INSERT INTO task_counters (team_id, assignee_id, status, cnt, on_time) "
+                + fresh_counters_sql
+            )
+            conn.execute(
+                "INSERT INTO task_done_daily (team_id, assignee_id, day, cnt) "
+                + fresh_daily_sql
+            )
 
-        on_time_pct = round(on_time / total_done * 100) if total_done > 0 else 0
-
-        return {
-            "done": done,
-            "in_progress": in_progress,
-            "todo": todo,
-            "done_week": done_week,
-            "overdue": overdue,
-            "on_time_pct": on_time_pct,
-        }
+        if mismatched:
+            logger.warning("Счётчики задач пересчитаны, расхождений: %s", mismatched)
+        return mismatched
 
     # ─── Подписки ───────────────────────────────────────────────────
 
@@ -599,18 +1983,390 @@ class Database:
     ) -> bool:
         """Обновление подписки команды."""
         try:
-            self.conn.execute(
-                """UPDATE teams SET subscription_type = ?, subscription_expires = ?
-                   WHERE team_id = ?""",
-                (sub_type, expires, team_id),
-            )
-            self.conn.commit()
+            with self._write() as conn:
+                conn.execute(
+                    """UPDATE teams SET subscription_type = ?, subscription_expires = ?
+                       WHERE team_id = ?""",
+                    (sub_type, expires, team_id),
+                )
+            self._identity_changed(team_ids=(team_id,))
             return True
         except sqlite3.Error as e:
             logger.error("Ошибка обновления подписки: %s", e)
             return False
 
+    # ─── Напоминания команды ────────────────────────────────────────
+
+    def set_team_reminder_offsets(self, team_id: int, offsets: list[int]) -> bool:
+        """Сохранение смещений напоминаний команды (минуты до дедлайна)."""
+        try:
+            with self._write() as conn:
+                conn.execute(
+                    "UPDATE teams SET reminder_offsets = ? WHERE team_id = ?",
+                    (",".join(str(m) for m in offsets), team_id),
+                )
+                # Расписание напоминаний активных задач команды изменилось —
+                # отмечаем их для таймера в другом процессе
+                conn.execute(
+                    """UPDATE tasks SET updated_at = ?
+                       WHERE team_id = ? AND status IN ('todo', 'in_progress')""",
+                    (datetime.now().isoformat(), team_id),
+                )
+            self._identity_changed(team_ids=(team_id,))
+            self._notify_task_changed(None)
+            return True
+        except sqlite3.Error as e:
+            logger.error("Ошибка сохранения настроек напоминаний: %s", e)
+            return False
+
+    # ─── Состояние диалогов ─────────────────────────────────────────
+
+    def get_user_data(self, user_id: int) -> Optional[str]:
+        """Данные пользователя (JSON) для восстановления user_data."""
+        with self._read() as conn:
+            row = conn.execute(
+                "SELECT data FROM user_data WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return row["data"] if row else None
+
+    def get_conversations(self, name: str) -> dict[str, str]:
+        """Состояния диалогов ConversationHandler: ключ (JSON) → состояние (JSON)."""
+        with self._read() as conn:
+            rows = conn.execute(
+                "SELECT conversation_key, state FROM conversations WHERE name = ?",
+                (name,),
+            ).fetchall()
+        return {row["conversation_key"]: row["state"] for row in rows}
+
+    def save_dialog_state(
+        self,
+        user_data: list[tuple[int, Optional[str]]],
+        conversations: list[tuple[str, str, Optional[str]]],
+    ) -> bool:
+        """
+        Сохранение накопленных изменений одной транзакцией.
+        user_data: (user_id, JSON или None — удаление);
+        conversations: (имя, ключ, состояние или None — диалог завершён).
+        """
+        try:
+            with self._write() as conn:
+                conn.executemany(
+                    """INSERT INTO user_data (user_id, data) VALUES (?, ?)
+                       ON CONFLICT (user_id) DO UPDATE SET data = excluded.data""",
+                    [row for row in user_data if row[1] is not None],
+                )
+                conn.executemany(
+                    "DELETE FROM user_data WHERE user_id = ?",
+                    [(user_id,) for user_id, data in user_data if data is None],
+                )
+                conn.executemany(
+                    """INSERT INTO conversations (name, conversation_key, state)
+                       VALUES (?, ?, ?)
+                       ON CONFLICT (name, conversation_key)
+                       DO UPDATE SET state = excluded.state""",
+                    [row for row in conversations if row[2] is not None],
+                )
+                conn.executemany(
+                    "DELETE FROM conversations WHERE name = ? AND conversation_key = ?",
+                    [(name, key) for name, key, state in conversations if state is None],
+                )
+            return True
+        except sqlite3.Error as e:
+            logger.error("Ошибка сохранения состояния диалогов: %s", e)
+            return False
+
+    # ─── Аренды и изменения из других процессов ────────────────────
+
+    def acquire_lease(self, name: str, holder: str, ttl: timedelta) -> bool:
+        """
+        Захват или продление аренды name на ttl.
+        Удаётся, если аренда свободна, истекла или уже принадлежит holder.
+        """
+        now = datetime.now()
+        try:
+            with self._write() as conn:
+                row = conn.execute(
+                    """INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?)
+                       ON CONFLICT (name) DO UPDATE SET
+                           holder = excluded.holder, expires_at = excluded.expires_at
+                       WHERE leases.holder = excluded.holder OR leases.expires_at < ?
+                       RETURNING holder""",
+                    (name, holder, (now + ttl).isoformat(), now.isoformat()),
+                ).fetchone()
+            return row is not None
+        except sqlite3.Error as e:
+            logger.error("Ошибка захвата аренды %s: %s", name, e)
+            return False
+
+    def release_lease(self, name: str, holder: str) -> None:
+        """Освобождение аренды, если она принадлежит holder."""
+        try:
+            with self._write() as conn:
+                conn.execute(
+                    "DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder)
+                )
+        except sqlite3.Error as e:
+            logger.error("Ошибка освобождения аренды %s: %s", name, e)
+
+    def poll_external_changes(self, lookback: timedelta = timedelta(seconds=30)) -> bool:
+        """
+        Проверка записей других процессов (PRAGMA data_version соединения-
+        писателя меняется только от чужих коммитов). При изменениях оповещает
+        слушателей: о задачах с updated_at за последние lookback и об outbox.
+        Возвращает True, если изменения были.
+        """
+        with self._write_lock:
+            version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+            changed = version != self._data_version
+            self._data_version = version
+            if not changed:
+                return False
+            since = (datetime.now() - lookback).isoformat()
+            rows = self.conn.execute(
+                "SELECT task_id FROM tasks WHERE updated_at > ?", (since,)
+            ).fetchall()
+        for row in rows:
+            self._notify_task_changed(row["task_id"])
+        self._notify("outbox")
+        return True
+
+    # ─── Очередь уведомлений ────────────────────────────────────────
+
+    def enqueue_messages(self, messages: list[tuple[str, int, str]]) -> int:
+        """
+        Запись сообщений (ключ идемпотентности, chat_id, текст) в outbox.
+        Возвращает число новых сообщений: повторный ключ не ставится дважды.
+        """
+        try:
+            with self._write() as conn:
+                added = self._insert_outbox(
+                    conn, [(key, chat_id, text, None) for key, chat_id, text in messages]
+                )
+        except sqlite3.Error as e:
+            logger.error("Ошибка записи в очередь уведомлений: %s", e)
+            return 0
+        if added:
+            self._notify("outbox")
+        return added
+
+    def claim_outbox(self, limit: int, lease_until: datetime) -> list[sqlite3.Row]:
+        """
+        Выдаёт до limit сообщений, готовых к отправке, и откладывает их
+        следующую попытку до lease_until: если процесс упадёт до подтверждения,
+        сообщения будут отправлены снова.
+        """
+        now = datetime.now().strftime(DEADLINE_FORMAT)
+        with self._write() as conn:
+            return conn.execute(
+                """UPDATE outbox SET next_attempt_at = ?, attempts = attempts + 1
+                   WHERE message_id IN (
+                       SELECT message_id FROM outbox
+                       WHERE status = 'pending' AND next_attempt_at <= ?
+                       ORDER BY next_attempt_at
+                       LIMIT ?
+                   )
+                   RETURNING message_id, chat_id, text, attempts, task_id, digest""",
+                (lease_until.strftime(DEADLINE_FORMAT), now, limit),
+            ).fetchall()
+
+    def finish_outbox(
+        self,
+        sent: list[int],
+        retry: list[tuple[int, str, datetime]],
+        failed: list[tuple[int, str]],
+    ) -> None:
+        """
+        Итоги отправки одной транзакцией: sent — доставленные message_id,
+        retry — (message_id, ошибка, время повтора), failed — (message_id, ошибка)
+        для сообщений, которые больше не отправляются.
+        """
+        now = datetime.now().strftime(DEADLINE_FORMAT)
+        try:
+            with self._write() as conn:
+                conn.executemany(
+                    "UPDATE outbox SET status = 'sent', sent_at = ? WHERE message_id = ?",
+                    [(now, message_id) for message_id in sent],
+                )
+                conn.executemany(
+                    """UPDATE outbox SET next_attempt_at = ?, last_error = ?
+                       WHERE message_id = ?""",
+                    [(at.strftime(DEADLINE_FORMAT), error, message_id)
+                     for message_id, error, at in retry],
+                )
+                conn.executemany(
+                    """UPDATE outbox SET status = 'failed', last_error = ?
+                       WHERE message_id = ?""",
+                    [(error, message_id) for message_id, error in failed],
+                )
+        except sqlite3.Error as e:
+            logger.error("Ошибка сохранения итогов отправки: %s", e)
+
+    def get_next_outbox_attempt(self) -> Optional[datetime]:
+        """Время ближайшей попытки отправки из outbox (None — очередь пуста)."""
+        with self._read() as conn:
+            row = conn.execute(
+                """SELECT MIN(next_attempt_at) as next_at FROM outbox
+                   WHERE status = 'pending'"""
+            ).fetchone()
+        return datetime.fromisoformat(row["next_at"]) if row["next_at"] else None
+
+    def purge_outbox(self, before: datetime) -> int:
+        """Удаление отправленных и отброшенных сообщений, созданных раньше before."""
+        try:
+            with self._write() as conn:
+                cursor = conn.execute(
+                    """DELETE FROM outbox
+                       WHERE status != 'pending' AND created_at < ?""",
+                    (before.strftime(DEADLINE_FORMAT),),
+                )
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            logger.error("Ошибка очистки очереди уведомлений: %s", e)
+            return 0
+
     def close(self) -> None:
-        """Закрытие соединения с БД."""
+        """Закрытие соединений с БД."""
+        if self._readers is not None:
+            while not self._readers.empty():
+                self._readers.get_nowait().close()
         self.conn.close()
         logger.info("Соединение с БД закрыто")
+
+
+class AsyncDatabase:
+    """
+    Асинхронный фасад над Database для обработчиков.
+    Каждый вызов метода выполняется в отдельном пуле потоков и
+    возвращает awaitable с тем же результатом, что и синхронный метод.
+
+    При group_commit_interval > 0 включается групповой коммит: частые записи
+    (Database.GROUP_COMMIT_METHODS) копятся и фиксируются одной транзакцией
+    раз в group_commit_interval секунд или по набору group_commit_max операций.
+    Awaitable вызова завершается только после коммита его пакета.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        max_workers: int = 1,
+        group_commit_interval: float = 0.0,
+        group_commit_max: int = 64,
+    ) -> None:
+        """Инициализация фасада поверх синхронного экземпляра Database."""
+        self.sync = db
+        # Без пула читателей соединение одно — достаточно одного потока;
+        # с пулом потоков должно хватать на всех читателей и писателя
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="db"
+        )
+        self._group_interval = group_commit_interval
+        self._group_max = group_commit_max
+        self._pending: list[tuple[Callable[[], Any], asyncio.Future]] = []
+        self._flush_timer: asyncio.TimerHandle | None = None
+        self._flush_tasks: set[asyncio.Task] = set()
+
+    async def run(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Выполняет func(db, *args, **kwargs) в пуле потоков БД.
+        Удобно для нескольких запросов за один переход в поток.
+        """
+        loop = asyncio.get_running_loop()
+        call = functools.partial(func, self.sync, *args, **kwargs)
+        return await loop.run_in_executor(self._executor, call)
+
+    def __getattr__(self, name: str) -> Any:
+        """Возвращает асинхронную обёртку над одноимённым методом Database."""
+        attr = getattr(self.sync, name)
+        if not callable(attr):
+            return attr
+        grouped = self._group_interval > 0 and name in Database.GROUP_COMMIT_METHODS
+
+        @functools.wraps(attr)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            call = functools.partial(attr, *args, **kwargs)
+            if grouped:
+                return await self._enqueue_write(call)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, call)
+
+        return wrapper
+
+    # ─── Групповой коммит ──────────────────────────────────────────
+
+    async def _enqueue_write(self, call: Callable[[], Any]) -> Any:
+        """Ставит запись в текущий пакет и ждёт его коммита."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((call, future))
+        # Сбрасываем пакет по размеру или по таймеру
+        if len(self._pending) >= self._group_max:
+            self._flush()
+        elif self._flush_timer is None:
+            self._flush_timer = loop.call_later(self._group_interval, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        """Отправляет накопленный пакет записей в поток БД."""
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.get_running_loop().create_task(self._commit_batch(batch))
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def _commit_batch(
+        self, batch: list[tuple[Callable[[], Any], asyncio.Future]]
+    ) -> None:
+        """Выполняет пакет одной транзакцией и раздаёт результаты вызывающим."""
+        loop = asyncio.get_running_loop()
+        calls = [call for call, _ in batch]
+        try:
+            results = await loop.run_in_executor(
+                self._executor, self.sync.run_batch, calls
+            )
+        except Exception as e:
+            logger.error("Ошибка группового коммита (%s операций): %s", len(batch), e)
+            self._resolve(batch, [e] * len(batch))
+            return
+        self._resolve(batch, results)
+
+    @staticmethod
+    def _resolve(
+        batch: list[tuple[Callable[[], Any], asyncio.Future]], results: list[Any]
+    ) -> None:
+        """Передаёт вызывающим результаты пакета (исключение — как ошибку вызова)."""
+        for (_, future), result in zip(batch, results):
+            # У закрытого цикла колбэки future уже не выполнить
+            if future.done() or future.get_loop().is_closed():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def flush(self) -> None:
+        """Немедленно фиксирует все накопленные записи."""
+        self._flush()
+        if self._flush_tasks:
+            await asyncio.gather(*self._flush_tasks, return_exceptions=True)
+
+    def close(self) -> None:
+        """Остановка пула потоков и закрытие соединения с БД."""
+        # Записи, не дождавшиеся таймера, фиксируем синхронно и отдаём
+        # результаты ждущим их корутинам
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            try:
+                results = self.sync.run_batch([call for call, _ in batch])
+            except Exception as e:
+                logger.error("Ошибка группового коммита (%s операций): %s", len(batch), e)
+                results = [e] * len(batch)
+            self._resolve(batch, results)
+        self._executor.shutdown(wait=True)
+        self.sync.close()
@@ -6,7 +6,7 @@ import logging
 from telegram import Update
 from telegram.ext import ContextTypes
 
-from database import Database
+from database import AsyncDatabase
 from utils.calendar_export import generate_ics_file
 
 logger = logging.getLogger(__name__)
@@ -16,15 +16,15 @@ logger = logging.getLogger(__name__)
 async def calendar_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Генерация и отправка .ics файла с задачами команды."""
     user = update.effective_user
-    db: Database = context.bot_data["db"]
+    db: AsyncDatabase = context.bot_data["db"]
 
-    team = db.get_user_active_team(user.id)
+    team = await db.get_user_active_team(user.id)
     if not team:
         await update.message.reply_text("❌ Вы не состоите в команде.")
         return
 
     # Получаем все задачи команды
-    tasks = db.get_team_tasks(team["team_id"])
+    tasks = await db.get_team_tasks(team["team_id"])
     if not tasks:
         await update.message.reply_text("📅 Нет задач для экспорта.")
         return
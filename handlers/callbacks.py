@@ -4,15 +4,17 @@
 """
 
 import logging
+import re
 from telegram import Update
 from telegram.ext import ContextTypes, ConversationHandler
 
-from database import Database
+from database import AsyncDatabase
 from utils.keyboards import (
     get_main_menu_keyboard,
     get_task_keyboard,
     get_delete_confirm_keyboard,
     get_back_to_menu_keyboard,
+    get_teams_keyboard,
 )
 from utils.formatters import (
     format_task_message,
@@ -20,21 +22,33 @@ from utils.formatters import (
     format_help_message,
     format_team_info,
 )
-from utils.notifications import notify_status_changed
+from utils.notifications import status_changed_messages, comment_added_messages
+from handlers.tasks import render_tasks_page
 
 logger = logging.getLogger(__name__)
 
 # Состояние для ожидания комментария
 WAITING_COMMENT = 100
 
+# Кнопки карточки задачи: ID задачи в callback_data
+TASK_CALLBACK_RE = re.compile(
+    r"^(?:status|confirm_delete|cancel_delete|delete|cancel|comment|edit)_(\d+)"
+)
+
 
 # Главный обработчик callback-запросов
 async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Маршрутизатор callback-запросов от inline-кнопок."""
     query = update.callback_query
-    await query.answer()
     data = query.data
 
+    # Карточку, отправленную через inline-режим, видят все участники чата:
+    # кнопками пользуются только участники команды задачи
+    if query.inline_message_id and not await _can_use_task_buttons(update, context):
+        await query.answer("❌ У вас нет доступа к этой задаче.", show_alert=True)
+        return
+    await query.answer()
+
     # Обработка кнопок меню
     if data == "back_to_menu":
         await handle_back_to_menu(update, context)
@@ -62,6 +76,27 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     # Просмотр задачи по нажатию
     elif data.startswith("edit_"):
         await handle_edit_callback(update, context)
+    # Листание списков задач
+    elif data.startswith("page_"):
+        await handle_page_callback(update, context)
+    # Выбор активной команды
+    elif data.startswith("select_team_"):
+        await handle_select_team_callback(update, context)
+
+
+# Проверка доступа к кнопкам карточки задачи
+async def _can_use_task_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
+    """Нажавший кнопку карточки состоит в команде задачи."""
+    match = TASK_CALLBACK_RE.match(update.callback_query.data or "")
+    if not match:
+        return True
+    db: AsyncDatabase = context.bot_data["db"]
+    task = await db.get_task(int(match.group(1)))
+    if not task:
+        # Сообщение «задача не найдена» покажет сам обработчик
+        return True
+    role = await db.get_member_role(task["team_id"], update.effective_user.id)
+    return role is not None
 
 
 # Обработка кнопки "Назад в главное меню"
@@ -93,10 +128,10 @@ async def handle_menu_callback(update: Update, context: ContextTypes.DEFAULT_TYP
     query = update.callback_query
     data = query.data
     user = update.effective_user
-    db: Database = context.bot_data["db"]
+    db: AsyncDatabase = context.bot_data["db"]
 
     # Проверяем активную команду
-    team = db.get_user_active_team(user.id)
+    team = await db.get_user_active_team(user.id)
 
     if data == "menu_newtask":
         # Перенаправляем на создание задачи
@@ -110,26 +145,23 @@ async def handle_menu_callback(update: Update, context: ContextTypes.DEFAULT_TYP
         if not team:
             await query.edit_message_text("❌ Вы не состоите в команде.")
             return
-        tasks = db.get_user_tasks(user.id, team["team_id"])
-        msg = format_tasks_list([dict(t) for t in tasks], "📋 Мои задачи")
-        await query.edit_message_text(msg, parse_mode="HTML",
-            reply_markup=get_back_to_menu_keyboard())
+        msg, keyboard = await render_tasks_page(db, user.id, team, "my")
+        await query.edit_message_text(msg, parse_mode="HTML", reply_markup=keyboard)
 
     elif data == "menu_alltasks":
         if not team:
             await query.edit_message_text("❌ Вы не состоите в команде.")
             return
-        tasks = db.get_team_tasks(team["team_id"])
-        msg = format_tasks_list([dict(t) for t in tasks], f"📊 Все задачи «{team['name']}»")
-        await query.edit_message_text(msg, parse_mode="HTML",
-            reply_markup=get_back_to_menu_keyboard())
+        msg, keyboard = await render_tasks_page(db, user.id, team, "all")
+        await query.edit_message_text(msg, parse_mode="HTML", reply_markup=keyboard)
 
     elif data == "menu_today":
         if not team:
             await query.edit_message_text("❌ Вы не состоите в команде.")
             return
-        tasks = db.get_tasks_today(team["team_id"])
-        msg = format_tasks_list([dict(t) for t in tasks], "📅 Задачи на сегодня")
+        tz = await db.get_user_timezone(user.id)
+        tasks = await db.get_tasks_today(team["team_id"], tz, list_view=True)
+        msg = format_tasks_list(tasks, "📅 Задачи на сегодня")
         await query.edit_message_text(msg, parse_mode="HTML",
             reply_markup=get_back_to_menu_keyboard())
 
@@ -137,8 +169,9 @@ async def handle_menu_callback(update: Update, context: ContextTypes.DEFAULT_TYP
         if not team:
             await query.edit_message_text("❌ Вы не состоите в команде.")
             return
-        tasks = db.get_tasks_week(team["team_id"])
-        msg = format_tasks_list([dict(t) for t in tasks], "📆 Задачи на неделю")
+        tz = await db.get_user_timezone(user.id)
+        tasks = await db.get_tasks_week(team["team_id"], tz, list_view=True)
+        msg = format_tasks_list(tasks, "📆 Задачи на неделю")
         await query.edit_message_text(msg, parse_mode="HTML",
             reply_markup=get_back_to_menu_keyboard())
 
@@ -146,8 +179,8 @@ async def handle_menu_callback(update: Update, context: ContextTypes.DEFAULT_TYP
         if not team:
             await query.edit_message_text("❌ Вы не состоите в команде.")
             return
-        members = db.get_team_members(team["team_id"])
-        owner = db.get_user(team["owner_id"])
+        members = await db.get_team_members(team["team_id"])
+        owner = await db.get_user(team["owner_id"])
         owner_name = owner["first_name"] if owner else "—"
         msg = format_team_info(dict(team), [dict(m) for m in members], owner_name)
         await query.edit_message_text(msg, parse_mode="HTML",
@@ -189,7 +222,7 @@ async def handle_status_callback(update: Update, context: ContextTypes.DEFAULT_T
     """Обработка нажатия кнопки смены статуса задачи."""
     query = update.callback_query
     user = update.effective_user
-    db: Database = context.bot_data["db"]
+    db: AsyncDatabase = context.bot_data["db"]
 
     # Парсим callback_data: status_{task_id}_{new_status}
     parts = query.data.split("_", 2)
@@ -200,44 +233,49 @@ async def handle_status_callback(update: Update, context: ContextTypes.DEFAULT_T
     new_status = parts[2]
 
     # Получаем задачу
-    task = db.get_task(task_id)
+    task = await db.get_task(task_id)
     if not task:
         await query.edit_message_text("❌ Задача не найдена.")
         return
 
+    # Уведомление автору о смене статуса (если это не сам автор)
+    # записывается в outbox вместе со статусом
+    messages = []
+    if task["author_id"] != user.id:
+        changer_name = user.first_name or user.username or str(user.id)
+        messages = status_changed_messages(
+            task["author_id"], dict(task), new_status, changer_name
+        )
+
     # Обновляем статус
-    success = db.update_task_status(task_id, new_status)
+    success = await db.update_task_status(
+        task_id, new_status, notify=lambda _: messages
+    )
     if not success:
         await query.edit_message_text("❌ Ошибка при изменении статуса.")
         return
 
-    # Перезагружаем задачу для обновления
-    task = db.get_task(task_id)
-    team = db.get_user_active_team(user.id)
-    role = db.get_member_role(team["team_id"], user.id) if team else None
+    # Перезагружаем задачу с именами и ролью одним запросом
+    view = await db.get_task_view(task_id, user.id, comments_limit=0)
+    if not view:
+        await query.edit_message_text("❌ Задача не найдена.")
+        return
+    task = view["task"]
 
-    # Получаем имена
     assignee_name = "Не назначен"
-    if task["assignee_id"]:
-        assignee = db.get_user(task["assignee_id"])
-        if assignee:
-            assignee_name = assignee["first_name"] or assignee["username"] or "—"
-
-    author = db.get_user(task["author_id"])
-    author_name = author["first_name"] if author else "—"
+    if task["assignee_id"] and view["assignee"]:
+        assignee = view["assignee"]
+        assignee_name = assignee["first_name"] or assignee["username"] or "—"
+    author_name = view["author"]["first_name"] if view["author"] else "—"
 
     msg = format_task_message(dict(task), assignee_name, author_name)
-    keyboard = get_task_keyboard(task_id, task["status"], role)
+    keyboard = get_task_keyboard(
+        task_id, task["status"], view["viewer_role"],
+        add_back_button=query.inline_message_id is None,
+    )
 
     await query.edit_message_text(msg, parse_mode="HTML", reply_markup=keyboard)
 
-    # Уведомляем автора о смене статуса (если это не сам автор)
-    if task["author_id"] != user.id:
-        changer_name = user.first_name or user.username or str(user.id)
-        await notify_status_changed(
-            context.bot, task["author_id"], dict(task), new_status, changer_name
-        )
-
     logger.info("Статус задачи #%s изменён на '%s' пользователем %s", task_id, new_status, user.id)
 
 
@@ -261,10 +299,10 @@ async def handle_confirm_delete_callback(
 ) -> None:
     """Удаление задачи после подтверждения."""
     query = update.callback_query
-    db: Database = context.bot_data["db"]
+    db: AsyncDatabase = context.bot_data["db"]
     task_id = int(query.data.replace("confirm_delete_", ""))
 
-    success = db.delete_task(task_id)
+    success = await db.delete_task(task_id)
     if success:
         await query.edit_message_text(f"🗑 Задача #{task_id} удалена.")
     else:
@@ -277,10 +315,10 @@ async def handle_cancel_task_callback(
 ) -> None:
     """Отмена задачи (перевод в статус cancelled)."""
     query = update.callback_query
-    db: Database = context.bot_data["db"]
+    db: AsyncDatabase = context.bot_data["db"]
     task_id = int(query.data.replace("cancel_", ""))
 
-    db.update_task_status(task_id, "cancelled")
+    await db.update_task_status(task_id, "cancelled")
     await query.edit_message_text(
         f"❌ Задача #{task_id} отменена.\n\n"
         f"Посмотреть: /task {task_id}",
@@ -318,7 +356,7 @@ async def comment_text_handler(
         return
 
     user = update.effective_user
-    db: Database = context.bot_data["db"]
+    db: AsyncDatabase = context.bot_data["db"]
     text = update.message.text.strip()
 
     # Проверяем длину
@@ -326,8 +364,23 @@ async def comment_text_handler(
         await update.message.reply_text("❌ Комментарий слишком длинный (макс. 500 символов).")
         return
 
+    # Уведомления участникам задачи записываются вместе с комментарием
+    messages = []
+    task = await db.get_task(task_id)
+    if task:
+        commenter_name = user.first_name or user.username or str(user.id)
+        # Собираем ID получателей (автор и исполнитель, кроме комментатора)
+        notify_ids = set()
+        if task["author_id"] and task["author_id"] != user.id:
+            notify_ids.add(task["author_id"])
+        if task["assignee_id"] and task["assignee_id"] != user.id:
+            notify_ids.add(task["assignee_id"])
+        messages = comment_added_messages(
+            list(notify_ids), dict(task), commenter_name, text
+        )
+
     # Сохраняем комментарий
-    db.add_comment(task_id, user.id, text)
+    await db.add_comment(task_id, user.id, text, notify=lambda _: messages)
     # Очищаем состояние
     del context.user_data["comment_task_id"]
 
@@ -337,22 +390,6 @@ async def comment_text_handler(
         parse_mode="HTML",
     )
 
-    # Уведомляем участников задачи
-    task = db.get_task(task_id)
-    if task:
-        from utils.notifications import notify_comment_added
-        commenter_name = user.first_name or user.username or str(user.id)
-        # Собираем ID получателей (автор и исполнитель, кроме комментатора)
-        notify_ids = set()
-        if task["author_id"] and task["author_id"] != user.id:
-            notify_ids.add(task["author_id"])
-        if task["assignee_id"] and task["assignee_id"] != user.id:
-            notify_ids.add(task["assignee_id"])
-        if notify_ids:
-            await notify_comment_added(
-                context.bot, list(notify_ids), dict(task), commenter_name, text
-            )
-
 
 # Обработка редактирования задачи (упрощённый вариант)
 async def handle_edit_callback(
@@ -372,3 +409,61 @@ async def handle_edit_callback(
         parse_mode="HTML",
         reply_markup=get_back_to_menu_keyboard(),
     )
+
+
+# Листание списка задач
+async def handle_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Следующая или предыдущая страница списка: page_{scope}_{n|p}{task_id}."""
+    query = update.callback_query
+    user = update.effective_user
+    db: AsyncDatabase = context.bot_data["db"]
+
+    parts = query.data.split("_")
+    if (
+        len(parts) != 3
+        or parts[1] not in ("my", "all")
+        or parts[2][:1] not in ("n", "p")
+        or not parts[2][1:].isdigit()
+    ):
+        return
+    scope, direction, task_id = parts[1], parts[2][0], int(parts[2][1:])
+
+    team = await db.get_user_active_team(user.id)
+    if not team:
+        await query.edit_message_text("❌ Вы не состоите в команде.")
+        return
+
+    if direction == "n":
+        msg, keyboard = await render_tasks_page(db, user.id, team, scope, after=task_id)
+    else:
+        msg, keyboard = await render_tasks_page(db, user.id, team, scope, before=task_id)
+    await query.edit_message_text(msg, parse_mode="HTML", reply_markup=keyboard)
+
+
+# Выбор активной команды
+async def handle_select_team_callback(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+) -> None:
+    """Переключение активной команды из списка /teams."""
+    query = update.callback_query
+    user = update.effective_user
+    db: AsyncDatabase = context.bot_data["db"]
+    team_id = int(query.data.replace("select_team_", ""))
+
+    # Пользователь мог покинуть команду после показа списка
+    if not await db.set_active_team(user.id, team_id):
+        teams = await db.get_user_teams(user.id)
+        await query.edit_message_text(
+            "❌ Вы больше не состоите в этой команде.",
+            reply_markup=get_teams_keyboard(teams) if teams else None,
+        )
+        return
+
+    team = await db.get_team(team_id)
+    await query.edit_message_text(
+        f"✅ Активная команда: «<b>{team['name']}</b>»\n\n"
+        f"Используйте /menu для продолжения.",
+        parse_mode="HTML",
+        reply_markup=get_back_to_menu_keyboard(),
+    )
+    logger.info("Пользователь %s выбрал активную команду %s", user.id, team_id)
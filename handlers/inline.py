@@ -0,0 +1,169 @@
+"""
+Inline-режим: «@бот текст» в любом чате.
+Показывает задачи активной команды пользователя, в названии которых есть
+слова, начинающиеся с набранных, и отправляет выбранную карточку в чат.
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+from telegram import (
+    InlineQueryResultArticle,
+    InlineQueryResultsButton,
+    InputTextMessageContent,
+    Update,
+)
+from telegram.ext import ContextTypes
+
+from config import STATUS_EMOJI, STATUS_TEXT
+from database import AsyncDatabase
+from utils.formatters import format_task_message, format_user_name
+from utils.keyboards import get_task_keyboard
+
+logger = logging.getLogger(__name__)
+
+# Число задач в ответе (Telegram принимает до 50)
+INLINE_RESULTS_LIMIT = 20
+
+# Не больше стольких ответов хранится в кэше
+INLINE_CACHE_SIZE = 5000
+
+
+class InlineSearch:
+    """
+    Состояние inline-поиска процесса: последние запросы и кэш ответов.
+
+    Telegram присылает запрос на каждое нажатие клавиши. Ответ готовится
+    только на последний запрос пользователя, после которого он не печатал
+    debounce секунд; более ранние остаются без ответа (Telegram их всё равно
+    отбрасывает). Готовые ответы хранятся ttl секунд по ключу
+    (пользователь, команда, текст запроса): стирание символа или повтор
+    запроса не обращаются к БД и отвечаются без ожидания.
+    """
+
+    def __init__(self, ttl: int = 10, debounce: float = 0.3) -> None:
+        self.ttl = ttl
+        self.debounce = debounce
+        # ID последнего запроса каждого пользователя, ждущего паузы в наборе
+        self._latest: dict[int, str] = {}
+        self._results: OrderedDict[
+            tuple[int, int, str], tuple[float, list[InlineQueryResultArticle]]
+        ] = OrderedDict()
+
+    async def wait_for_pause(self, user_id: int, query_id: str) -> bool:
+        """Ждёт паузу в наборе; False — за это время пришёл более новый запрос."""
+        self._latest[user_id] = query_id
+        if self.debounce > 0:
+            await asyncio.sleep(self.debounce)
+        if self._latest.get(user_id) != query_id:
+            return False
+        del self._latest[user_id]
+        return True
+
+    def get(
+        self, user_id: int, team_id: int, query: str
+    ) -> Optional[list[InlineQueryResultArticle]]:
+        """Ответ из кэша или None, если его нет или он устарел."""
+        key = (user_id, team_id, query)
+        entry = self._results.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._results[key]
+            return None
+        return entry[1]
+
+    def put(
+        self, user_id: int, team_id: int, query: str, results: list[InlineQueryResultArticle]
+    ) -> None:
+        """Сохранение ответа; самые старые записи вытесняются."""
+        if self.ttl <= 0:
+            return
+        self._results[(user_id, team_id, query)] = (time.monotonic() + self.ttl, results)
+        while len(self._results) > INLINE_CACHE_SIZE:
+            self._results.popitem(last=False)
+
+
+# Обработчик inline-запросов @бот <текст>
+async def inline_query_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Поиск задач активной команды по началу слов названия."""
+    inline_query = update.inline_query
+    user = update.effective_user
+    db: AsyncDatabase = context.bot_data["db"]
+    search: InlineSearch = context.bot_data["inline_search"]
+
+    team = await db.get_user_active_team(user.id)
+    if not team:
+        await inline_query.answer(
+            [],
+            cache_time=search.ttl,
+            is_personal=True,
+            button=InlineQueryResultsButton(
+                text="Вы не состоите в команде", start_parameter="inline"
+            ),
+        )
+        return
+
+    query = " ".join(inline_query.query.lower().split())
+    results = search.get(user.id, team["team_id"], query)
+    if results is None:
+        # Ответ только на последний запрос после паузы в наборе
+        if not await search.wait_for_pause(user.id, inline_query.id):
+            return
+        results = await _build_results(db, user.id, team["team_id"], query)
+        search.put(user.id, team["team_id"], query, results)
+
+    await inline_query.answer(results, cache_time=search.ttl, is_personal=True)
+
+
+# Карточки найденных задач для ответа на inline-запрос
+async def _build_results(
+    db: AsyncDatabase, user_id: int, team_id: int, query: str
+) -> list[InlineQueryResultArticle]:
+    """Результаты с карточкой задачи и кнопками, как в /task."""
+    tasks = await db.search_task_titles(team_id, query, INLINE_RESULTS_LIMIT)
+    if not tasks:
+        return []
+    role = await db.get_member_role(team_id, user_id)
+    names = await db.get_display_names(
+        {uid for task in tasks for uid in (task["assignee_id"], task["author_id"]) if uid}
+    )
+
+    results = []
+    for task in tasks:
+        assignee_name = "Не назначен"
+        if task["assignee_id"]:
+            assignee_name = format_user_name(
+                names.get(task["assignee_id"]), str(task["assignee_id"])
+            )
+        author_name = format_user_name(names.get(task["author_id"]), str(task["author_id"]))
+        status = task["status"] or "todo"
+
+        description = f"{STATUS_EMOJI.get(status, '⚪️')} {STATUS_TEXT.get(status, status)}"
+        if task["deadline"]:
+            try:
+                deadline = datetime.fromisoformat(str(task["deadline"]))
+                description += f" · до {deadline.strftime('%d.%m %H:%M')}"
+            except (ValueError, TypeError):
+                pass
+
+        results.append(
+            InlineQueryResultArticle(
+                id=str(task["task_id"]),
+                title=f"#{task['task_id']} {task['title']}",
+                description=description,
+                input_message_content=InputTextMessageContent(
+                    format_task_message(dict(task), assignee_name, author_name),
+                    parse_mode="HTML",
+                ),
+                # В чужом чате кнопки «Назад в меню» нет: меню там не откроется
+                reply_markup=get_task_keyboard(
+                    task["task_id"], status, role, add_back_button=False
+                ),
+            )
+        )
+    return results
@@ -7,7 +7,7 @@ import logging
 from telegram import Update
 from telegram.ext import ContextTypes, ConversationHandler
 
-from database import Database
+from database import AsyncDatabase
 from utils.keyboards import get_main_menu_keyboard, get_back_to_menu_keyboard
 from utils.formatters import format_help_message
 
@@ -18,10 +18,10 @@ logger = logging.getLogger(__name__)
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Регистрация пользователя и приветственное сообщение."""
     user = update.effective_user
-    db: Database = context.bot_data["db"]
+    db: AsyncDatabase = context.bot_data["db"]
 
     # Сохраняем / обновляем данные пользователя
-    db.add_user(
+    await db.add_user(
         user_id=user.id,
         username=user.username,
         first_name=user.first_name,
@@ -30,7 +30,7 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     )
 
     # Проверяем, есть ли у пользователя команда
-    team = db.get_user_active_team(user.id)
+    team = await db.get_user_active_team(user.id)
 
     welcome = (
         f"👋 Привет, <b>{user.first_name}</b>!\n\n"
@@ -92,8 +92,8 @@ async def cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 async def settings_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Отправка информации о настройках."""
     user = update.effective_user
-    db: Database = context.bot_data["db"]
-    user_data = db.get_user(user.id)
+    db: AsyncDatabase = context.bot_data["db"]
+    user_data = await db.get_user(user.id)
 
     tz = user_data["timezone"] if user_data else "Europe/Moscow"
     msg = (
@@ -112,7 +112,7 @@ async def settings_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
 async def timezone_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Установка часового пояса пользователя."""
     user = update.effective_user
-    db: Database = context.bot_data["db"]
+    db: AsyncDatabase = context.bot_data["db"]
 
     # Проверяем аргументы
     if not context.args:
@@ -132,8 +132,9 @@ async def timezone_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     # Пробуем установить часовой пояс
     try:
         import pytz
-        pytz.timezone(tz)
-        db.set_user_timezone(user.id, tz)
+        # Сохраняем каноническое имя пояса — по нему ищутся когорты сводки
+        tz = pytz.timezone(tz).zone
+        await db.set_user_timezone(user.id, tz)
         await update.message.reply_text(
             f"✅ Часовой пояс установлен: <b>{tz}</b>", parse_mode="HTML"
         )
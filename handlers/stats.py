@@ -7,7 +7,7 @@ import logging
 from telegram import Update
 from telegram.ext import ContextTypes
 
-from database import Database
+from database import AsyncDatabase
 from utils.formatters import format_team_stats, format_user_stats
 from utils.keyboards import get_back_to_menu_keyboard
 
@@ -18,15 +18,15 @@ logger = logging.getLogger(__name__)
 async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Показ статистики текущей команды."""
     user = update.effective_user
-    db: Database = context.bot_data["db"]
+    db: AsyncDatabase = context.bot_data["db"]
 
-    team = db.get_user_active_team(user.id)
+    team = await db.get_user_active_team(user.id)
     if not team:
         await update.message.reply_text("❌ Вы не состоите в команде.")
         return
 
     # Получаем и форматируем статистику
-    stats = db.get_team_stats(team["team_id"])
+    stats = await db.get_team_stats(team["team_id"])
     msg = format_team_stats(stats, team["name"])
     await update.message.reply_text(msg, parse_mode="HTML",
         reply_markup=get_back_to_menu_keyboard())
@@ -36,15 +36,15 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 async def mystats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Показ личной статистики пользователя."""
     user = update.effective_user
-    db: Database = context.bot_data["db"]
+    db: AsyncDatabase = context.bot_data["db"]
 
-    team = db.get_user_active_team(user.id)
+    team = await db.get_user_active_team(user.id)
     if not team:
         await update.message.reply_text("❌ Вы не состоите в команде.")
         return
 
     # Получаем и форматируем личную статистику
-    stats = db.get_user_stats(user.id, team["team_id"])
+    stats = await db.get_user_stats(user.id, team["team_id"])
     user_name = user.first_name or user.username or str(user.id)
     msg = format_user_stats(stats, user_name)
     await update.message.reply_text(msg, parse_mode="HTML",
@@ -7,7 +7,7 @@ import logging
 from telegram import Update
 from telegram.ext import ContextTypes
 
-from database import Database
+from database import AsyncDatabase
 from config import SUBSCRIPTION_LIMITS, SUBSCRIPTION_PRICES
 from utils.keyboards import get_subscription_keyboard, get_back_to_menu_keyboard
 
@@ -18,9 +18,9 @@ logger = logging.getLogger(__name__)
 async def subscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Показ информации о тарифных планах."""
     user = update.effective_user
-    db: Database = context.bot_data["db"]
+    db: AsyncDatabase = context.bot_data["db"]
 
-    team = db.get_user_active_team(user.id)
+    team = await db.get_user_active_team(user.id)
     current_plan = team["subscription_type"] if team else "free"
 
     free = SUBSCRIPTION_LIMITS["free"]
@@ -58,9 +58,9 @@ async def subscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
 async def upgrade_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Информация об обновлении плана."""
     user = update.effective_user
-    db: Database = context.bot_data["db"]
+    db: AsyncDatabase = context.bot_data["db"]
 
-    team = db.get_user_active_team(user.id)
+    team = await db.get_user_active_team(user.id)
     if not team:
         await update.message.reply_text("❌ Вы не состоите в команде.")
         return
@@ -95,17 +95,17 @@ async def upgrade_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 async def billing_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Информация о текущей подписке команды."""
     user = update.effective_user
-    db: Database = context.bot_data["db"]
+    db: AsyncDatabase = context.bot_data["db"]
 
-    team = db.get_user_active_team(user.id)
+    team = await db.get_user_active_team(user.id)
     if not team:
         await update.message.reply_text("❌ Вы не состоите в команде.")
         return
 
     plan = team["subscription_type"]
     limits = SUBSCRIPTION_LIMITS.get(plan, SUBSCRIPTION_LIMITS["free"])
-    active_tasks = db.get_active_tasks_count(team["team_id"])
-    member_count = db.get_team_member_count(team["team_id"])
+    active_tasks = await db.get_active_tasks_count(team["team_id"])
+    member_count = await db.get_team_member_count(team["team_id"])
 
     msg = (
         "💳 <b>Текущая подписка</b>\n"
@@ -4,10 +4,11 @@
 """
 
 import logging
-from telegram import Update
+from typing import Optional
+from telegram import InlineKeyboardMarkup, Update
 from telegram.ext import ContextTypes, ConversationHandler
 
-from database import Database
+from database import AsyncDatabase, normalize_deadline
 from config import STATE_TITLE, STATE_DESCRIPTION, STATE_ASSIGNEE, STATE_DEADLINE, STATE_PRIORITY, STATE_CONFIRM
 from utils.keyboards import (
     get_priority_keyboard,
@@ -16,13 +17,25 @@ from utils.keyboards import (
     get_confirm_keyboard,
     get_task_keyboard,
     get_back_to_menu_keyboard,
+    get_tasks_list_keyboard,
+)
+from utils.formatters import (
+    format_search_results,
+    format_task_message,
+    format_tasks_list,
+    format_user_name,
 )
-from utils.formatters import format_task_message, format_tasks_list
 from utils.validators import check_task_limit, format_limit_message, validate_deadline
-from utils.notifications import notify_task_assigned
+from utils.notifications import task_assigned_messages
 
 logger = logging.getLogger(__name__)
 
+# Задач на одной странице списков /mytasks и /alltasks
+TASKS_PAGE_SIZE = 15
+
+# Число результатов /search
+SEARCH_RESULTS_LIMIT = 10
+
 
 # ─── ConversationHandler: создание задачи ──────────────────────────
 
@@ -30,10 +43,10 @@ logger = logging.getLogger(__name__)
 async def newtask_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Начало создания новой задачи. Просим ввести название."""
     user = update.effective_user
-    db: Database = context.bot_data["db"]
+    db: AsyncDatabase = context.bot_data["db"]
 
     # Получаем команду пользователя
-    team = db.get_user_active_team(user.id)
+    team = await db.get_user_active_team(user.id)
     if not team:
         await update.message.reply_text(
             "❌ Сначала создайте или присоединитесь к команде.\n"
@@ -43,7 +56,7 @@ async def newtask_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return ConversationHandler.END
 
     # Проверяем лимит задач
-    limit_check = check_task_limit(db, team["team_id"])
+    limit_check = await db.run(check_task_limit, team["team_id"])
     if not limit_check["allowed"]:
         await update.message.reply_text(
             format_limit_message(limit_check, "задачу"), parse_mode="HTML"
@@ -116,9 +129,9 @@ async def task_description_skipped(update: Update, context: ContextTypes.DEFAULT
 # Вспомогательная функция — показываем список участников
 async def _ask_assignee(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Отправляет клавиатуру выбора исполнителя."""
-    db: Database = context.bot_data["db"]
+    db: AsyncDatabase = context.bot_data["db"]
     team_id = context.user_data["new_task"]["team_id"]
-    members = db.get_team_members(team_id)
+    members = await db.get_team_members(team_id)
 
     msg = (
         "📝 <b>Создание задачи</b>\n\n"
@@ -221,12 +234,13 @@ async def task_priority_selected(update: Update, context: ContextTypes.DEFAULT_T
 
     # Формируем превью задачи
     task_data = context.user_data["new_task"]
-    db: Database = context.bot_data["db"]
+    db: AsyncDatabase = context.bot_data["db"]
 
     # Получаем имя исполнителя
     assignee_name = "Не назначен"
     if task_data.get("assignee_id"):
-        assignee = db.get_user(task_data["assignee_id"])
+        names = await db.get_display_names([task_data["assignee_id"]])
+        assignee = names.get(task_data["assignee_id"])
         if assignee:
             assignee_name = assignee["first_name"] or assignee["username"] or "—"
 
@@ -264,12 +278,26 @@ async def task_confirmed(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await query.edit_message_text("❌ Создание задачи отменено.")
         return ConversationHandler.END
 
-    db: Database = context.bot_data["db"]
+    db: AsyncDatabase = context.bot_data["db"]
     user = update.effective_user
     task_data = context.user_data.get("new_task", {})
 
+    # Уведомление исполнителю (если назначен и это не автор) записывается
+    # вместе с задачей
+    def notify(task_id: int) -> list[tuple[int, str, Optional[str]]]:
+        assignee_id = task_data.get("assignee_id")
+        if not assignee_id or assignee_id == user.id:
+            return []
+        author_name = user.first_name or user.username or str(user.id)
+        task = {
+            **task_data,
+            "task_id": task_id,
+            "deadline": normalize_deadline(task_data.get("deadline")),
+        }
+        return task_assigned_messages(assignee_id, task, author_name)
+
     # Создаём задачу в БД
-    task_id = db.create_task(
+    task_id = await db.create_task(
         team_id=task_data["team_id"],
         title=task_data["title"],
         author_id=user.id,
@@ -277,6 +305,7 @@ async def task_confirmed(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         assignee_id=task_data.get("assignee_id"),
         deadline=task_data.get("deadline"),
         priority=task_data.get("priority", "medium"),
+        notify=notify,
     )
 
     # Проверяем результат
@@ -292,14 +321,6 @@ async def task_confirmed(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         parse_mode="HTML",
     )
 
-    # Уведомляем исполнителя, если назначен и это не автор
-    if task_data.get("assignee_id") and task_data["assignee_id"] != user.id:
-        task = db.get_task(task_id)
-        author_name = user.first_name or user.username or str(user.id)
-        await notify_task_assigned(
-            context.bot, task_data["assignee_id"], dict(task), author_name
-        )
-
     context.user_data.clear()
     logger.info("Задача #%s создана пользователем %s", task_id, user.id)
     return ConversationHandler.END
@@ -307,55 +328,117 @@ async def task_confirmed(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 # ─── Просмотр задач ────────────────────────────────────────────────
 
+# Страница списка задач
+async def render_tasks_page(
+    db: AsyncDatabase,
+    user_id: int,
+    team,
+    scope: str,
+    after: Optional[int] = None,
+    before: Optional[int] = None,
+) -> tuple[str, InlineKeyboardMarkup]:
+    """
+    Текст и клавиатура страницы списка: scope "my" — задачи пользователя,
+    "all" — все задачи команды. after / before — задача, после (до) которой
+    начинается страница; если её удалили — показывается первая страница.
+    """
+    if scope == "my":
+        title = "📋 Мои задачи"
+    else:
+        title = f"📊 Все задачи «{team['name']}»"
+
+    tasks = await _fetch_tasks_page(db, user_id, team, scope, after, before)
+    if tasks is None:
+        # Задачу-закладку удалили — листаем с первой страницы
+        after = before = None
+        tasks = await _fetch_tasks_page(db, user_id, team, scope)
+
+    has_more = len(tasks) > TASKS_PAGE_SIZE
+    if before is not None:
+        has_prev, has_next = has_more, True
+        tasks = tasks[-TASKS_PAGE_SIZE:]
+    else:
+        has_prev, has_next = after is not None, has_more
+        tasks = tasks[:TASKS_PAGE_SIZE]
+
+    msg = format_tasks_list(tasks, title, paged=True)
+    keyboard = get_tasks_list_keyboard(
+        scope,
+        first_id=tasks[0].task_id if tasks and has_prev else None,
+        last_id=tasks[-1].task_id if tasks and has_next else None,
+    )
+    return msg, keyboard
+
+
+# Страница задач списка scope с одной лишней задачей
+async def _fetch_tasks_page(
+    db: AsyncDatabase,
+    user_id: int,
+    team,
+    scope: str,
+    after: Optional[int] = None,
+    before: Optional[int] = None,
+) -> Optional[list]:
+    """
+    Задачи страницы и одна задача за её краем: по ней видно, есть ли
+    продолжение. None — задачи after / before больше нет.
+    """
+    limit = TASKS_PAGE_SIZE + 1
+    if scope == "my":
+        return await db.get_user_tasks(
+            user_id, team["team_id"], limit=limit, after=after, before=before,
+            list_view=True,
+        )
+    return await db.get_team_tasks(
+        team["team_id"], limit=limit, after=after, before=before, list_view=True
+    )
+
+
 # Обработчик команды /mytasks — мои задачи
 async def mytasks_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Список задач, назначенных на текущего пользователя."""
     user = update.effective_user
-    db: Database = context.bot_data["db"]
+    db: AsyncDatabase = context.bot_data["db"]
 
-    team = db.get_user_active_team(user.id)
+    team = await db.get_user_active_team(user.id)
     if not team:
         await update.message.reply_text("❌ Вы не состоите в команде.")
         return
 
-    tasks = db.get_user_tasks(user.id, team["team_id"])
-    msg = format_tasks_list([dict(t) for t in tasks], f"📋 Мои задачи")
-    await update.message.reply_text(msg, parse_mode="HTML",
-        reply_markup=get_back_to_menu_keyboard())
+    msg, keyboard = await render_tasks_page(db, user.id, team, "my")
+    await update.message.reply_text(msg, parse_mode="HTML", reply_markup=keyboard)
 
 
 # Обработчик команды /alltasks — все задачи команды
 async def alltasks_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Показ всех задач текущей команды."""
     user = update.effective_user
-    db: Database = context.bot_data["db"]
+    db: AsyncDatabase = context.bot_data["db"]
 
-    team = db.get_user_active_team(user.id)
+    team = await db.get_user_active_team(user.id)
     if not team:
         await update.message.reply_text("❌ Вы не состоите в команде.")
         return
 
-    tasks = db.get_team_tasks(team["team_id"])
-    msg = format_tasks_list(
-        [dict(t) for t in tasks], f"📊 Все задачи «{team['name']}»"
-    )
-    await update.message.reply_text(msg, parse_mode="HTML",
-        reply_markup=get_back_to_menu_keyboard())
+    msg, keyboard = await render_tasks_page(db, user.id, team, "all")
+    await update.message.reply_text(msg, parse_mode="HTML", reply_markup=keyboard)
 
 
 # Обработчик команды /today — задачи на сегодня
 async def today_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Показ задач с дедлайном на сегодня."""
     user = update.effective_user
-    db: Database = context.bot_data["db"]
+    db: AsyncDatabase = context.bot_data["db"]
 
-    team = db.get_user_active_team(user.id)
+    team = await db.get_user_active_team(user.id)
     if not team:
         await update.message.reply_text("❌ Вы не состоите в команде.")
         return
 
-    tasks = db.get_tasks_today(team["team_id"])
-    msg = format_tasks_list([dict(t) for t in tasks], "📅 Задачи на сегодня")
+    # Границы дня считаем по часовому поясу пользователя
+    tz = await db.get_user_timezone(user.id)
+    tasks = await db.get_tasks_today(team["team_id"], tz, list_view=True)
+    msg = format_tasks_list(tasks, "📅 Задачи на сегодня")
     await update.message.reply_text(msg, parse_mode="HTML",
         reply_markup=get_back_to_menu_keyboard())
 
@@ -364,24 +447,53 @@ async def today_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 async def week_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Показ задач на текущую неделю."""
     user = update.effective_user
-    db: Database = context.bot_data["db"]
+    db: AsyncDatabase = context.bot_data["db"]
 
-    team = db.get_user_active_team(user.id)
+    team = await db.get_user_active_team(user.id)
     if not team:
         await update.message.reply_text("❌ Вы не состоите в команде.")
         return
 
-    tasks = db.get_tasks_week(team["team_id"])
-    msg = format_tasks_list([dict(t) for t in tasks], "📆 Задачи на неделю")
+    # Границы дня считаем по часовому поясу пользователя
+    tz = await db.get_user_timezone(user.id)
+    tasks = await db.get_tasks_week(team["team_id"], tz, list_view=True)
+    msg = format_tasks_list(tasks, "📆 Задачи на неделю")
     await update.message.reply_text(msg, parse_mode="HTML",
         reply_markup=get_back_to_menu_keyboard())
 
 
+# Обработчик команды /search <запрос> — поиск задач команды
+async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Полнотекстовый поиск по задачам текущей команды."""
+    user = update.effective_user
+    db: AsyncDatabase = context.bot_data["db"]
+
+    # Проверяем что передан запрос
+    query = " ".join(context.args or []).strip()
+    if not query:
+        await update.message.reply_text(
+            "🔍 Укажите, что искать.\nПример: <code>/search отчёт клиенту</code>",
+            parse_mode="HTML",
+        )
+        return
+
+    team = await db.get_user_active_team(user.id)
+    if not team:
+        await update.message.reply_text("❌ Вы не состоите в команде.")
+        return
+
+    tasks = await db.search_tasks(team["team_id"], query, SEARCH_RESULTS_LIMIT)
+    await update.message.reply_text(
+        format_search_results(tasks, query), parse_mode="HTML",
+        reply_markup=get_back_to_menu_keyboard(),
+    )
+
+
 # Обработчик команды /task [ID] — детали задачи
 async def task_detail_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Показ детальной информации о задаче."""
     user = update.effective_user
-    db: Database = context.bot_data["db"]
+    db: AsyncDatabase = context.bot_data["db"]
 
     # Проверяем что передан ID задачи
     if not context.args:
@@ -398,43 +510,34 @@ async def task_detail_command(update: Update, context: ContextTypes.DEFAULT_TYPE
         await update.message.reply_text("❌ ID задачи должен быть числом.")
         return
 
-    task = db.get_task(task_id)
-    if not task:
+    # Задача, роль, имена и последние комментарии — одним запросом
+    view = await db.get_task_view(task_id, user.id)
+    if not view:
         await update.message.reply_text("❌ Задача не найдена.")
         return
+    task = view["task"]
 
     # Проверяем что пользователь состоит в той же команде
-    team = db.get_user_active_team(user.id)
+    team = await db.get_user_active_team(user.id)
     if not team or task["team_id"] != team["team_id"]:
         await update.message.reply_text("❌ У вас нет доступа к этой задаче.")
         return
 
-    # Получаем имена исполнителя и автора
+    # Имена исполнителя и автора
     assignee_name = "Не назначен"
-    if task["assignee_id"]:
-        assignee = db.get_user(task["assignee_id"])
-        if assignee:
-            name = assignee["first_name"] or ""
-            uname = f"@{assignee['username']}" if assignee["username"] else ""
-            assignee_name = f"{name} {uname}".strip() or str(task["assignee_id"])
-
-    author = db.get_user(task["author_id"])
+    if task["assignee_id"] and view["assignee"]:
+        assignee_name = format_user_name(view["assignee"], str(task["assignee_id"]))
     author_name = "—"
-    if author:
-        name = author["first_name"] or ""
-        uname = f"@{author['username']}" if author["username"] else ""
-        author_name = f"{name} {uname}".strip() or str(task["author_id"])
-
-    # Определяем роль пользователя
-    role = db.get_member_role(team["team_id"], user.id)
+    if view["author"]:
+        author_name = format_user_name(view["author"], str(task["author_id"]))
+    role = view["viewer_role"]
 
     msg = format_task_message(dict(task), assignee_name, author_name)
 
-    # Добавляем комментарии
-    comments = db.get_task_comments(task_id)
-    if comments:
+    # Добавляем последние комментарии
+    if view["comments"]:
         msg += "\n\n💬 <b>Комментарии:</b>\n"
-        for c in comments[-5:]:  # Показываем последние 5
+        for c in view["comments"]:
             c_name = c["first_name"] or c["username"] or "—"
             msg += f"  • <b>{c_name}:</b> {c['text']}\n"
 
@@ -1,6 +1,6 @@
 """
 Обработчики команд управления командами.
-/createteam, /team, /invite, /join, /leave
+/createteam, /team, /teams, /invite, /join, /leave, /reminders
 """
 
 import logging
@@ -8,11 +8,16 @@ import secrets
 from telegram import Update
 from telegram.ext import ContextTypes
 
-from database import Database
-from utils.formatters import format_team_info
-from utils.validators import check_member_limit, format_limit_message
-from utils.notifications import notify_new_member
-from utils.keyboards import get_back_to_menu_keyboard
+from database import AsyncDatabase
+from utils.formatters import format_team_info, format_reminder_offset
+from utils.validators import (
+    check_member_limit,
+    format_limit_message,
+    parse_reminder_offsets,
+)
+from utils.notifications import new_member_messages
+from utils.keyboards import get_back_to_menu_keyboard, get_teams_keyboard
+from scheduler.reminders import team_reminder_offsets
 
 logger = logging.getLogger(__name__)
 
@@ -21,7 +26,7 @@ logger = logging.getLogger(__name__)
 async def createteam_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Создание новой команды (workspace)."""
     user = update.effective_user
-    db: Database = context.bot_data["db"]
+    db: AsyncDatabase = context.bot_data["db"]
 
     # Проверяем что передано название
     if not context.args:
@@ -43,7 +48,7 @@ async def createteam_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
     invite_code = secrets.token_urlsafe(8)
 
     # Создаём команду в БД
-    team_id = db.create_team(team_name, user.id, invite_code)
+    team_id = await db.create_team(team_name, user.id, invite_code)
     # Проверяем результат
     if not team_id:
         await update.message.reply_text("❌ Ошибка создания команды. Попробуйте позже.")
@@ -67,10 +72,10 @@ async def createteam_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
 async def team_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Показ информации о текущей команде и участниках."""
     user = update.effective_user
-    db: Database = context.bot_data["db"]
+    db: AsyncDatabase = context.bot_data["db"]
 
     # Получаем активную команду пользователя
-    team = db.get_user_active_team(user.id)
+    team = await db.get_user_active_team(user.id)
     if not team:
         await update.message.reply_text(
             "❌ Вы не состоите ни в одной команде.\n\n"
@@ -81,8 +86,8 @@ async def team_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         return
 
     # Получаем участников команды
-    members = db.get_team_members(team["team_id"])
-    owner = db.get_user(team["owner_id"])
+    members = await db.get_team_members(team["team_id"])
+    owner = await db.get_user(team["owner_id"])
     owner_name = owner["first_name"] if owner else "—"
 
     msg = format_team_info(dict(team), [dict(m) for m in members], owner_name)
@@ -90,14 +95,42 @@ async def team_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         reply_markup=get_back_to_menu_keyboard())
 
 
+# Обработчик команды /teams — выбор активной команды
+async def teams_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Список команд пользователя с переключением активной."""
+    user = update.effective_user
+    db: AsyncDatabase = context.bot_data["db"]
+
+    teams = await db.get_user_teams(user.id)
+    if not teams:
+        await update.message.reply_text(
+            "❌ Вы не состоите ни в одной команде.\n\n"
+            "Создайте команду: /createteam [название]\n"
+            "Или присоединитесь: /join [код]",
+            parse_mode="HTML",
+        )
+        return
+
+    active = await db.get_user_active_team(user.id)
+    active_name = active["name"] if active else "—"
+    await update.message.reply_text(
+        f"👥 <b>Ваши команды</b>\n\n"
+        f"Активная: <b>{active_name}</b>\n"
+        f"Задачи, статистика и настройки относятся к активной команде.\n"
+        f"Выберите команду:",
+        parse_mode="HTML",
+        reply_markup=get_teams_keyboard(teams, active["team_id"] if active else None),
+    )
+
+
 # Обработчик команды /invite — генерация инвайт-кода
 async def invite_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Показ инвайт-кода для приглашения в команду."""
     user = update.effective_user
-    db: Database = context.bot_data["db"]
+    db: AsyncDatabase = context.bot_data["db"]
 
     # Получаем активную команду
-    team = db.get_user_active_team(user.id)
+    team = await db.get_user_active_team(user.id)
     if not team:
         await update.message.reply_text(
             "❌ Вы не состоите в команде.", parse_mode="HTML"
@@ -105,7 +138,7 @@ async def invite_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return
 
     # Проверяем права (только owner и admin)
-    role = db.get_member_role(team["team_id"], user.id)
+    role = await db.get_member_role(team["team_id"], user.id)
     if role not in ("owner", "admin"):
         await update.message.reply_text("❌ Только владелец и админы могут приглашать участников.")
         return
@@ -124,7 +157,7 @@ async def invite_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 async def join_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Присоединение к команде по инвайт-коду."""
     user = update.effective_user
-    db: Database = context.bot_data["db"]
+    db: AsyncDatabase = context.bot_data["db"]
 
     # Проверяем что передан инвайт-код
     if not context.args:
@@ -138,21 +171,29 @@ async def join_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     invite_code = context.args[0]
 
     # Ищем команду по инвайт-коду
-    team = db.get_team_by_invite(invite_code)
+    team = await db.get_team_by_invite(invite_code)
     if not team:
         await update.message.reply_text("❌ Команда с таким кодом не найдена.")
         return
 
     # Проверяем лимит участников
-    limit_check = check_member_limit(db, team["team_id"])
+    limit_check = await db.run(check_member_limit, team["team_id"])
     if not limit_check["allowed"]:
         await update.message.reply_text(
             format_limit_message(limit_check, "участника"), parse_mode="HTML"
         )
         return
 
+    # Уведомление остальным участникам записывается вместе с вступлением
+    members = await db.get_team_members(team["team_id"])
+    member_ids = [m["user_id"] for m in members if m["user_id"] != user.id]
+    member_name = user.first_name or user.username or str(user.id)
+    messages = new_member_messages(member_ids, member_name, team["name"])
+
     # Добавляем пользователя в команду
-    success = db.add_team_member(team["team_id"], user.id)
+    success = await db.add_team_member(
+        team["team_id"], user.id, notify=lambda _: messages
+    )
     if not success:
         await update.message.reply_text("ℹ️ Вы уже состоите в этой команде.")
         return
@@ -164,12 +205,6 @@ async def join_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         reply_markup=get_back_to_menu_keyboard(),
     )
 
-    # Уведомляем остальных участников
-    members = db.get_team_members(team["team_id"])
-    member_ids = [m["user_id"] for m in members if m["user_id"] != user.id]
-    member_name = user.first_name or user.username or str(user.id)
-    await notify_new_member(context.bot, member_ids, member_name, team["name"])
-
     logger.info("Пользователь %s присоединился к команде %s", user.id, team["team_id"])
 
 
@@ -177,10 +212,10 @@ async def join_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 async def leave_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Выход пользователя из текущей команды."""
     user = update.effective_user
-    db: Database = context.bot_data["db"]
+    db: AsyncDatabase = context.bot_data["db"]
 
     # Получаем активную команду
-    team = db.get_user_active_team(user.id)
+    team = await db.get_user_active_team(user.id)
     if not team:
         await update.message.reply_text("❌ Вы не состоите в команде.")
         return
@@ -194,9 +229,62 @@ async def leave_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         return
 
     # Удаляем из команды
-    db.remove_team_member(team["team_id"], user.id)
+    await db.remove_team_member(team["team_id"], user.id)
     await update.message.reply_text(
         f"👋 Вы покинули команду «<b>{team['name']}</b>».",
         parse_mode="HTML",
     )
     logger.info("Пользователь %s покинул команду %s", user.id, team["team_id"])
+
+
+# Обработчик команды /reminders — настройка напоминаний о дедлайнах
+async def reminders_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Просмотр и изменение напоминаний о дедлайнах для команды."""
+    user = update.effective_user
+    db: AsyncDatabase = context.bot_data["db"]
+
+    # Получаем активную команду
+    team = await db.get_user_active_team(user.id)
+    if not team:
+        await update.message.reply_text(
+            "❌ Вы не состоите в команде.", parse_mode="HTML"
+        )
+        return
+
+    # Без аргументов показываем текущие настройки
+    if not context.args:
+        offsets = team_reminder_offsets(team["reminder_offsets"])
+        lines = "\n".join(f"• {format_reminder_offset(m)}" for m in offsets)
+        await update.message.reply_text(
+            f"🔔 <b>Напоминания команды «{team['name']}»</b>\n\n"
+            f"{lines}\n\n"
+            "Изменить: <code>/reminders 24h 3h now</code>\n"
+            "Формат: <code>30m</code>, <code>2h</code>, <code>1d</code>, "
+            "<code>now</code> — до 5 напоминаний, не раньше чем за 7 дней.",
+            parse_mode="HTML",
+        )
+        return
+
+    # Проверяем права (только owner и admin)
+    role = await db.get_member_role(team["team_id"], user.id)
+    if role not in ("owner", "admin"):
+        await update.message.reply_text("❌ Только владелец и админы могут менять напоминания.")
+        return
+
+    offsets = parse_reminder_offsets(context.args)
+    if offsets is None:
+        await update.message.reply_text(
+            "❌ Неверный формат.\n"
+            "Пример: <code>/reminders 24h 3h now</code>",
+            parse_mode="HTML",
+        )
+        return
+
+    if not await db.set_team_reminder_offsets(team["team_id"], offsets):
+        await update.message.reply_text("⚠️ Не удалось сохранить настройки. Попробуйте позже.")
+        return
+
+    lines = "\n".join(f"• {format_reminder_offset(m)}" for m in offsets)
+    await update.message.reply_text(
+        f"✅ Напоминания обновлены:\n\n{lines}", parse_mode="HTML"
+    )
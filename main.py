@@ -3,20 +3,48 @@
 Инициализация приложения, регистрация обработчиков, запуск бота.
 """
 
+import functools
+import os
 import sys
 import logging
+from telegram import Bot
 from telegram.ext import (
     Application,
     CommandHandler,
     CallbackQueryHandler,
     ConversationHandler,
+    InlineQueryHandler,
     MessageHandler,
     filters,
 )
 
 from config import (
     BOT_TOKEN,
+    BOT_MODE,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PORT,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_URL,
+    UPDATE_CONCURRENCY,
+    WORKERS,
+    WORKER_BASE_PORT,
+    TELEGRAM_API_BASE_URL,
+    PERSISTENCE_INTERVAL,
     DATABASE_PATH,
+    DB_POOL_SIZE,
+    DB_SYNCHRONOUS,
+    DB_CACHE_SIZE,
+    DB_MMAP_SIZE,
+    DB_GROUP_COMMIT_MS,
+    DB_GROUP_COMMIT_MAX,
+    OUTBOX_RATE,
+    OUTBOX_WORKERS,
+    NOTIFY_COALESCE_WINDOW,
+    NOTIFY_COALESCE_MAX_DELAY,
+    IDENTITY_CACHE_TTL,
+    INLINE_DEBOUNCE,
+    INLINE_CACHE_TTL,
     STATE_TITLE,
     STATE_DESCRIPTION,
     STATE_ASSIGNEE,
@@ -24,7 +52,7 @@ from config import (
     STATE_PRIORITY,
     STATE_CONFIRM,
 )
-from database import Database
+from database import Database, AsyncDatabase
 
 # Импортируем обработчики
 from handlers.start import (
@@ -38,9 +66,11 @@ from handlers.start import (
 from handlers.team import (
     createteam_command,
     team_command,
+    teams_command,
     invite_command,
     join_command,
     leave_command,
+    reminders_command,
 )
 from handlers.tasks import (
     newtask_command,
@@ -56,6 +86,7 @@ from handlers.tasks import (
     alltasks_command,
     today_command,
     week_command,
+    search_command,
     task_detail_command,
 )
 from handlers.callbacks import callback_handler, comment_text_handler
@@ -66,7 +97,18 @@ from handlers.subscription import (
 )
 from handlers.stats import stats_command, mystats_command
 from handlers.calendar_handler import calendar_command
-from scheduler.reminders import setup_scheduler
+from handlers.inline import InlineSearch, inline_query_handler
+from scheduler.reminders import setup_scheduler, ReminderTimer
+from utils.outbox import MessageOutbox, OutboxDrainer
+from utils.update_processor import KeyedUpdateProcessor
+from utils.persistence import SQLitePersistence
+from cluster import (
+    ExternalChangeWatcher,
+    LeaderElection,
+    WORKER_SECRET_ENV,
+    run_cluster,
+)
+from webhook import WebhookServer, application_receiver, run_webhook
 
 logger = logging.getLogger(__name__)
 
@@ -86,6 +128,62 @@ async def error_handler(update, context) -> None:
             pass
 
 
+# Запуск фоновых служб: только в ведущем процессе
+async def start_services(app: Application) -> None:
+    """Запускает отправку уведомлений, таймер напоминаний и планировщик."""
+    await app.bot_data["outbox"].start()
+    app.bot_data["outbox_drainer"].start()
+    app.bot_data["reminder_timer"].start()
+    if "change_watcher" in app.bot_data:
+        app.bot_data["change_watcher"].start()
+    app.bot_data["scheduler"] = setup_scheduler(app.bot_data["db"])
+
+
+# Остановка фоновых служб (процесс перестал быть ведущим или завершается)
+async def stop_services(app: Application) -> None:
+    """
+    Останавливает планировщик и таймер, дожидается отправки очереди.
+    Неотправленное остаётся в outbox и уйдёт после перезапуска.
+    """
+    app.bot_data["scheduler"].shutdown(wait=False)
+    if "change_watcher" in app.bot_data:
+        await app.bot_data["change_watcher"].stop()
+    await app.bot_data["reminder_timer"].stop()
+    await app.bot_data["outbox"].stop()
+    await app.bot_data["outbox_drainer"].stop()
+
+
+# Запуск в цикле событий бота: выбор ведущего процесса
+async def post_init(app: Application) -> None:
+    """Фоновые службы запустит процесс, ставший ведущим."""
+    await app.bot_data["leader"].start()
+
+
+# Остановка до закрытия соединения бота
+async def post_stop(app: Application) -> None:
+    """Останавливает службы ведущего и освобождает аренду."""
+    await app.bot_data["leader"].stop()
+
+
+# Номер воркера из аргументов командной строки (--worker N)
+def worker_index() -> int | None:
+    """None — процесс запущен не фронтом как воркер."""
+    if "--worker" in sys.argv:
+        return int(sys.argv[sys.argv.index("--worker") + 1])
+    return None
+
+
+# Адреса Bot API для Bot и Application
+def api_urls() -> dict[str, str]:
+    """Параметры base_url / base_file_url (пусто — стандартные)."""
+    if not TELEGRAM_API_BASE_URL:
+        return {}
+    return {
+        "base_url": f"{TELEGRAM_API_BASE_URL}/bot",
+        "base_file_url": f"{TELEGRAM_API_BASE_URL}/file/bot",
+    }
+
+
 # Инициализация и запуск бота
 def main() -> None:
     """Основная функция запуска бота."""
@@ -95,15 +193,96 @@ def main() -> None:
         print("❌ Ошибка: BOT_TOKEN не установлен.")
         print("   Скопируйте .env.example в .env и укажите токен бота.")
         sys.exit(1)
+    if BOT_MODE not in ("polling", "webhook"):
+        logger.critical("Неизвестный BOT_MODE: %s", BOT_MODE)
+        print("❌ Ошибка: BOT_MODE должен быть polling или webhook.")
+        sys.exit(1)
+    if BOT_MODE == "webhook" and not WEBHOOK_SECRET:
+        logger.critical("WEBHOOK_SECRET не установлен!")
+        print("❌ Ошибка: для режима webhook задайте WEBHOOK_SECRET в .env.")
+        sys.exit(1)
+
+    # Фронт нескольких воркеров: только пересылает обновления
+    worker = worker_index()
+    if WORKERS > 1 and worker is None:
+        logger.info("🚀 Фронт запускается (режим %s, воркеров %s)...", BOT_MODE, WORKERS)
+        print("🚀 Бот запущен! Нажмите Ctrl+C для остановки.")
+        make_server = None
+        if BOT_MODE == "webhook":
+            make_server = functools.partial(
+                WebhookServer, listen=WEBHOOK_LISTEN, port=WEBHOOK_PORT,
+                path=WEBHOOK_PATH, secret_token=WEBHOOK_SECRET,
+            )
+        run_cluster(
+            Bot(BOT_TOKEN, **api_urls()), WORKERS, WORKER_BASE_PORT,
+            make_server=make_server, webhook_url=WEBHOOK_URL,
+        )
+        print("👋 Бот остановлен.")
+        return
 
     # Инициализируем БД
-    db = Database(DATABASE_PATH)
+    db = Database(
+        DATABASE_PATH,
+        pool_size=DB_POOL_SIZE,
+        synchronous=DB_SYNCHRONOUS,
+        cache_size=DB_CACHE_SIZE,
+        mmap_size=DB_MMAP_SIZE,
+        coalesce_window=NOTIFY_COALESCE_WINDOW,
+        coalesce_max_delay=NOTIFY_COALESCE_MAX_DELAY,
+        identity_ttl=IDENTITY_CACHE_TTL,
+    )
+
+    # Асинхронный фасад БД: обработчики работают через него, чтобы запросы
+    # к SQLite не блокировали цикл событий
+    async_db = AsyncDatabase(
+        db,
+        max_workers=db.pool_size + 1,
+        group_commit_interval=DB_GROUP_COMMIT_MS / 1000,
+        group_commit_max=DB_GROUP_COMMIT_MAX,
+    )
+
+    # Создаём приложение; в режиме webhook (и в воркерах) обновления приходят
+    # в локальный сервер. Обновления разных пользователей обрабатываются
+    # параллельно, одного пользователя — по очереди. user_data и состояния
+    # диалогов хранятся в БД и переживают перезапуск
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .job_queue(None)
+        .persistence(SQLitePersistence(async_db, update_interval=PERSISTENCE_INTERVAL))
+        .post_init(post_init)
+        .post_stop(post_stop)
+    )
+    if TELEGRAM_API_BASE_URL:
+        urls = api_urls()
+        builder = builder.base_url(urls["base_url"]).base_file_url(urls["base_file_url"])
+    if UPDATE_CONCURRENCY > 1:
+        builder = builder.concurrent_updates(KeyedUpdateProcessor(UPDATE_CONCURRENCY))
+    if BOT_MODE == "webhook" or worker is not None:
+        builder = builder.updater(None)
+    app = builder.build()
+    app.bot_data["db"] = async_db
+    app.bot_data["inline_search"] = InlineSearch(ttl=INLINE_CACHE_TTL, debounce=INLINE_DEBOUNCE)
 
-    # Создаём приложение
-    app = Application.builder().token(BOT_TOKEN).job_queue(None).build()
+    # Уведомления пишутся в таблицу outbox и отправляются из неё
+    # через очередь с учётом лимитов Telegram
+    outbox = MessageOutbox(app.bot, rate=OUTBOX_RATE, workers=OUTBOX_WORKERS)
+    app.bot_data["outbox"] = outbox
+    app.bot_data["outbox_drainer"] = OutboxDrainer(async_db, outbox)
 
-    # Сохраняем БД в контексте бота
-    app.bot_data["db"] = db
+    # Точные напоминания о дедлайнах: таймер следит за изменениями задач
+    app.bot_data["reminder_timer"] = ReminderTimer(async_db)
+
+    # Фоновые службы работают в одном процессе — ведущем; изменения,
+    # записанные другими воркерами, он узнаёт опросом БД. В одном процессе
+    # все записи проходят через слушатели Database, и опрос не нужен
+    if worker is not None:
+        app.bot_data["change_watcher"] = ExternalChangeWatcher(async_db)
+    app.bot_data["leader"] = LeaderElection(
+        async_db,
+        on_elected=lambda: start_services(app),
+        on_demoted=lambda: stop_services(app),
+    )
 
     # ─── Регистрация ConversationHandler для создания задач ──────
 
@@ -132,6 +311,8 @@ def main() -> None:
             ],
         },
         fallbacks=[CommandHandler("cancel", cancel_command)],
+        name="new_task",
+        persistent=True,
         allow_reentry=True,
     )
 
@@ -147,9 +328,11 @@ def main() -> None:
     # Управление командами
     app.add_handler(CommandHandler("createteam", createteam_command))
     app.add_handler(CommandHandler("team", team_command))
+    app.add_handler(CommandHandler("teams", teams_command))
     app.add_handler(CommandHandler("invite", invite_command))
     app.add_handler(CommandHandler("join", join_command))
     app.add_handler(CommandHandler("leave", leave_command))
+    app.add_handler(CommandHandler("reminders", reminders_command))
 
     # Создание задач (ConversationHandler)
     app.add_handler(task_conv_handler)
@@ -159,6 +342,7 @@ def main() -> None:
     app.add_handler(CommandHandler("alltasks", alltasks_command))
     app.add_handler(CommandHandler("today", today_command))
     app.add_handler(CommandHandler("week", week_command))
+    app.add_handler(CommandHandler("search", search_command))
     app.add_handler(CommandHandler("task", task_detail_command))
 
     # Подписка
@@ -176,6 +360,10 @@ def main() -> None:
     # Обработка inline-кнопок
     app.add_handler(CallbackQueryHandler(callback_handler))
 
+    # Inline-режим: @бот текст. block=False — пауза в наборе не задерживает
+    # следующие обновления того же пользователя
+    app.add_handler(InlineQueryHandler(inline_query_handler, block=False))
+
     # Обработка текстовых сообщений (комментарии)
     app.add_handler(
         MessageHandler(filters.TEXT & ~filters.COMMAND, comment_text_handler)
@@ -184,23 +372,37 @@ def main() -> None:
     # Глобальный обработчик ошибок
     app.add_error_handler(error_handler)
 
-    # ─── Запуск планировщика ────────────────────────────────────
-
-    scheduler = setup_scheduler(app.bot, db)
-
     # ─── Запуск бота ────────────────────────────────────────────
 
-    logger.info("🚀 Бот запускается...")
-    print("🚀 Бот запущен! Нажмите Ctrl+C для остановки.")
+    if worker is not None:
+        logger.info("🚀 Воркер %s запускается...", worker)
+    else:
+        logger.info("🚀 Бот запускается (режим %s)...", BOT_MODE)
+        print("🚀 Бот запущен! Нажмите Ctrl+C для остановки.")
 
+    # Обновления, накопившиеся за время перезапуска, не сбрасываются
     try:
-        app.run_polling(drop_pending_updates=True)
+        if worker is not None:
+            # Воркер: обновления пересылает фронт
+            server = WebhookServer(
+                application_receiver(app),
+                "127.0.0.1", WORKER_BASE_PORT + worker, "/telegram",
+                os.environ[WORKER_SECRET_ENV],
+            )
+            run_webhook(app, server)
+        elif BOT_MODE == "webhook":
+            server = WebhookServer(
+                application_receiver(app),
+                WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET,
+            )
+            run_webhook(app, server, webhook_url=WEBHOOK_URL)
+        else:
+            app.run_polling(drop_pending_updates=False)
     except KeyboardInterrupt:
         logger.info("Получен сигнал остановки")
     finally:
-        # Graceful shutdown
-        scheduler.shutdown(wait=False)
-        db.close()
+        # Graceful shutdown (планировщик и очередь останавливает post_stop)
+        async_db.close()
         logger.info("Бот остановлен")
         print("👋 Бот остановлен.")
 
@@ -1,119 +1,288 @@
 """
 Модуль планировщика напоминаний.
-Использует APScheduler для периодических задач:
-- Проверка дедлайнов каждые 30 минут
-- Ежедневная сводка задач в 9:00
+- Точные напоминания о дедлайнах через ReminderTimer (min-куча в памяти)
+- Ежедневная сводка задач в 9:00 по местному времени через APScheduler
 """
 
+import asyncio
+import heapq
 import logging
 from datetime import datetime, timedelta
+from itertools import groupby
+from typing import Optional
+import pytz
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from telegram import Bot
 
-from database import Database
+from config import DEFAULT_REMINDER_OFFSETS, PRIORITY_EMOJI
+from database import AsyncDatabase, DEADLINE_FORMAT, local_to_utc
+from utils.formatters import format_reminder_offset
 
 logger = logging.getLogger(__name__)
 
+# Местный час отправки ежедневной сводки
+SUMMARY_HOUR = 9
+# Шаг проверки когорт: смещения всех часовых поясов кратны 15 минутам
+SUMMARY_TICK_MINUTES = 15
+# Сколько секунд запуск сводки может опоздать: половина шага, чтобы
+# опоздавший запуск не попал в окно следующей когорты
+SUMMARY_MISFIRE_GRACE = SUMMARY_TICK_MINUTES * 60 // 2
+
 
 # Настройка и запуск планировщика
-def setup_scheduler(bot: Bot, db: Database) -> AsyncIOScheduler:
+def setup_scheduler(db: AsyncDatabase) -> AsyncIOScheduler:
     """
     Создаёт и настраивает планировщик задач.
     Возвращает экземпляр AsyncIOScheduler.
+    Напоминания о дедлайнах отправляет ReminderTimer.
     """
     scheduler = AsyncIOScheduler()
 
-    # Проверка дедлайнов каждые 30 минут
-    scheduler.add_job(
-        check_upcoming_deadlines,
-        "interval",
-        minutes=30,
-        args=[bot, db],
-        id="check_deadlines",
-        name="Проверка дедлайнов",
-    )
-
-    # Ежедневная сводка задач в 9:00
+    # Ежедневная сводка: каждые 15 минут — когорте поясов, где сейчас 9:00
     scheduler.add_job(
         send_daily_summary,
         "cron",
-        hour=9,
-        minute=0,
-        args=[bot, db],
+        minute=f"*/{SUMMARY_TICK_MINUTES}",
+        args=[db],
         id="daily_summary",
         name="Ежедневная сводка",
+        coalesce=True,
+        misfire_grace_time=SUMMARY_MISFIRE_GRACE,
     )
 
     scheduler.start()
-    logger.info("Планировщик запущен: проверка дедлайнов + ежедневная сводка")
+    logger.info("Планировщик запущен: ежедневная сводка по часовым поясам")
     return scheduler
 
 
-# Проверка приближающихся дедлайнов
-async def check_upcoming_deadlines(bot: Bot, db: Database) -> None:
+# Тип напоминания по смещению: 1440 → "24h", 90 → "90m", 0 → "now"
+def reminder_type(offset: int) -> str:
+    """Имя типа напоминания для таблицы reminders."""
+    if offset == 0:
+        return "now"
+    if offset % 60 == 0:
+        return f"{offset // 60}h"
+    return f"{offset}m"
+
+
+# Смещения напоминаний команды
+def team_reminder_offsets(value: Optional[str]) -> list[int]:
+    """Разбирает teams.reminder_offsets; NULL — смещения по умолчанию."""
+    if not value:
+        return DEFAULT_REMINDER_OFFSETS
+    return [int(m) for m in value.split(",")]
+
+
+class ReminderTimer:
     """
-    Ищет задачи с приближающимся дедлайном и отправляет напоминания.
-    Временные окна: 24 часа, 3 часа, момент дедлайна.
+    Точные напоминания о дедлайнах.
+    Время срабатывания будущих напоминаний хранится в min-куче, фоновая
+    задача спит до ближайшего из них. Куча загружается из БД при старте и
+    обновляется по изменениям задач (слушатель Database копит ID изменённых
+    задач, фоновая задача перечитывает их одним запросом); устаревшие записи
+    кучи отбрасываются по номеру версии задачи. Сообщения пишутся в outbox
+    вместе с отметкой об отправке напоминания.
+
+    Дедлайн хранится в местном времени исполнителя, поэтому время
+    срабатывания переводится в UTC по его часовому поясу: куча и сравнения
+    с текущим временем — в UTC (без tzinfo). Все обращения к БД идут через
+    AsyncDatabase и не блокируют цикл событий.
     """
-    now = datetime.now()
-
-    # Определяем временные окна для напоминаний
-    windows = {
-        "24h": (
-            now + timedelta(hours=23, minutes=30),
-            now + timedelta(hours=24, minutes=30),
-        ),
-        "3h": (
-            now + timedelta(hours=2, minutes=30),
-            now + timedelta(hours=3, minutes=30),
-        ),
-        "now": (
-            now - timedelta(minutes=15),
-            now + timedelta(minutes=15),
-        ),
-    }
-
-    # Проходим по каждому временному окну
-    for reminder_type, (start, end) in windows.items():
-        tasks = db.get_upcoming_tasks(start.isoformat(), end.isoformat())
-
-        # Проходим по найденным задачам
-        for task in tasks:
-            # Пропускаем если напоминание уже отправлено
-            if db.is_reminder_sent(task["task_id"], reminder_type):
+
+    # Напоминание, опоздавшее больше чем на это время (бот был выключен), пропускается
+    MISSED_GRACE = timedelta(minutes=30)
+    # Максимальный сон — страховка от перевода системных часов
+    MAX_SLEEP = 300.0
+    # Наибольшее отставание местного времени от UTC (UTC−12): запас нижней
+    # границы дедлайнов при выборке из БД
+    MAX_UTC_LAG = timedelta(hours=12)
+
+    def __init__(self, db: AsyncDatabase) -> None:
+        self.db = db
+        # (время срабатывания в UTC, task_id, тип напоминания, смещение, версия задачи)
+        self._heap: list[tuple[datetime, int, str, int, int]] = []
+        self._versions: dict[int, int] = {}
+        # Задачи, изменённые с последнего пересчёта; флаг — нужна полная загрузка
+        self._changed: set[int] = set()
+        self._reload_pending = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._runner: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Запускает таймер в текущем цикле событий (загрузка — в фоновой задаче)."""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._changed.clear()
+        self._reload_pending = True
+        self.db.sync.add_task_listener(self._on_task_changed)
+        self._runner = self._loop.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Останавливает таймер (его можно запустить снова)."""
+        self.db.sync.remove_listener(self._on_task_changed)
+        if self._runner is not None:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+
+    def _on_task_changed(self, task_id: Optional[int]) -> None:
+        """Слушатель Database: вызывается из потока записи."""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(self._mark_changed, task_id)
+
+    def _mark_changed(self, task_id: Optional[int]) -> None:
+        """Отмечает задачу (None — все задачи) для пересчёта и будит таймер."""
+        if task_id is None:
+            self._reload_pending = True
+        else:
+            self._changed.add(task_id)
+        self._wake()
+
+    async def _apply_changes(self) -> None:
+        """Пересчитывает напоминания изменённых задач одним запросом."""
+        if self._reload_pending:
+            self._reload_pending = False
+            self._changed.clear()
+            await self._reload()
+            return
+        task_ids, self._changed = list(self._changed), set()
+        # Прежние записи кучи для задач становятся устаревшими
+        for task_id in task_ids:
+            self._versions[task_id] = self._versions.get(task_id, 0) + 1
+        for row in await self.db.get_reminder_schedule(self._since(), task_ids):
+            self._push_task(row)
+
+    async def _reload(self) -> None:
+        """Полная загрузка напоминаний из БД."""
+        rows = await self.db.get_reminder_schedule(self._since())
+        self._heap = []
+        self._versions.clear()
+        for row in rows:
+            self._push_task(row)
+        logger.info("Напоминания загружены, в очереди: %s", len(self._heap))
+
+    def _since(self) -> str:
+        """
+        Нижняя граница местных дедлайнов, по которым ещё имеет смысл
+        напоминать, — с запасом на самый западный часовой пояс.
+        """
+        return (_utc_now() - self.MISSED_GRACE - self.MAX_UTC_LAG).strftime(DEADLINE_FORMAT)
+
+    def _push_task(self, row) -> None:
+        """Добавляет в кучу неотправленные напоминания задачи."""
+        try:
+            deadline = datetime.fromisoformat(str(row["deadline"]))
+        except ValueError:
+            return
+        limit = _utc_now() - self.MISSED_GRACE
+        sent = set((row["sent_types"] or "").split(","))
+        version = self._versions.get(row["task_id"], 0)
+        for offset in team_reminder_offsets(row["reminder_offsets"]):
+            rtype = reminder_type(offset)
+            fire_at = local_to_utc(deadline - timedelta(minutes=offset), row["timezone"])
+            if rtype in sent or fire_at < limit:
                 continue
+            heapq.heappush(self._heap, (fire_at, row["task_id"], rtype, offset, version))
+
+    def _wake(self) -> None:
+        """Прерывает сон таймера для пересчёта времени ожидания."""
+        if self._wakeup is not None:
+            self._wakeup.set()
 
-            # Проверяем есть ли исполнитель
-            if not task["assignee_id"]:
+    async def _run(self) -> None:
+        """Основной цикл: спит до ближайшего напоминания и отправляет его."""
+        while True:
+            self._wakeup.clear()
+            if self._reload_pending or self._changed:
+                try:
+                    await self._apply_changes()
+                except Exception as e:
+                    logger.error("Ошибка загрузки напоминаний: %s", e)
+                    # Повторим полную загрузку после паузы
+                    self._reload_pending = True
+                    await asyncio.sleep(5)
                 continue
 
-            # Формируем текст напоминания
-            message = _format_reminder(task, reminder_type)
+            now = _utc_now()
+            due = []
+            while self._heap and self._heap[0][0] <= now:
+                fire_at, task_id, rtype, offset, version = heapq.heappop(self._heap)
+                if version == self._versions.get(task_id, 0):
+                    due.append((task_id, rtype, offset))
+            if due:
+                try:
+                    await self._fire(due)
+                except Exception as e:
+                    logger.error("Ошибка отправки напоминаний: %s", e)
+                continue
 
+            timeout = self.MAX_SLEEP
+            if self._heap:
+                timeout = min(timeout, (self._heap[0][0] - now).total_seconds())
             try:
-                await bot.send_message(
-                    chat_id=task["assignee_id"],
-                    text=message,
-                    parse_mode="HTML",
-                )
-                # Помечаем что напоминание отправлено
-                db.mark_reminder_sent(task["task_id"], reminder_type)
-                logger.info(
-                    "Напоминание '%s' отправлено для задачи #%s",
-                    reminder_type,
-                    task["task_id"],
-                )
-            except Exception as e:
-                logger.error(
-                    "Ошибка отправки напоминания задачи #%s: %s",
-                    task["task_id"],
-                    e,
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fire(self, due: list[tuple[int, str, int]]) -> None:
+        """
+        Ставит наступившие напоминания в outbox.
+        Перед этим задачи перечитываются из БД (их могли изменить в обход
+        слушателя), а напоминания занимаются в reminders — повторно их не
+        поставит ни этот, ни другой процесс.
+        """
+        tasks = {
+            row["task_id"]: row
+            for row in await self.db.get_reminder_schedule(
+                self._since(), list({task_id for task_id, _, _ in due})
+            )
+        }
+
+        # Перепроверяем напоминания по актуальным данным задачи
+        now = _utc_now()
+        ready = []
+        for task_id, rtype, offset in due:
+            task = tasks.get(task_id)
+            if task is None or offset not in team_reminder_offsets(task["reminder_offsets"]):
+                continue
+            try:
+                deadline = datetime.fromisoformat(str(task["deadline"]))
+            except ValueError:
+                continue
+            fire_at = local_to_utc(deadline - timedelta(minutes=offset), task["timezone"])
+            if fire_at > now:
+                # Дедлайн перенесли позже (или сменили пояс) — ждём нового времени
+                heapq.heappush(
+                    self._heap,
+                    (fire_at, task_id, rtype, offset, self._versions.get(task_id, 0)),
                 )
+                continue
+            if now - fire_at > self.MISSED_GRACE:
+                continue
+            ready.append((task, rtype, offset))
+
+        # Отметки и сообщения пишутся одной транзакцией
+        if ready:
+            await self.db.claim_reminders([
+                (task["task_id"], rtype, task["assignee_id"], _format_reminder(task, offset))
+                for task, rtype, offset in ready
+            ])
+
+
+# Текущее время UTC без tzinfo — шкала кучи напоминаний
+def _utc_now() -> datetime:
+    """Текущее время в UTC (naive)."""
+    return datetime.now(pytz.utc).replace(tzinfo=None)
 
 
 # Форматирование текста напоминания
-def _format_reminder(task: dict, reminder_type: str) -> str:
-    """Формирует текст напоминания в зависимости от типа."""
+def _format_reminder(task: dict, offset: int) -> str:
+    """Формирует текст напоминания в зависимости от времени до дедлайна."""
     deadline_str = ""
     try:
         dl = datetime.fromisoformat(str(task["deadline"]))
@@ -121,16 +290,16 @@ def _format_reminder(task: dict, reminder_type: str) -> str:
     except (ValueError, TypeError):
         pass
 
-    # Определяем текст и эмодзи по типу напоминания
-    if reminder_type == "24h":
-        header = "⏰ <b>Напоминание!</b>"
-        time_info = "должна быть выполнена <b>завтра</b>"
-    elif reminder_type == "3h":
-        header = "⚠️ <b>Срочно!</b>"
-        time_info = "должна быть выполнена <b>через 3 часа</b>"
-    else:
+    # Определяем текст и эмодзи по времени до дедлайна
+    if offset == 0:
         header = "🔥 <b>ДЕДЛАЙН СЕЙЧАС!</b>"
         time_info = "должна быть выполнена <b>прямо сейчас</b>"
+    elif offset <= 180:
+        header = "⚠️ <b>Срочно!</b>"
+        time_info = f"должна быть выполнена <b>{_in_time(offset)}</b>"
+    else:
+        header = "⏰ <b>Напоминание!</b>"
+        time_info = f"должна быть выполнена <b>{_in_time(offset)}</b>"
 
     return (
         f"{header}\n\n"
@@ -141,72 +310,102 @@ def _format_reminder(task: dict, reminder_type: str) -> str:
     )
 
 
+# «через 3 ч» из «за 3 ч»
+def _in_time(offset: int) -> str:
+    """Время до дедлайна для текста напоминания."""
+    return "через " + format_reminder_offset(offset).removeprefix("за ")
+
+
+# Часовые пояса, где сейчас наступил час сводки
+def summary_cohorts(now_utc: datetime) -> dict[timedelta, list[str]]:
+    """
+    Группирует часовые пояса, в которых местное время попадает в
+    [SUMMARY_HOUR:00, SUMMARY_HOUR:00 + шаг), по текущему смещению от UTC.
+    Смещение считается на момент вызова, поэтому переход на летнее время
+    учитывается автоматически.
+    """
+    cohorts: dict[timedelta, list[str]] = {}
+    for name in pytz.all_timezones:
+        local = now_utc.astimezone(pytz.timezone(name))
+        if local.hour == SUMMARY_HOUR and local.minute < SUMMARY_TICK_MINUTES:
+            cohorts.setdefault(local.utcoffset(), []).append(name)
+    return cohorts
+
+
 # Ежедневная сводка задач
-async def send_daily_summary(bot: Bot, db: Database) -> None:
+async def send_daily_summary(db: AsyncDatabase) -> None:
     """
-    Отправляет ежедневную сводку задач каждому пользователю в 9:00.
-    Включает задачи на сегодня и просроченные.
+    Отправляет ежедневную сводку задач в 9:00 по местному времени пользователя.
+    Запускается каждые 15 минут и обслуживает только когорту часовых поясов,
+    где сейчас 9:00. Включает задачи на сегодня и просроченные.
     """
-    # Получаем всех пользователей через все команды
-    try:
-        all_members = db.conn.execute(
-            """SELECT DISTINCT tm.user_id, tm.team_id, t.name as team_name
-               FROM team_members tm
-               JOIN teams t ON tm.team_id = t.team_id"""
-        ).fetchall()
-    except Exception as e:
-        logger.error("Ошибка получения пользователей для сводки: %s", e)
-        return
-
-    # Группируем по пользователю
-    user_teams: dict = {}
-    for row in all_members:
-        uid = row["user_id"]
-        if uid not in user_teams:
-            user_teams[uid] = []
-        user_teams[uid].append({"team_id": row["team_id"], "team_name": row["team_name"]})
-
-    # Отправляем сводку каждому пользователю
-    for user_id, teams in user_teams.items():
-        msg = "☀️ <b>Доброе утро! Ваша сводка на сегодня:</b>\n\n"
-        has_tasks = False
-
-        # Проходим по командам пользователя
-        for team_info in teams:
-            today_tasks = db.get_tasks_today(team_info["team_id"])
-            user_today = [t for t in today_tasks if t["assignee_id"] == user_id]
-
-            # Проверяем есть ли задачи на сегодня
-            if user_today:
-                has_tasks = True
-                msg += f"👥 <b>{team_info['team_name']}</b>\n"
-                for task in user_today:
-                    from config import PRIORITY_EMOJI
-                    p = PRIORITY_EMOJI.get(task["priority"], "⚪️")
-                    dl = ""
-                    if task["deadline"]:
-                        try:
-                            dl_dt = datetime.fromisoformat(str(task["deadline"]))
-                            dl = f" → {dl_dt.strftime('%H:%M')}"
-                        except (ValueError, TypeError):
-                            pass
-                    msg += f"  • #{task['task_id']} {p} {task['title']}{dl}\n"
-                msg += "\n"
-
-        # Проверяем просроченные задачи
-        overdue = db.get_overdue_tasks()
-        user_overdue = [t for t in overdue if t["assignee_id"] == user_id]
-        if user_overdue:
-            has_tasks = True
-            msg += "⚠️ <b>Просроченные задачи:</b>\n"
-            for task in user_overdue[:5]:
-                msg += f"  • #{task['task_id']} {task['title']}\n"
-            msg += "\n"
-
-        # Отправляем только если есть задачи
-        if has_tasks:
-            msg += "Хорошего дня! 🚀"
+    now_utc = datetime.now(pytz.utc)
+    for offset, timezones in summary_cohorts(now_utc).items():
+        # Дедлайны хранятся в местном времени — считаем день и «сейчас» когорты
+        local_now = (now_utc + offset).replace(tzinfo=None)
+        day_start = local_now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+        # Все задачи когорты одним запросом, сгруппированные по исполнителю
+        try:
+            rows = await db.get_daily_summary(day_start, local_now, timezones)
+        except Exception as e:
+            logger.error("Ошибка получения задач для сводки: %s", e)
+            continue
+
+        # Ставим сводку в outbox каждому пользователю с задачами; ключ с датой
+        # не даст отправить сводку дважды при повторном запуске
+        day = day_start.strftime("%Y-%m-%d")
+        queued = await db.enqueue_messages([
+            (f"summary:{day}:{user_id}", user_id, _format_daily_summary(list(user_rows)))
+            for user_id, user_rows in groupby(rows, key=lambda row: row["assignee_id"])
+        ])
+        logger.info(
+            "Ежедневная сводка для UTC%s: в очереди %s", _format_utc_offset(offset), queued
+        )
+
+
+# Смещение от UTC в виде +03:00
+def _format_utc_offset(offset: timedelta) -> str:
+    """Форматирует смещение часового пояса."""
+    minutes = int(offset.total_seconds()) // 60
+    sign = "+" if minutes >= 0 else "-"
+    hours, mins = divmod(abs(minutes), 60)
+    return f"{sign}{hours:02d}:{mins:02d}"
+
+
+# Форматирование ежедневной сводки
+def _format_daily_summary(rows: list) -> str:
+    """
+    Формирует сводку пользователя из строк get_daily_summary
+    (упорядочены по команде и дедлайну).
+    """
+    msg = "☀️ <b>Доброе утро! Ваша сводка на сегодня:</b>\n\n"
+
+    # Задачи на сегодня по командам
+    today = [row for row in rows if row["is_today"]]
+    for _, team_rows in groupby(today, key=lambda row: row["team_id"]):
+        team_rows = list(team_rows)
+        msg += f"👥 <b>{team_rows[0]['team_name']}</b>\n"
+        for task in team_rows:
+            p = PRIORITY_EMOJI.get(task["priority"], "⚪️")
+            dl = ""
             try:
-                await bot.send_message(chat_id=user_id, text=msg, parse_mode="HTML")
-            except Exception as e:
-                logger.error("Ошибка отправки сводки пользователю %s: %s", user_id, e)
+                dl_dt = datetime.fromisoformat(str(task["deadline"]))
+                dl = f" → {dl_dt.strftime('%H:%M')}"
+            except (ValueError, TypeError):
+                pass
+            msg += f"  • #{task['task_id']} {p} {task['title']}{dl}\n"
+        msg += "\n"
+
+    # Просроченные задачи по всем командам, самые старые первыми
+    overdue = sorted(
+        (row for row in rows if row["is_overdue"]), key=lambda row: row["deadline"]
+    )
+    if overdue:
+        msg += "⚠️ <b>Просроченные задачи:</b>\n"
+        for task in overdue[:5]:
+            msg += f"  • #{task['task_id']} {task['title']}\n"
+        msg += "\n"
+
+    msg += "Хорошего дня! 🚀"
+    return msg
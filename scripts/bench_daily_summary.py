@@ -0,0 +1,126 @@
+"""
+Бенчмарк ежедневной сводки.
+Сравнивает прежнюю схему (get_tasks_today на каждую пару пользователь-команда
+и глобальный get_overdue_tasks на каждого пользователя) с одним сгруппированным
+запросом get_daily_summary. Прежняя схема замеряется на выборке пользователей
+и экстраполируется на всех.
+
+Запуск: python scripts/bench_daily_summary.py [--users 10000] [--tasks 1000000]
+"""
+
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from itertools import groupby
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from database import Database, DEADLINE_FORMAT, local_day_start  # noqa: E402
+from scheduler.reminders import _format_daily_summary  # noqa: E402
+
+
+# Заполнение базы: команды по 10 человек, задачи с дедлайнами ±60 дней
+def seed(db: Database, users: int, tasks: int) -> None:
+    """Создаёт пользователей, команды и задачи напрямую через SQL."""
+    rnd = random.Random(42)
+    now = datetime.now()
+    conn = db.conn
+    with db.batch():
+        conn.executemany(
+            "INSERT INTO users (user_id, username, first_name) VALUES (?, ?, ?)",
+            ((uid, f"user{uid}", f"User {uid}") for uid in range(1, users + 1)),
+        )
+        teams = max(users // 10, 1)
+        conn.executemany(
+            "INSERT INTO teams (team_id, name, owner_id, invite_code) VALUES (?, ?, ?, ?)",
+            ((tid, f"Team {tid}", tid * 10 - 9, f"code{tid}") for tid in range(1, teams + 1)),
+        )
+        conn.executemany(
+            "INSERT INTO team_members (team_id, user_id, role) VALUES (?, ?, 'member')",
+            (((uid - 1) // 10 % teams + 1, uid) for uid in range(1, users + 1)),
+        )
+
+        def task_rows():
+            for _ in range(tasks):
+                uid = rnd.randint(1, users)
+                team_id = (uid - 1) // 10 % teams + 1
+                deadline = now + timedelta(minutes=rnd.randint(-60 * 24 * 60, 60 * 24 * 60))
+                status = rnd.choice(("todo", "in_progress", "done", "done", "done"))
+                yield (
+                    team_id, "Задача", uid, uid,
+                    deadline.strftime(DEADLINE_FORMAT), status,
+                )
+
+        conn.executemany(
+            """INSERT INTO tasks (team_id, title, assignee_id, author_id, deadline, status)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            task_rows(),
+        )
+    conn.execute("ANALYZE")
+    conn.commit()
+
+
+# Прежняя схема построения сводки для одного пользователя
+def legacy_summary(db: Database, user_id: int, teams: list) -> int:
+    """Повторяет прежний send_daily_summary без отправки; возвращает число задач."""
+    found = 0
+    for team_info in teams:
+        today_tasks = db.get_tasks_today(team_info["team_id"])
+        found += sum(1 for t in today_tasks if t["assignee_id"] == user_id)
+    overdue = db.get_overdue_tasks()
+    found += len([t for t in overdue if t["assignee_id"] == user_id][:5])
+    return found
+
+
+def main() -> None:
+    """Точка входа бенчмарка."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--tasks", type=int, default=1000000)
+    parser.add_argument("--sample", type=int, default=20)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "bench.db"), pool_size=2)
+        started = time.perf_counter()
+        seed(db, args.users, args.tasks)
+        print(f"Заполнение: {args.users} пользователей, {args.tasks} задач "
+              f"за {time.perf_counter() - started:.1f} с")
+
+        # Прежняя схема: замер на выборке пользователей
+        members = db.get_team_members_with_teams()
+        user_teams: dict = {}
+        for row in members:
+            user_teams.setdefault(row["user_id"], []).append(row)
+        sample = random.Random(1).sample(sorted(user_teams), min(args.sample, len(user_teams)))
+        started = time.perf_counter()
+        for user_id in sample:
+            legacy_summary(db, user_id, user_teams[user_id])
+        per_user = (time.perf_counter() - started) / len(sample)
+        legacy_total = per_user * len(user_teams)
+
+        # Новая схема: один запрос и рендер за один проход
+        started = time.perf_counter()
+        rows = db.get_daily_summary(local_day_start(None), datetime.now())
+        messages = [
+            _format_daily_summary(list(user_rows))
+            for _, user_rows in groupby(rows, key=lambda row: row["assignee_id"])
+        ]
+        grouped_total = time.perf_counter() - started
+        db.close()
+
+    print(f"Прежняя схема:  {legacy_total:10.2f} с (экстраполяция: "
+          f"{per_user * 1000:.1f} мс × {len(user_teams)} пользователей)")
+    print(f"Один запрос:    {grouped_total:10.2f} с ({len(rows)} строк, "
+          f"{len(messages)} сводок)")
+    print(f"Ускорение: x{legacy_total / grouped_total:.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Бенчмарк группового коммита.
+Сравнивает пропускную способность записей при коммите на каждый вызов
+и при групповом коммите AsyncDatabase.
+
+Запуск: python scripts/bench_group_commit.py [--ops 2000] [--concurrency 100]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from database import Database, AsyncDatabase  # noqa: E402
+
+
+# Один прогон: ops записей create_task с заданной конкурентностью
+async def run_case(
+    ops: int, concurrency: int, interval: float, synchronous: str
+) -> tuple[float, int]:
+    """Возвращает (операций в секунду, число коммитов)."""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(
+            os.path.join(tmp, "bench.db"), pool_size=2, synchronous=synchronous
+        )
+        db.add_user(1, "bench", "Bench")
+        team_id = db.create_team("bench", 1, "bench")
+
+        # Считаем фактические коммиты через трассировку SQL
+        commits = 0
+
+        def trace(sql: str) -> None:
+            nonlocal commits
+            if sql.strip().upper() == "COMMIT":
+                commits += 1
+
+        db.conn.set_trace_callback(trace)
+        async_db = AsyncDatabase(
+            db, max_workers=3, group_commit_interval=interval
+        )
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(i: int) -> None:
+            async with semaphore:
+                await async_db.create_task(team_id, f"Задача {i}", 1)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(ops)))
+        elapsed = time.perf_counter() - started
+        async_db.close()
+        return ops / elapsed, commits
+
+
+def main() -> None:
+    """Точка входа бенчмарка."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ops", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--interval-ms", type=float, default=5.0)
+    parser.add_argument("--synchronous", default="FULL")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    per_call = asyncio.run(run_case(args.ops, args.concurrency, 0.0, args.synchronous))
+    grouped = asyncio.run(
+        run_case(args.ops, args.concurrency, args.interval_ms / 1000, args.synchronous)
+    )
+
+    print(f"Операций: {args.ops}, конкурентность: {args.concurrency}, "
+          f"synchronous={args.synchronous}")
+    print(f"Коммит на вызов:  {per_call[0]:10.0f} оп/с, коммитов: {per_call[1]}")
+    print(f"Групповой коммит: {grouped[0]:10.0f} оп/с, коммитов: {grouped[1]}")
+    print(f"Ускорение: x{grouped[0] / per_call[0]:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Бенчмарк полнотекстового поиска /search.
+Заполняет базу задачами с названиями, описаниями, тегами и комментариями
+из словаря с неравномерными частотами слов (индекс tasks_fts строят
+триггеры, как в работе бота) и замеряет задержку search_tasks для
+случайных запросов из одного-двух слов в случайной команде. Слова текста —
+словоформы: токенизатор не приводит их к основе, поэтому частота каждой
+формы, как и в живом тексте, ниже частоты слова.
+Завершается с кодом 1, если 95-й перцентиль превышает цель.
+
+Запуск: python scripts/bench_search.py [--users 10000] [--tasks 1000000]
+"""
+
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from database import Database  # noqa: E402
+
+# Словарь задач: частые слова встречаются в сотнях тысяч задач
+WORDS = (
+    "отчёт клиент сервер релиз дизайн макет договор счёт оплата встреча "
+    "презентация тест ошибка баг база данные миграция бэкап деплой сборка "
+    "документация инструкция обзор ревью код задача проект план бюджет "
+    "закупка поставка склад доставка заказ сайт лендинг реклама рассылка "
+    "письмо звонок созвон интервью найм вакансия обучение курс доклад "
+    "конференция аналитика метрика дашборд воронка конверсия продажи "
+    "партнёр интеграция оплаты подписка тариф мобильный приложение "
+    "android ios api webhook бот уведомления напоминание календарь"
+).split()
+ENDINGS = ("", "а", "у", "ом", "ы", "ов", "ам")
+
+
+# Заполнение базы: команды по 10 человек, у каждой задачи 3–12 слов текста
+def seed(db: Database, users: int, tasks: int) -> None:
+    """Создаёт пользователей, команды, задачи и комментарии напрямую через SQL."""
+    rnd = random.Random(42)
+    # Частота слова обратно пропорциональна его рангу (закон Ципфа)
+    weights = [1 / rank for rank in range(1, len(WORDS) + 1)]
+
+    def text(low: int, high: int) -> str:
+        words = rnd.choices(WORDS, weights, k=rnd.randint(low, high))
+        return " ".join(word + rnd.choice(ENDINGS) for word in words)
+
+    conn = db.conn
+    with db.batch():
+        conn.executemany(
+            "INSERT INTO users (user_id, username, first_name) VALUES (?, ?, ?)",
+            ((uid, f"user{uid}", f"User {uid}") for uid in range(1, users + 1)),
+        )
+        teams = max(users // 10, 1)
+        conn.executemany(
+            "INSERT INTO teams (team_id, name, owner_id, invite_code) VALUES (?, ?, ?, ?)",
+            ((tid, f"Team {tid}", tid * 10 - 9, f"code{tid}") for tid in range(1, teams + 1)),
+        )
+        conn.executemany(
+            "INSERT INTO team_members (team_id, user_id, role) VALUES (?, ?, 'member')",
+            (((uid - 1) // 10 % teams + 1, uid) for uid in range(1, users + 1)),
+        )
+
+        def task_rows():
+            for _ in range(tasks):
+                uid = rnd.randint(1, users)
+                team_id = (uid - 1) // 10 % teams + 1
+                yield (
+                    team_id, text(2, 5).capitalize(), text(0, 6) or None,
+                    f"#{rnd.choice(WORDS)}" if rnd.random() < 0.3 else None, uid, uid,
+                )
+
+        conn.executemany(
+            """INSERT INTO tasks (team_id, title, description, tags, assignee_id, author_id)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            task_rows(),
+        )
+        # Комментарии у каждой пятой задачи
+        conn.executemany(
+            "INSERT INTO comments (task_id, user_id, text) VALUES (?, 1, ?)",
+            ((task_id, text(3, 8)) for task_id in range(1, tasks + 1, 5)),
+        )
+    conn.execute("INSERT INTO tasks_fts (tasks_fts) VALUES ('optimize')")
+    conn.execute("ANALYZE")
+    conn.commit()
+
+
+def main() -> None:
+    """Точка входа бенчмарка."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--tasks", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--target-ms", type=float, default=10.0)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "bench.db"), pool_size=2)
+        started = time.perf_counter()
+        seed(db, args.users, args.tasks)
+        print(f"Заполнение: {args.users} пользователей, {args.tasks} задач "
+              f"за {time.perf_counter() - started:.1f} с")
+
+        rnd = random.Random(1)
+        teams = max(args.users // 10, 1)
+        timings, found = [], 0
+        for _ in range(args.queries):
+            query = " ".join(
+                word + rnd.choice(ENDINGS) for word in rnd.sample(WORDS, rnd.randint(1, 2))
+            )
+            started = time.perf_counter()
+            found += len(db.search_tasks(rnd.randint(1, teams), query))
+            timings.append((time.perf_counter() - started) * 1000)
+        db.close()
+
+    timings.sort()
+    p50, p95, p99 = (timings[int(len(timings) * q) - 1] for q in (0.5, 0.95, 0.99))
+    print(f"Запросов: {args.queries}, найдено в среднем {found / args.queries:.1f}")
+    print(f"Задержка, мс: p50 {p50:.2f}, p95 {p95:.2f}, p99 {p99:.2f}, "
+          f"макс. {timings[-1]:.2f}")
+    if p95 > args.target_ms:
+        print(f"p95 превышает цель {args.target_ms:.0f} мс")
+        sys.exit(1)
+    print(f"p95 в пределах цели {args.target_ms:.0f} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Проверка единого смысла дедлайна.
+Дедлайн хранится в местном времени исполнителя. Для исполнителей из разных
+часовых поясов создаются задачи с дедлайном чуть раньше и чуть позже их
+текущего местного времени; для каждой сравниваются время напоминания
+«дедлайн наступил» в куче ReminderTimer и статус просрочки в
+get_overdue_tasks, /stats, /mystats и карточке задачи. Завершается с
+кодом 1, если они расходятся.
+
+Запуск: python scripts/check_deadline_timezones.py
+"""
+
+import logging
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytz
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from database import AsyncDatabase, Database, DEADLINE_FORMAT, local_now  # noqa: E402
+from scheduler.reminders import ReminderTimer  # noqa: E402
+from utils.formatters import format_task_message  # noqa: E402
+
+# Пояса исполнителей: сдвинуты от UTC в обе стороны на много часов
+TIMEZONES = ("Pacific/Kiritimati", "Pacific/Pago_Pago", "Asia/Kolkata", "Europe/Moscow")
+
+# Дедлайн относительно местного «сейчас» исполнителя
+SHIFT = timedelta(minutes=5)
+
+
+def main() -> None:
+    """Точка входа проверки."""
+    logging.disable(logging.WARNING)
+    db = Database(":memory:")
+    db.add_user(1, "owner", "Owner")
+    team_id = db.create_team("Team", 1, "code")
+    db.set_team_reminder_offsets(team_id, [0])
+
+    tasks = {}
+    for uid, timezone in enumerate(TIMEZONES, 2):
+        db.add_user(uid, f"user{uid}", f"User {uid}")
+        db.add_team_member(team_id, uid)
+        db.set_user_timezone(uid, timezone)
+        now = local_now(timezone)
+        for past in (True, False):
+            deadline = (now - SHIFT if past else now + SHIFT).strftime(DEADLINE_FORMAT)
+            task_id = db.create_task(
+                team_id, f"{timezone} {'прошёл' if past else 'впереди'}", 1,
+                assignee_id=uid, deadline=deadline,
+            )
+            tasks[task_id] = (uid, timezone, past)
+
+    # Время напоминания «дедлайн наступил» — как его считает таймер
+    timer = ReminderTimer(AsyncDatabase(db))
+    for row in db.get_reminder_schedule(timer._since()):
+        timer._push_task(row)
+    utc_now = datetime.now(pytz.utc).replace(tzinfo=None)
+    reminder_due = {task_id: fire_at <= utc_now for fire_at, task_id, *_ in timer._heap}
+
+    overdue_ids = {row["task_id"] for row in db.get_overdue_tasks()}
+    user_stats = db.get_stats_for_users(team_id, [uid for uid, _, _ in tasks.values()])
+    team_overdue = db.get_team_stats(team_id)["overdue"]
+
+    errors = []
+    for task_id, (uid, timezone, past) in tasks.items():
+        view = db.get_task_view(task_id, 1)
+        card_overdue = "ПРОСРОЧЕНО" in format_task_message(dict(view["task"]))
+        checks = {
+            "напоминание": reminder_due.get(task_id),
+            "get_overdue_tasks": task_id in overdue_ids,
+            "карточка": card_overdue,
+        }
+        for name, value in checks.items():
+            if value != past:
+                errors.append(
+                    f"{timezone}: дедлайн {'прошёл' if past else 'впереди'}, "
+                    f"а {name}: {value}"
+                )
+    # У каждого исполнителя прошёл ровно один дедлайн из двух
+    for uid, timezone in enumerate(TIMEZONES, 2):
+        overdue = user_stats[uid]["overdue"]
+        if overdue != 1:
+            errors.append(f"{timezone}: /mystats: просрочено {overdue} вместо 1")
+    if team_overdue != len(TIMEZONES):
+        errors.append(f"/stats: просрочено {team_overdue} вместо {len(TIMEZONES)}")
+    db.close()
+
+    for error in errors:
+        print(error)
+    print(f"Проверено задач: {len(tasks)}, расхождений: {len(errors)}")
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+Регрессионная проверка планов запросов.
+Вызывает методы Database на заполненной базе, собирает выполненный SQL
+и прогоняет каждый запрос через EXPLAIN QUERY PLAN. Завершается с кодом 1,
+если какой-либо запрос читает таблицу полным сканированием или какой-либо
+публичный метод Database не вызван и не исключён явно (NOT_QUERIES).
+
+Запуск: python scripts/check_query_plans.py
+"""
+
+import functools
+import inspect
+import logging
+import os
+import re
+import sys
+from datetime import datetime, timedelta
+from typing import Any, Callable
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from database import Database  # noqa: E402
+
+# Строковые и числовые литералы в SQL
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+# Вызовы, всем запросам которых полное сканирование положено по смыслу;
+# разрешаются ровно их операторы (после нормализации, см. normalize)
+ALLOWED_FULL_SCAN_CALLS: dict[str, Callable[[Database], Any]] = {
+    # Полная загрузка таймера напоминаний: обход команд с поиском задач по
+    # индексу (выборка по task_ids проверяется как обычный запрос)
+    "get_reminder_schedule": lambda db: db.get_reminder_schedule(
+        datetime.now().isoformat()
+    ),
+    # Обход всех участников всех команд
+    "get_team_members_with_teams": lambda db: db.get_team_members_with_teams(),
+    # Пересчёт счётчиков с нуля
+    "rebuild_counters": lambda db: db.rebuild_counters(),
+}
+
+
+# Публичные методы Database без запросов к данным: вызывать их в exercise
+# не требуется; любой другой метод без вызова — ошибка проверки
+NOT_QUERIES = frozenset({
+    # Подписка на события изменений
+    "add_task_listener",
+    "add_outbox_listener",
+    "remove_listener",
+    # Управление транзакциями и соединениями
+    "batch",
+    "run_batch",
+    "close",
+})
+
+
+# Заполнение базы тестовыми данными
+def seed(db: Database) -> None:
+    """Создаёт пользователей, команды, задачи и комментарии."""
+    now = datetime.now()
+    for uid in range(1, 21):
+        db.add_user(uid, f"user{uid}", f"User {uid}")
+    for team in range(1, 4):
+        team_id = db.create_team(f"Team {team}", team, f"code{team}")
+        for uid in range(4, 21, team):
+            db.add_team_member(team_id, uid)
+        for i in range(200):
+            deadline = (now + timedelta(hours=i - 100)).isoformat()
+            task_id = db.create_task(
+                team_id, f"Задача {i}", team,
+                assignee_id=4 + i % 17, deadline=deadline,
+            )
+            if i % 5 == 0:
+                db.update_task_status(task_id, "done")
+            if i % 7 == 0:
+                db.add_comment(task_id, team, "Комментарий")
+    db.conn.execute("ANALYZE")
+    db.conn.commit()
+
+
+# Вызовы всех методов чтения и записи Database
+def exercise(db: Database) -> None:
+    """Прогоняет публичный API Database с типичными аргументами."""
+    now = datetime.now()
+    db.add_user(21, "user21", "User 21")
+    db.add_user(5, "user5", "User 5 renamed")
+    db.create_team("Team 4", 21, "code4")
+    db.create_task(1, "Новая задача", 1, assignee_id=5, deadline=now.isoformat())
+    db.get_user(5)
+    db.get_user_timezone(5)
+    db.set_user_timezone(5, "UTC")
+    db.get_team(1)
+    db.get_team_by_invite("code1")
+    db.get_user_teams(5)
+    db.get_user_active_team(5)
+    db.set_active_team(5, 2)
+    db.get_team_members(1)
+    db.get_member_role(1, 5)
+    db.get_team_member_count(1)
+    db.get_task(10)
+    db.get_user_tasks(5, 1)
+    db.get_user_tasks(5, 1, status_filter="todo")
+    db.get_team_tasks(1)
+    db.get_team_tasks(1, status_filter="done")
+    db.get_team_tasks(1, limit=16)
+    db.get_team_tasks(1, limit=16, after=30)
+    db.get_team_tasks(1, limit=16, before=30, list_view=True)
+    db.get_user_tasks(5, 1, limit=16, after=30)
+    db.get_user_tasks(5, 1, limit=16, before=30)
+    db.get_tasks_today(1)
+    db.get_tasks_today(1, "Asia/Tokyo")
+    db.get_tasks_week(1, "America/New_York", list_view=True)
+    db.update_task_status(11, "in_progress")
+    db.update_task_status(15, "done", notify=lambda task_id: [(5, f"#{task_id}", "✅")])
+    db.update_task(12, title="Новое название")
+    db.get_active_tasks_count(1)
+    db.search_tasks(1, "Задача 12")
+    db.search_task_titles(1, "зад")
+    db.search_task_titles(1, "")
+    db.add_comment(12, 1, "Ещё комментарий")
+    db.add_comment(12, 1, "С уведомлением", notify=lambda _: [(5, "💬", "💬"), (6, "💬", "💬")])
+    db.get_task_comments(12)
+    db.get_task_view(12, 5)
+    db.get_display_names([4, 5, 6])
+    db.get_reminder_schedule(now.isoformat())
+    db.get_reminder_schedule(now.isoformat(), [12, 14])
+    db.claim_reminders([(12, "24h", 5, "Напоминание"), (14, "3h", 6, "Напоминание")])
+    db.get_overdue_tasks()
+    db.get_overdue_tasks(list_view=True)
+    db.get_team_members_with_teams()
+    db.get_daily_summary(now.replace(hour=0, minute=0, second=0, microsecond=0), now)
+    db.get_daily_summary(
+        now.replace(hour=0, minute=0, second=0, microsecond=0), now, ["UTC", "Etc/UTC"]
+    )
+    db.get_team_stats(1)
+    db.get_user_stats(5, 1)
+    db.get_stats_for_users(1, [5, 6, 7])
+    db.update_subscription(1, "pro")
+    db.set_team_reminder_offsets(1, [1440, 60, 0])
+    db.delete_task(13)
+    db.remove_team_member(1, 20)
+    db.add_team_member(1, 20, notify=lambda _: [(5, "👋", None)])
+    db.enqueue_messages([("summary:test:5", 5, "Сводка")])
+    rows = db.claim_outbox(10, now + timedelta(minutes=5))
+    db.finish_outbox(
+        [rows[0]["message_id"]],
+        [(rows[1]["message_id"], "timeout", now)],
+        [(rows[2]["message_id"], "blocked")],
+    )
+    db.get_next_outbox_attempt()
+    db.purge_outbox(now + timedelta(days=1))
+    db.rebuild_counters()
+    db.save_dialog_state([(5, '{"comment_task_id": 12}'), (6, None)], [("new_task", "[5, 5]", "1")])
+    db.get_user_data(5)
+    db.get_conversations("new_task")
+    db.acquire_lease("leader", "test", timedelta(seconds=15))
+    db.release_lease("leader", "test")
+    db.poll_external_changes()
+
+
+# Публичные методы Database
+def public_methods() -> set[str]:
+    """Имена публичных методов класса Database."""
+    return {
+        name for name, _ in inspect.getmembers(Database, inspect.isfunction)
+        if not name.startswith("_")
+    }
+
+
+# Учёт вызовов публичных методов
+def record_calls(db: Database) -> set[str]:
+    """
+    Оборачивает публичные методы db (кроме NOT_QUERIES); возвращает
+    множество, в которое записываются имена вызванных методов.
+    """
+    called: set[str] = set()
+
+    def wrap(name: str, method: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(method)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            called.add(name)
+            return method(*args, **kwargs)
+        return wrapper
+
+    for name in public_methods() - NOT_QUERIES:
+        setattr(db, name, wrap(name, getattr(db, name)))
+    return called
+
+
+# Поиск полных сканирований в плане запроса
+def full_scans(db: Database, sql: str) -> list[str]:
+    """Возвращает строки плана с полным сканированием таблицы."""
+    plan = db.conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+    # Материализованные CTE (например, VALUES) и подзапросы-сопрограммы —
+    # не таблицы базы
+    ctes = {
+        row["detail"].split()[1] for row in plan
+        if row["detail"].startswith(("MATERIALIZE ", "CO-ROUTINE "))
+    }
+    scans = []
+    for row in plan:
+        detail = row["detail"]
+        # SCAN CONSTANT ROW(S) и сканирование подзапросов таблиц не читают
+        if not detail.startswith("SCAN ") or "CONSTANT ROW" in detail:
+            continue
+        if " VIRTUAL TABLE " in detail or detail.startswith("SCAN (subquery"):
+            continue
+        if detail.split()[1] in ctes:
+            continue
+        scans.append(detail)
+    return scans
+
+
+# Операторы, выполненные вызовами ALLOWED_FULL_SCAN_CALLS
+def allowed_statements(db: Database) -> set[str]:
+    """Нормализованный SQL разрешённых вызовов."""
+    statements: list[str] = []
+    db.conn.set_trace_callback(statements.append)
+    for call in ALLOWED_FULL_SCAN_CALLS.values():
+        call(db)
+    db.conn.set_trace_callback(None)
+    return {normalize(sql) for sql in statements}
+
+
+# SQL без значений параметров и различий в пробелах
+def normalize(sql: str) -> str:
+    """
+    Заменяет строковые и числовые литералы на «?» (trace_callback отдаёт
+    SQL с подставленными параметрами) и схлопывает пробельные символы.
+    """
+    return " ".join(LITERAL_RE.sub("?", sql).split())
+
+
+def main() -> int:
+    """Точка входа проверки."""
+    logging.disable(logging.WARNING)
+    db = Database(":memory:", coalesce_window=60, coalesce_max_delay=300)
+    seed(db)
+    allowed = allowed_statements(db)
+
+    called = record_calls(db)
+    statements: list[str] = []
+    db.conn.set_trace_callback(statements.append)
+    exercise(db)
+    db.conn.set_trace_callback(None)
+
+    # Метод без вызова в exercise не проверяется — это ошибка покрытия
+    failures = 0
+    for name in sorted(public_methods() - NOT_QUERIES - called):
+        failures += 1
+        print(f"❌ Метод не вызывается в exercise(): Database.{name}")
+
+    checked = set()
+    for sql in statements:
+        head = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ""
+        if head not in ("SELECT", "UPDATE", "DELETE", "INSERT", "WITH") or sql in checked:
+            continue
+        checked.add(sql)
+        if normalize(sql) in allowed:
+            continue
+        scans = full_scans(db, sql)
+        if scans:
+            failures += 1
+            print("❌ Полное сканирование:", "; ".join(scans))
+            print("   " + " ".join(sql.split())[:300])
+
+    print(f"Проверено запросов: {len(checked)}, ошибок: {failures}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""
+Проверка границ /today и /week.
+Создаёт задачи с дедлайнами на границах суток и недели в часовом поясе
+пользователя и проверяет, какие из них возвращают get_tasks_today и
+get_tasks_week: сегодня — [полночь, полночь следующего дня), неделя —
+сегодня и следующие 7 дней целиком. Завершается с кодом 1 при ошибке.
+
+Запуск: python scripts/check_task_windows.py
+"""
+
+import logging
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytz
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from database import Database  # noqa: E402
+
+# Часовые пояса проверки: None — время сервера; остальные выбраны так,
+# чтобы их дата чаще всего отличалась от даты сервера
+TIMEZONES = (None, "Pacific/Kiritimati", "Pacific/Pago_Pago", "Asia/Kolkata")
+
+# Дедлайн относительно местной полуночи: (название, смещение, в /today, в /week)
+CASES = (
+    ("вчера 23:59:59", timedelta(seconds=-1), False, False),
+    ("сегодня 00:00:00", timedelta(0), True, True),
+    ("сегодня 23:59:59", timedelta(days=1, seconds=-1), True, True),
+    ("завтра 00:00:00", timedelta(days=1), False, True),
+    ("последний день недели 23:59:59", timedelta(days=8, seconds=-1), False, True),
+    ("после недели 00:00:00", timedelta(days=8), False, False),
+)
+
+
+# Местная полночь, посчитанная независимо от local_day_start
+def expected_day_start(timezone: str | None) -> datetime:
+    """Полночь сегодняшнего дня в поясе timezone (без tzinfo)."""
+    now = datetime.now()
+    if timezone:
+        now = datetime.now(pytz.timezone(timezone)).replace(tzinfo=None)
+    return now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+# Проверка одного пояса в отдельной команде
+def check_timezone(db: Database, team_id: int, timezone: str | None) -> list[str]:
+    """Возвращает описания ошибок для пояса timezone."""
+    start = expected_day_start(timezone)
+    names = {}
+    for name, offset, _, _ in CASES:
+        deadline = (start + offset).strftime("%Y-%m-%dT%H:%M:%S")
+        names[db.create_task(team_id, name, 1, deadline=deadline)] = name
+    # Выполненная задача в пределах дня в выборки не попадает
+    done_id = db.create_task(team_id, "выполнена", 1, deadline=start.isoformat())
+    db.update_task_status(done_id, "done")
+
+    today = {names.get(t["task_id"], "выполнена") for t in db.get_tasks_today(team_id, timezone)}
+    week = {names.get(t["task_id"], "выполнена") for t in db.get_tasks_week(team_id, timezone)}
+
+    errors = []
+    for name, _, in_today, in_week in CASES:
+        for window, found, expected in (("/today", today, in_today), ("/week", week, in_week)):
+            if (name in found) != expected:
+                errors.append(
+                    f"{timezone or 'сервер'}: {name} {'не ' if expected else ''}"
+                    f"попала в {window}"
+                )
+    for window, found in (("/today", today), ("/week", week)):
+        if "выполнена" in found:
+            errors.append(f"{timezone or 'сервер'}: выполненная задача попала в {window}")
+    return errors
+
+
+def main() -> None:
+    """Точка входа проверки."""
+    logging.disable(logging.INFO)
+    db = Database(":memory:")
+    db.add_user(1, "user1", "User 1")
+
+    errors = []
+    for i, timezone in enumerate(TIMEZONES, 1):
+        team_id = db.create_team(f"Team {i}", 1, f"code{i}")
+        # Полночь могла наступить во время проверки — повторяем для нового дня
+        for _ in range(2):
+            day = expected_day_start(timezone)
+            found = check_timezone(db, team_id, timezone)
+            if expected_day_start(timezone) == day:
+                break
+            db.conn.execute("DELETE FROM tasks WHERE team_id = ?", (team_id,))
+            db.conn.commit()
+        errors += found
+    db.close()
+
+    for error in errors:
+        print(error)
+    print(f"Проверено поясов: {len(TIMEZONES)}, ошибок: {len(errors)}")
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Поддельный Bot API для проверки бота без Telegram.
+Отвечает на методы, которые использует бот (getMe, getUpdates, sendMessage,
+editMessageText и т. д.), запоминает отправленные сообщения и выдаёт
+обновления, добавленные через POST /inject — через getUpdates или, если бот
+вызвал setWebhook, POST-запросом на его webhook.
+
+Запуск: python scripts/fake_bot_api.py [--port 8081]
+В .env бота: TELEGRAM_API_BASE_URL=http://127.0.0.1:8081
+
+  curl -X POST localhost:8081/inject -d '{"message": {...}}'   — новое обновление
+  curl localhost:8081/sent                                   — отправленные сообщения
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+from typing import Any
+
+from aiohttp import ClientSession, web
+
+logger = logging.getLogger("fake_bot_api")
+
+BOT_USER = {
+    "id": 1000000001,
+    "is_bot": True,
+    "first_name": "TaskBot",
+    "username": "taskbot_test_bot",
+    "can_join_groups": True,
+    "can_read_all_group_messages": False,
+    "supports_inline_queries": True,
+}
+
+
+class FakeBotApi:
+    """Состояние поддельного Bot API: очередь обновлений и отправленные сообщения."""
+
+    def __init__(self) -> None:
+        self.updates: list[dict[str, Any]] = []
+        self.next_update_id = 1
+        self.new_updates = asyncio.Condition()
+        self.sent: list[dict[str, Any]] = []
+        self.next_message_id = 1
+        self.webhook_url = ""
+        self.webhook_secret = ""
+        self.session: ClientSession | None = None
+
+    # Разбор параметров: PTB шлёт форму, где не-строки закодированы в JSON
+    @staticmethod
+    async def params(request: web.Request) -> dict[str, Any]:
+        """Параметры вызова метода из формы, JSON или строки запроса."""
+        if request.content_type == "application/json":
+            return await request.json()
+        raw = dict(request.query)
+        raw.update(await request.post())
+        params = {}
+        for key, value in raw.items():
+            try:
+                params[key] = json.loads(value)
+            except (TypeError, ValueError):
+                params[key] = value
+        return params
+
+    def message(self, chat_id: Any, text: str, message_id: int | None = None) -> dict[str, Any]:
+        """Объект Message, который вернул бы Telegram."""
+        if message_id is None:
+            message_id = self.next_message_id
+            self.next_message_id += 1
+        chat_type = "private" if int(chat_id) > 0 else "group"
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": chat_type},
+            "from": BOT_USER,
+            "text": text,
+        }
+
+    async def handle_method(self, request: web.Request) -> web.Response:
+        """Вызов метода Bot API: /bot<token>/<метод>."""
+        method = request.match_info["method"].lower()
+        params = await self.params(request)
+        result: Any = True
+        if method == "getme":
+            result = BOT_USER
+        elif method == "getupdates":
+            result = await self.get_updates(params)
+        elif method in ("sendmessage", "editmessagetext"):
+            message = self.message(
+                params.get("chat_id", 0), params.get("text", ""), params.get("message_id")
+            )
+            self.sent.append({"method": method, **params})
+            result = message
+        elif method == "setwebhook":
+            self.webhook_url = params.get("url", "")
+            self.webhook_secret = params.get("secret_token", "")
+            asyncio.create_task(self.push_to_webhook())
+        elif method == "deletewebhook":
+            self.webhook_url = ""
+        elif method == "getwebhookinfo":
+            result = {"url": self.webhook_url, "has_custom_certificate": False,
+                      "pending_update_count": len(self.updates)}
+        else:
+            self.sent.append({"method": method, **params})
+        return web.json_response({"ok": True, "result": result})
+
+    async def get_updates(self, params: dict[str, Any]) -> list[dict[str, Any]]:
+        """getUpdates: подтверждение по offset и ожидание до timeout секунд."""
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+        async with self.new_updates:
+            self.updates = [u for u in self.updates if u["update_id"] >= offset]
+            if not self.updates and timeout:
+                try:
+                    await asyncio.wait_for(self.new_updates.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            return self.updates[:limit]
+
+    async def handle_inject(self, request: web.Request) -> web.Response:
+        """POST /inject: добавляет обновление (или список) в очередь."""
+        data = await request.json()
+        async with self.new_updates:
+            for update in data if isinstance(data, list) else [data]:
+                update.setdefault("update_id", self.next_update_id)
+                self.next_update_id = max(self.next_update_id, update["update_id"]) + 1
+                self.updates.append(update)
+            self.new_updates.notify_all()
+        if self.webhook_url:
+            asyncio.create_task(self.push_to_webhook())
+        return web.json_response({"ok": True})
+
+    async def push_to_webhook(self) -> None:
+        """Доставляет очередь на webhook бота, как это делает Telegram."""
+        async with self.new_updates:
+            while self.updates and self.webhook_url:
+                update = self.updates[0]
+                try:
+                    async with self.session.post(
+                        self.webhook_url, json=update,
+                        headers={"X-Telegram-Bot-Api-Secret-Token": self.webhook_secret},
+                    ) as response:
+                        if response.status != 200:
+                            logger.warning("Webhook ответил %s, повтор", response.status)
+                            await asyncio.sleep(1)
+                            continue
+                except Exception as e:
+                    logger.warning("Webhook недоступен: %s, повтор", e)
+                    await asyncio.sleep(1)
+                    continue
+                self.updates.pop(0)
+
+    async def handle_sent(self, request: web.Request) -> web.Response:
+        """GET /sent: отправленные ботом сообщения и вызовы."""
+        return web.json_response(self.sent)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(message)s")
+
+    api = FakeBotApi()
+
+    async def on_startup(app: web.Application) -> None:
+        api.session = ClientSession()
+
+    async def on_cleanup(app: web.Application) -> None:
+        await api.session.close()
+
+    app = web.Application()
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    app.router.add_route("*", "/bot{token}/{method}", api.handle_method)
+    app.router.add_post("/inject", api.handle_inject)
+    app.router.add_get("/sent", api.handle_sent)
+    web.run_app(app, host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Отправка записанных обновлений Telegram в локальный сервер webhook.
+Позволяет проверить режим webhook без Telegram: каждый файл — JSON одного
+Update (или массив Update), запросы идут с секретным токеном из .env.
+
+Запуск: python scripts/post_update.py update.json [...] [--url http://127.0.0.1:8080/telegram]
+"""
+
+import argparse
+import json
+import os
+import sys
+import urllib.error
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from config import WEBHOOK_LISTEN, WEBHOOK_PATH, WEBHOOK_PORT, WEBHOOK_SECRET  # noqa: E402
+from webhook import SECRET_HEADER  # noqa: E402
+
+
+# Отправка одного обновления
+def post_update(url: str, secret: str, update: dict) -> int:
+    """POST-запрос с обновлением; возвращает HTTP-статус ответа."""
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(update).encode("utf-8"),
+        headers={"Content-Type": "application/json", SECRET_HEADER: secret},
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("files", nargs="+", help="JSON-файлы с Update")
+    parser.add_argument(
+        "--url", default=f"http://{WEBHOOK_LISTEN}:{WEBHOOK_PORT}{WEBHOOK_PATH}"
+    )
+    parser.add_argument("--secret", default=WEBHOOK_SECRET)
+    args = parser.parse_args()
+
+    failed = 0
+    for path in args.files:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        for update in data if isinstance(data, list) else [data]:
+            status = post_update(args.url, args.secret, update)
+            print(f"{path}: update_id={update.get('update_id')} → HTTP {status}")
+            failed += status != 200
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,10 +3,12 @@
 Красивый вывод задач, списков, статистики в HTML-разметке.
 """
 
+import html
 from datetime import datetime
 from typing import Any
 
 from config import PRIORITY_EMOJI, STATUS_EMOJI, STATUS_TEXT, PRIORITY_TEXT
+from database import TaskListItem, local_now
 
 
 # Форматирование карточки задачи
@@ -17,6 +19,8 @@ def format_task_message(
 ) -> str:
     """
     Форматирует полную карточку задачи для отображения в чате.
+    Время до дедлайна считается в часовом поясе исполнителя
+    (task["assignee_timezone"]), в котором хранится дедлайн.
     Возвращает строку в HTML-разметке.
     """
     priority = task.get("priority", "medium")
@@ -29,7 +33,7 @@ def format_task_message(
         try:
             deadline_dt = datetime.fromisoformat(str(task["deadline"]))
             deadline_str = deadline_dt.strftime("%d.%m.%Y %H:%M")
-            now = datetime.now()
+            now = local_now(task.get("assignee_timezone"))
             diff = deadline_dt - now
             # Определяем оставшееся время
             if diff.total_seconds() < 0:
@@ -79,22 +83,33 @@ def format_task_message(
     return msg
 
 
+# Форматирование имени пользователя для карточки задачи
+def format_user_name(user: Any, fallback: str = "—") -> str:
+    """Имя вида «Имя @username» из строки с first_name и username."""
+    if not user:
+        return fallback
+    name = user["first_name"] or ""
+    uname = f"@{user['username']}" if user["username"] else ""
+    return f"{name} {uname}".strip() or fallback
+
+
 # Форматирование списка задач
 def format_tasks_list(
-    tasks: list[dict[str, Any]], title: str = "📋 Задачи"
+    tasks: list[TaskListItem], title: str = "📋 Задачи", paged: bool = False
 ) -> str:
     """
     Форматирует список задач для отображения в чате.
-    Группирует по статусу.
+    Группирует по статусу. paged — tasks лишь страница списка: без общего
+    числа задач и без сокращения выполненных (размер уже ограничен страницей).
     """
     # Проверяем пустой ли список
     if not tasks:
         return f"{title}\n\n<i>Список пуст</i> 🤷‍♂️"
 
-    msg = f"{title} ({len(tasks)})\n\n"
+    msg = f"{title}\n\n" if paged else f"{title} ({len(tasks)})\n\n"
 
     # Группируем задачи по статусу
-    groups: dict[str, list] = {
+    groups: dict[str, list[TaskListItem]] = {
         "todo": [],
         "in_progress": [],
         "done": [],
@@ -102,7 +117,7 @@ def format_tasks_list(
     }
     # Проходим по задачам и распределяем по группам
     for task in tasks:
-        status = task.get("status", "todo")
+        status = task.status or "todo"
         if status in groups:
             groups[status].append(task)
 
@@ -121,32 +136,49 @@ def format_tasks_list(
 
     if groups["done"]:
         msg += f"✅ <b>Выполнено:</b>\n"
-        # Показываем последние 5 выполненных задач
-        for task in groups["done"][:5]:
+        # Показываем последние 5 выполненных задач (на странице — все)
+        shown = groups["done"] if paged else groups["done"][:5]
+        for task in shown:
             msg += _format_task_line(task)
-        if len(groups["done"]) > 5:
-            msg += f"   <i>...и ещё {len(groups['done']) - 5}</i>\n"
+        if len(groups["done"]) > len(shown):
+            msg += f"   <i>...и ещё {len(groups['done']) - len(shown)}</i>\n"
         msg += "\n"
 
     return msg.rstrip()
 
 
+# Форматирование результатов поиска задач
+def format_search_results(tasks: list[TaskListItem], query: str) -> str:
+    """
+    Форматирует результаты /search: задачи в порядке релевантности,
+    без группировки по статусу — статус показывается значком в строке.
+    """
+    title = f"🔍 <b>Поиск:</b> {html.escape(query)}"
+    if not tasks:
+        return f"{title}\n\n<i>Ничего не найдено</i> 🤷‍♂️"
+
+    msg = f"{title}\n\n"
+    for task in tasks:
+        msg += _format_task_line(task, STATUS_EMOJI.get(task.status or "todo", "⚪️"))
+    msg += "\n📄 Подробнее: <code>/task [ID]</code>"
+    return msg
+
+
 # Форматирование одной строки задачи в списке
-def _format_task_line(task: dict[str, Any]) -> str:
+def _format_task_line(task: TaskListItem, marker: str = "•") -> str:
     """Форматирует одну строку задачи для отображения в списке."""
-    priority = task.get("priority", "medium")
-    p_emoji = PRIORITY_EMOJI.get(priority, "⚪️")
+    p_emoji = PRIORITY_EMOJI.get(task.priority or "medium", "⚪️")
 
     deadline_str = ""
     # Проверяем наличие дедлайна
-    if task.get("deadline"):
+    if task.deadline:
         try:
-            dl = datetime.fromisoformat(str(task["deadline"]))
+            dl = datetime.fromisoformat(str(task.deadline))
             deadline_str = f" → {dl.strftime('%d.%m %H:%M')}"
         except (ValueError, TypeError):
             pass
 
-    return f"  • #{task['task_id']} {p_emoji} {task['title']}{deadline_str}\n"
+    return f"  {marker} #{task.task_id} {p_emoji} {task.title}{deadline_str}\n"
 
 
 # Форматирование статистики команды
@@ -217,6 +249,20 @@ def format_team_info(
     return msg
 
 
+# Форматирование смещения напоминания
+def format_reminder_offset(minutes: int) -> str:
+    """Форматирует смещение напоминания: «за 3 ч», «за 1 ч 30 мин», «в момент дедлайна»."""
+    if minutes == 0:
+        return "в момент дедлайна"
+    hours, mins = divmod(minutes, 60)
+    parts = []
+    if hours:
+        parts.append(f"{hours} ч")
+    if mins:
+        parts.append(f"{mins} мин")
+    return "за " + " ".join(parts)
+
+
 # Форматирование справочного сообщения
 def format_help_message() -> str:
     """Форматирует сообщение справки по всем командам."""
@@ -230,16 +276,20 @@ def format_help_message() -> str:
         "<b>👥 Команда:</b>\n"
         "/createteam — Создать команду\n"
         "/team — Моя команда\n"
+        "/teams — Сменить команду\n"
         "/invite — Инвайт-код\n"
         "/join — Присоединиться\n"
-        "/leave — Покинуть команду\n\n"
+        "/leave — Покинуть команду\n"
+        "/reminders — Напоминания о дедлайнах\n\n"
         "<b>📝 Задачи:</b>\n"
         "/newtask — Новая задача\n"
         "/mytasks — Мои задачи\n"
         "/alltasks — Все задачи\n"
         "/today — На сегодня\n"
         "/week — На неделю\n"
-        "/task [ID] — Детали задачи\n\n"
+        "/search [текст] — Поиск задач\n"
+        "/task [ID] — Детали задачи\n"
+        "@бот [текст] — Отправить задачу в любой чат\n\n"
         "<b>📈 Аналитика:</b>\n"
         "/stats — Статистика команды\n"
         "/mystats — Моя статистика\n"
@@ -187,20 +187,24 @@ def get_subscription_keyboard() -> InlineKeyboardMarkup:
 
 # Клавиатура навигации списка задач
 def get_tasks_list_keyboard(
-    page: int = 0, total_pages: int = 1
+    scope: str, first_id: int | None = None, last_id: int | None = None
 ) -> InlineKeyboardMarkup:
-    """Клавиатура пагинации для длинных списков задач."""
+    """
+    Клавиатура пагинации для длинных списков задач.
+    first_id / last_id — первая и последняя задачи страницы, если до (после)
+    них есть ещё задачи: от них листается список scope.
+    """
     keyboard = []
     nav_row = []
     # Проверяем есть ли предыдущая страница
-    if page > 0:
+    if first_id is not None:
         nav_row.append(
-            InlineKeyboardButton("⬅️ Back", callback_data=f"page_{page - 1}")
+            InlineKeyboardButton("⬅️ Back", callback_data=f"page_{scope}_p{first_id}")
         )
     # Проверяем есть ли следующая страница
-    if page < total_pages - 1:
+    if last_id is not None:
         nav_row.append(
-            InlineKeyboardButton("➡️ Next", callback_data=f"page_{page + 1}")
+            InlineKeyboardButton("➡️ Next", callback_data=f"page_{scope}_n{last_id}")
         )
     if nav_row:
         keyboard.append(nav_row)
@@ -212,14 +216,15 @@ def get_tasks_list_keyboard(
 
 
 # Клавиатура выбора команды
-def get_teams_keyboard(teams: list) -> InlineKeyboardMarkup:
-    """Клавиатура выбора команды из списка."""
+def get_teams_keyboard(teams: list, active_team_id: int | None = None) -> InlineKeyboardMarkup:
+    """Клавиатура выбора команды из списка; активная отмечена галочкой."""
     keyboard = []
     # Проходим по командам пользователя
     for team in teams:
+        mark = "✅" if team["team_id"] == active_team_id else "👥"
         keyboard.append([
             InlineKeyboardButton(
-                f"👥 {team['name']}", callback_data=f"select_team_{team['team_id']}"
+                f"{mark} {team['name']}", callback_data=f"select_team_{team['team_id']}"
             )
         ])
     return InlineKeyboardMarkup(keyboard)
@@ -1,103 +1,133 @@
 """
-Модуль отправки уведомлений пользователям.
+Модуль уведомлений пользователям.
 Уведомления о назначении/смене статуса/комментариях.
+Функции формируют тройки (chat_id, текст, строка сводки); обработчики
+передают их в запись Database, и сообщения попадают в outbox в одной
+транзакции с изменением. Частые события по задаче (статус, комментарии)
+имеют строку сводки: несколько таких сообщений одному получателю
+отправляются одним сообщением-сводкой.
 """
 
+import html
 import logging
-from telegram import Bot
+from typing import Optional
 from config import STATUS_EMOJI, STATUS_TEXT, PRIORITY_EMOJI
 
 logger = logging.getLogger(__name__)
 
+# Ограничения размера сводки: задач и строк на задачу
+DIGEST_MAX_TASKS = 10
+DIGEST_MAX_LINES = 5
+
 
 # Уведомление о назначении задачи
-async def notify_task_assigned(
-    bot: Bot,
+def task_assigned_messages(
     assignee_id: int,
     task: dict,
     author_name: str,
-) -> None:
-    """Отправляет уведомление исполнителю о назначенной задаче."""
-    try:
-        p_emoji = PRIORITY_EMOJI.get(task.get("priority", "medium"), "⚪️")
-        msg = (
-            f"📬 <b>Вам назначена задача!</b>\n\n"
-            f"📝 <b>#{task['task_id']}</b> — {task['title']}\n"
-            f"{p_emoji} Приоритет: {task.get('priority', 'medium')}\n"
-            f"✍️ Автор: {author_name}\n"
-        )
-        # Добавляем дедлайн, если установлен
-        if task.get("deadline"):
-            msg += f"📅 Дедлайн: {task['deadline']}\n"
-        msg += "\nОткройте задачу: /task " + str(task["task_id"])
-        await bot.send_message(chat_id=assignee_id, text=msg, parse_mode="HTML")
-        logger.info("Уведомление отправлено пользователю %s", assignee_id)
-    except Exception as e:
-        logger.error("Ошибка отправки уведомления (назначение): %s", e)
+) -> list[tuple[int, str, Optional[str]]]:
+    """Уведомление исполнителю о назначенной задаче."""
+    p_emoji = PRIORITY_EMOJI.get(task.get("priority", "medium"), "⚪️")
+    msg = (
+        f"📬 <b>Вам назначена задача!</b>\n\n"
+        f"📝 <b>#{task['task_id']}</b> — {task['title']}\n"
+        f"{p_emoji} Приоритет: {task.get('priority', 'medium')}\n"
+        f"✍️ Автор: {author_name}\n"
+    )
+    # Добавляем дедлайн, если установлен
+    if task.get("deadline"):
+        msg += f"📅 Дедлайн: {task['deadline']}\n"
+    msg += "\nОткройте задачу: /task " + str(task["task_id"])
+    return [(assignee_id, msg, None)]
 
 
 # Уведомление автору о смене статуса задачи
-async def notify_status_changed(
-    bot: Bot,
+def status_changed_messages(
     author_id: int,
     task: dict,
     new_status: str,
     changed_by: str,
-) -> None:
-    """Отправляет уведомление автору при смене статуса задачи."""
-    try:
-        s_emoji = STATUS_EMOJI.get(new_status, "⚪️")
-        s_text = STATUS_TEXT.get(new_status, new_status)
-        msg = (
-            f"🔔 <b>Статус задачи изменён!</b>\n\n"
-            f"📝 <b>#{task['task_id']}</b> — {task['title']}\n"
-            f"📊 Новый статус: {s_emoji} {s_text}\n"
-            f"👤 Изменил: {changed_by}\n"
-        )
-        await bot.send_message(chat_id=author_id, text=msg, parse_mode="HTML")
-        logger.info("Уведомление о смене статуса отправлено пользователю %s", author_id)
-    except Exception as e:
-        logger.error("Ошибка отправки уведомления (статус): %s", e)
+) -> list[tuple[int, str, Optional[str]]]:
+    """Уведомление автору при смене статуса задачи."""
+    s_emoji = STATUS_EMOJI.get(new_status, "⚪️")
+    s_text = STATUS_TEXT.get(new_status, new_status)
+    msg = (
+        f"🔔 <b>Статус задачи изменён!</b>\n\n"
+        f"📝 <b>#{task['task_id']}</b> — {task['title']}\n"
+        f"📊 Новый статус: {s_emoji} {s_text}\n"
+        f"👤 Изменил: {changed_by}\n"
+    )
+    # Имя задаёт пользователь: экранируем, чтобы не сломать разметку сводки
+    digest = f"{s_emoji} {html.escape(changed_by)}: статус «{s_text}»"
+    return [(author_id, msg, digest)]
 
 
 # Уведомление о новом комментарии
-async def notify_comment_added(
-    bot: Bot,
+def comment_added_messages(
     notify_user_ids: list[int],
     task: dict,
     commenter_name: str,
     comment_text: str,
-) -> None:
-    """Отправляет уведомления участникам о новом комментарии."""
+) -> list[tuple[int, str, Optional[str]]]:
+    """Уведомления участникам задачи о новом комментарии."""
     msg = (
         f"💬 <b>Новый комментарий</b>\n\n"
         f"📝 Задача <b>#{task['task_id']}</b> — {task['title']}\n"
         f"👤 {commenter_name}:\n"
         f"<i>{comment_text[:200]}</i>\n"
     )
-    # Проходим по получателям и отправляем каждому
-    for uid in notify_user_ids:
-        try:
-            await bot.send_message(chat_id=uid, text=msg, parse_mode="HTML")
-        except Exception as e:
-            logger.error("Ошибка отправки уведомления (комментарий) для %s: %s", uid, e)
+    # В сводке — начало комментария; экранируем его и имя, чтобы не разрезать разметку
+    short = comment_text if len(comment_text) <= 80 else comment_text[:79] + "…"
+    digest = f"💬 {html.escape(commenter_name)}: <i>{html.escape(short)}</i>"
+    return [(uid, msg, digest) for uid in notify_user_ids]
 
 
 # Уведомление всей команде о новом участнике
-async def notify_new_member(
-    bot: Bot,
+def new_member_messages(
     team_member_ids: list[int],
     new_member_name: str,
     team_name: str,
-) -> None:
-    """Уведомляет команду о новом участнике."""
+) -> list[tuple[int, str, Optional[str]]]:
+    """Уведомления команде о новом участнике."""
     msg = (
         f"👋 <b>Новый участник!</b>\n\n"
         f"<b>{new_member_name}</b> присоединился к команде «{team_name}»"
     )
-    # Проходим по участникам и отправляем каждому
-    for uid in team_member_ids:
-        try:
-            await bot.send_message(chat_id=uid, text=msg, parse_mode="HTML")
-        except Exception as e:
-            logger.error("Ошибка отправки уведомления (новый участник) для %s: %s", uid, e)
+    return [(uid, msg, None) for uid in team_member_ids]
+
+
+# Склонение слова «обновление» после числа
+def _updates_word(count: int) -> str:
+    """Возвращает «обновление», «обновления» или «обновлений» для count."""
+    if count % 10 == 1 and count % 100 != 11:
+        return "обновление"
+    if 2 <= count % 10 <= 4 and not 12 <= count % 100 <= 14:
+        return "обновления"
+    return "обновлений"
+
+
+# Сводка нескольких уведомлений одному получателю
+def digest_message(events: list[tuple[int, str]]) -> str:
+    """
+    Одно сообщение из событий (task_id, строка сводки) в порядке их появления:
+    заголовок «3 обновления по #42, 2 по #57» и последние строки по каждой задаче.
+    """
+    by_task: dict[int, list[str]] = {}
+    for task_id, line in events:
+        by_task.setdefault(task_id, []).append(line)
+
+    tasks = list(by_task.items())
+    first_id, first_lines = tasks[0]
+    counts = [f"{len(first_lines)} {_updates_word(len(first_lines))} по #{first_id}"]
+    counts += [f"{len(lines)} по #{task_id}" for task_id, lines in tasks[1:]]
+    msg = f"🔔 <b>{', '.join(counts)}</b>\n"
+
+    for task_id, lines in tasks[:DIGEST_MAX_TASKS]:
+        msg += f"\n📝 <b>#{task_id}</b>\n"
+        if len(lines) > DIGEST_MAX_LINES:
+            msg += f"• … и ещё {len(lines) - DIGEST_MAX_LINES}\n"
+        msg += "".join(f"• {line}\n" for line in lines[-DIGEST_MAX_LINES:])
+    if len(by_task) > DIGEST_MAX_TASKS:
+        msg += f"\n… и ещё задач: {len(by_task) - DIGEST_MAX_TASKS}\n"
+    msg += "\nОткройте задачу: /task [номер]"
+    return msg
@@ -0,0 +1,424 @@
+"""
+Модуль очереди исходящих сообщений.
+Уведомления пишутся в таблицу outbox вместе с вызвавшими их изменениями;
+OutboxDrainer выбирает их оттуда и передаёт в MessageOutbox, который
+отправляет сообщения с учётом лимитов Telegram: общего лимита бота и
+лимитов на отдельный чат.
+"""
+
+import asyncio
+import functools
+import heapq
+import itertools
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Callable, Optional
+
+from telegram import Bot
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+from database import AsyncDatabase
+from utils.notifications import digest_message
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Message:
+    """Сообщение в очереди чата."""
+
+    chat_id: int
+    text: str
+    kwargs: dict[str, Any]
+    future: asyncio.Future
+    attempts: int = 0
+
+
+@dataclass
+class _Chat:
+    """Очередь и расписание одного чата."""
+
+    messages: deque = field(default_factory=deque)
+    # Время цикла событий, раньше которого в чат писать нельзя
+    ready_at: float = 0.0
+    # Чат стоит в расписании или его сообщение сейчас отправляется
+    scheduled: bool = False
+
+
+class _TokenBucket:
+    """Корзина токенов: не более rate отправок в секунду с запасом burst."""
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated: Optional[float] = None
+        # Общая пауза после RetryAfter
+        self.paused_until = 0.0
+
+    async def acquire(self) -> None:
+        """Ожидает свободный токен."""
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            if self._updated is not None:
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated) * self.rate
+                )
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class MessageOutbox:
+    """
+    Очередь исходящих сообщений с учётом лимитов Telegram.
+
+    send() ставит сообщение в очередь и сразу возвращает future с результатом.
+    Воркеры отправляют сообщения параллельно, соблюдая общий лимит бота
+    (rate сообщений в секунду) и лимит чата: не чаще раза в секунду в личный
+    чат и не более 20 в минуту в группу. Сообщения одного чата уходят по
+    порядку. При RetryAfter отправка приостанавливается на указанное время,
+    сетевые ошибки повторяются с экспоненциальной задержкой.
+    """
+
+    # Минимальный интервал между сообщениями в один чат, секунды
+    PRIVATE_INTERVAL = 1.0
+    GROUP_INTERVAL = 60 / 20
+    # Повторы при сетевых ошибках
+    MAX_ATTEMPTS = 5
+    BACKOFF_BASE = 1.0
+    BACKOFF_MAX = 60.0
+
+    def __init__(self, bot: Bot, rate: float = 30.0, workers: int = 8) -> None:
+        self.bot = bot
+        self.workers = workers
+        self._bucket = _TokenBucket(rate, burst=rate)
+        self._chats: dict[int, _Chat] = {}
+        # Расписание чатов: (время готовности, порядковый номер, chat_id)
+        self._schedule: list[tuple[float, int, int]] = []
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: list[asyncio.Task] = []
+        self._pending = 0
+        self._idle: Optional[asyncio.Event] = None
+
+    async def start(self) -> None:
+        """Запускает воркеры отправки."""
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks = [
+            asyncio.create_task(self._worker()) for _ in range(self.workers)
+        ]
+        logger.info("Очередь сообщений запущена: воркеров %s", self.workers)
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Дожидается отправки очереди (не дольше timeout) и останавливает воркеры."""
+        if self._idle is not None and self._pending:
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Очередь сообщений остановлена, не отправлено: %s", self._pending)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Неотправленные сообщения отменяются: очередь можно запустить заново
+        for chat in self._chats.values():
+            for message in chat.messages:
+                message.future.cancel()
+        self._chats.clear()
+        self._schedule.clear()
+        self._pending = 0
+
+    def send(self, chat_id: int, text: str, **kwargs: Any) -> asyncio.Future:
+        """
+        Ставит сообщение в очередь.
+        Возвращает future с отправленным Message или исключением последней попытки.
+        """
+        future = asyncio.get_running_loop().create_future()
+        chat = self._chats.setdefault(chat_id, _Chat())
+        chat.messages.append(_Message(chat_id, text, kwargs, future))
+        self._pending += 1
+        self._idle.clear()
+        if not chat.scheduled:
+            self._schedule_chat(chat_id, chat.ready_at)
+        return future
+
+    def _schedule_chat(self, chat_id: int, ready_at: float) -> None:
+        """Ставит чат в расписание и будит воркеры."""
+        chat = self._chats[chat_id]
+        chat.scheduled = True
+        heapq.heappush(self._schedule, (ready_at, next(self._seq), chat_id))
+        self._wakeup.set()
+
+    async def _next_chat(self) -> int:
+        """Ожидает чат, в который уже можно писать."""
+        loop = asyncio.get_running_loop()
+        while True:
+            timeout = None
+            if self._schedule:
+                ready_at, _, chat_id = self._schedule[0]
+                timeout = ready_at - loop.time()
+                if timeout <= 0:
+                    heapq.heappop(self._schedule)
+                    return chat_id
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self) -> None:
+        """Воркер: берёт готовый чат и отправляет его первое сообщение."""
+        loop = asyncio.get_running_loop()
+        while True:
+            chat_id = await self._next_chat()
+            chat = self._chats[chat_id]
+            message = chat.messages[0]
+            await self._bucket.acquire()
+
+            retry_in = await self._deliver(message)
+            now = loop.time()
+            if retry_in is None:
+                chat.messages.popleft()
+                self._pending -= 1
+                interval = self.GROUP_INTERVAL if chat_id < 0 else self.PRIVATE_INTERVAL
+                chat.ready_at = now + interval
+            else:
+                chat.ready_at = now + retry_in
+
+            # Чат с оставшимися сообщениями — обратно в расписание
+            if chat.messages:
+                self._schedule_chat(chat_id, chat.ready_at)
+            else:
+                chat.scheduled = False
+            if not self._pending:
+                self._idle.set()
+
+    async def _deliver(self, message: _Message) -> Optional[float]:
+        """
+        Одна попытка отправки.
+        Возвращает None, если сообщение обработано (отправлено или отброшено),
+        иначе — через сколько секунд повторить.
+        """
+        try:
+            result = await self.bot.send_message(
+                chat_id=message.chat_id, text=message.text, **message.kwargs
+            )
+        except RetryAfter as e:
+            # Лимит превышен — приостанавливаем все отправки
+            delay = float(e.retry_after)
+            loop = asyncio.get_running_loop()
+            self._bucket.paused_until = max(self._bucket.paused_until, loop.time() + delay)
+            logger.warning("Лимит Telegram, пауза %s с (чат %s)", delay, message.chat_id)
+            return delay
+        except (Forbidden, BadRequest) as e:
+            # Бот заблокирован или сообщение некорректно — повтор не поможет
+            logger.error("Сообщение в чат %s отклонено: %s", message.chat_id, e)
+            self._finish(message, exc=e)
+            return None
+        except (TelegramError, OSError) as e:
+            message.attempts += 1
+            if message.attempts >= self.MAX_ATTEMPTS:
+                logger.error(
+                    "Сообщение в чат %s не отправлено после %s попыток: %s",
+                    message.chat_id, message.attempts, e,
+                )
+                self._finish(message, exc=e)
+                return None
+            delay = min(self.BACKOFF_BASE * 2 ** (message.attempts - 1), self.BACKOFF_MAX)
+            logger.warning(
+                "Ошибка отправки в чат %s, повтор через %s с: %s", message.chat_id, delay, e
+            )
+            return delay
+        except Exception as e:
+            logger.error("Ошибка отправки в чат %s: %s", message.chat_id, e)
+            self._finish(message, exc=e)
+            return None
+        self._finish(message, result=result)
+        return None
+
+    @staticmethod
+    def _finish(message: _Message, result: Any = None, exc: Optional[Exception] = None) -> None:
+        """Завершает future сообщения."""
+        if message.future.done():
+            return
+        if exc is not None:
+            message.future.set_exception(exc)
+            # Исключение считается полученным, даже если future никто не ждёт
+            message.future.exception()
+        else:
+            message.future.set_result(result)
+
+
+class OutboxDrainer:
+    """
+    Отправка сообщений из таблицы outbox (доставка «хотя бы один раз»).
+
+    Забирает готовые сообщения пачками и передаёт их в MessageOutbox;
+    в работе одновременно не больше MAX_IN_FLIGHT сообщений. Забранное
+    сообщение откладывается на LEASE: если процесс упадёт до подтверждения,
+    после перезапуска оно будет отправлено снова. Забранные вместе сообщения
+    со строкой сводки одному получателю (их Database откладывает на окно
+    объединения) отправляются одной сводкой. Итоги отправки сохраняются
+    пачками. Просыпается по сигналу Database о новых сообщениях или ко времени
+    ближайшего повтора.
+    """
+
+    MAX_IN_FLIGHT = 200
+    LEASE = timedelta(minutes=5)
+    # Повторы сообщений, которые MessageOutbox не смог доставить
+    MAX_ATTEMPTS = 8
+    RETRY_BASE = timedelta(seconds=30)
+    RETRY_MAX = timedelta(hours=1)
+    # Срок хранения отправленных сообщений (и их ключей идемпотентности)
+    KEEP_SENT = timedelta(days=7)
+    PURGE_INTERVAL = timedelta(hours=1)
+    MAX_SLEEP = 60.0
+
+    def __init__(self, db: AsyncDatabase, outbox: MessageOutbox) -> None:
+        self.db = db
+        self.outbox = outbox
+        self._in_flight: set[int] = set()
+        # Итоги отправки, ещё не записанные в БД: (message_id, attempts, исключение)
+        self._results: list[tuple[int, int, Optional[BaseException]]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._listener: Optional[Callable[[], None]] = None
+        self._runner: Optional[asyncio.Task] = None
+        self._purged_at: Optional[datetime] = None
+
+    def start(self) -> None:
+        """Запускает отправку; неотправленные до перезапуска сообщения уйдут первыми."""
+        loop = asyncio.get_running_loop()
+        wakeup = self._wakeup = asyncio.Event()
+        self._in_flight = set()
+        self._listener = lambda: loop.call_soon_threadsafe(wakeup.set)
+        self.db.sync.add_outbox_listener(self._listener)
+        self._runner = loop.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Останавливает отправку и сохраняет накопленные итоги (отправку можно
+        запустить снова). Не подтверждённые сообщения уйдут после истечения аренды.
+        """
+        if self._listener is not None:
+            self.db.sync.remove_listener(self._listener)
+            self._listener = None
+        if self._runner is not None:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+        await self._save_results()
+
+    async def _run(self) -> None:
+        """Основной цикл: сохраняет итоги, забирает и отправляет новые сообщения."""
+        while True:
+            self._wakeup.clear()
+            try:
+                await self._save_results()
+                if await self._dispatch():
+                    continue
+                await self._purge()
+                timeout = await self._sleep_time()
+            except Exception as e:
+                logger.error("Ошибка обработки очереди уведомлений: %s", e)
+                timeout = self.MAX_SLEEP
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _dispatch(self) -> bool:
+        """Передаёт готовые сообщения в MessageOutbox. True — возможно, есть ещё."""
+        free = self.MAX_IN_FLIGHT - len(self._in_flight)
+        if free <= 0:
+            return False
+        rows = await self.db.claim_outbox(free, datetime.now() + self.LEASE)
+        # Сообщения со строкой сводки одному получателю уходят одной сводкой
+        batches: list[list[Any]] = []
+        digests: dict[int, list[Any]] = {}
+        for row in sorted(rows, key=lambda r: r["message_id"]):
+            if row["message_id"] in self._in_flight:
+                continue
+            if row["digest"] is None:
+                batches.append([row])
+            elif row["chat_id"] in digests:
+                digests[row["chat_id"]].append(row)
+            else:
+                digests[row["chat_id"]] = [row]
+                batches.append(digests[row["chat_id"]])
+        for batch in batches:
+            if len(batch) == 1:
+                text = batch[0]["text"]
+            else:
+                text = digest_message([(row["task_id"], row["digest"]) for row in batch])
+            message_ids = [row["message_id"] for row in batch]
+            self._in_flight.update(message_ids)
+            future = self.outbox.send(batch[0]["chat_id"], text, parse_mode="HTML")
+            future.add_done_callback(functools.partial(
+                self._on_done, message_ids, max(row["attempts"] for row in batch)
+            ))
+        return len(rows) == free
+
+    def _on_done(self, message_ids: list[int], attempts: int, future: asyncio.Future) -> None:
+        """Итог отправки сообщения (или сводки): копится до следующего сохранения."""
+        if future.cancelled():
+            # Сообщение не отправлено до остановки — повторится после перезапуска
+            self._in_flight.difference_update(message_ids)
+            return
+        exc = future.exception()
+        self._results.extend((message_id, attempts, exc) for message_id in message_ids)
+        self._wakeup.set()
+
+    async def _save_results(self) -> None:
+        """Сохраняет итоги отправки одной транзакцией."""
+        if not self._results:
+            return
+        results, self._results = self._results, []
+        sent, retry, failed = [], [], []
+        now = datetime.now()
+        for message_id, attempts, exc in results:
+            if exc is None:
+                sent.append(message_id)
+            elif isinstance(exc, (Forbidden, BadRequest)) or attempts >= self.MAX_ATTEMPTS:
+                failed.append((message_id, str(exc)))
+            else:
+                delay = min(self.RETRY_BASE * 2 ** (attempts - 1), self.RETRY_MAX)
+                retry.append((message_id, str(exc), now + delay))
+        await self.db.finish_outbox(sent, retry, failed)
+        for message_id, _, _ in results:
+            self._in_flight.discard(message_id)
+        if failed:
+            logger.warning("Уведомления не доставлены и отброшены: %s", len(failed))
+
+    async def _purge(self) -> None:
+        """Периодически удаляет старые отправленные сообщения."""
+        now = datetime.now()
+        if self._purged_at is not None and now - self._purged_at < self.PURGE_INTERVAL:
+            return
+        self._purged_at = now
+        removed = await self.db.purge_outbox(now - self.KEEP_SENT)
+        if removed:
+            logger.info("Из очереди уведомлений удалено старых сообщений: %s", removed)
+
+    async def _sleep_time(self) -> float:
+        """Сколько спать до ближайшей попытки отправки."""
+        # Все слоты заняты — разбудит завершение отправки
+        if len(self._in_flight) >= self.MAX_IN_FLIGHT:
+            return self.MAX_SLEEP
+        next_at = await self.db.get_next_outbox_attempt()
+        if next_at is None:
+            return self.MAX_SLEEP
+        return min(max((next_at - datetime.now()).total_seconds(), 0.05), self.MAX_SLEEP)
@@ -0,0 +1,196 @@
+"""
+Модуль хранения состояния диалогов в SQLite.
+user_data и состояния ConversationHandler пишутся в общую БД, поэтому
+переживают перезапуск и доступны любому процессу-воркеру.
+"""
+
+import asyncio
+import json
+import logging
+from typing import Any, Hashable, Optional
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from database import AsyncDatabase
+
+logger = logging.getLogger(__name__)
+
+
+class SQLitePersistence(BasePersistence):
+    """
+    Хранение user_data и диалогов в таблицах user_data и conversations.
+
+    Данные сохраняются в JSON: в user_data лежат только простые значения
+    (черновик задачи, ID комментируемой задачи). chat_data, bot_data и
+    callback_data не хранятся — в bot_data лежат объекты процесса (БД, очереди).
+
+    Application раз в update_interval передаёт данные всех пользователей,
+    от которых были обновления. Они сравниваются с последней сохранённой
+    версией, и изменившиеся записываются вместе, одной транзакцией.
+    user_data пользователя читается из БД при его первом обновлении
+    (refresh_user_data), а не для всех пользователей при запуске.
+    """
+
+    def __init__(self, db: AsyncDatabase, update_interval: float = 5.0) -> None:
+        super().__init__(
+            store_data=PersistenceInput(
+                bot_data=False, chat_data=False, user_data=True, callback_data=False
+            ),
+            update_interval=update_interval,
+        )
+        self.db = db
+        # Последние записанные (или загруженные) версии: JSON или None — записи нет
+        self._stored_users: dict[int, Optional[str]] = {}
+        self._stored_conversations: dict[tuple[str, str], Optional[str]] = {}
+        # Изменения, ждущие записи
+        self._dirty_users: dict[int, Optional[str]] = {}
+        self._dirty_conversations: dict[tuple[str, str], Optional[str]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def get_user_data(self) -> dict[int, dict[str, Any]]:
+        """user_data загружается по пользователю в refresh_user_data."""
+        return {}
+
+    async def refresh_user_data(self, user_id: int, user_data: dict[str, Any]) -> None:
+        """Загрузка user_data пользователя из БД при первом обращении."""
+        if user_id in self._stored_users:
+            return
+        stored = await self.db.get_user_data(user_id)
+        if user_id in self._stored_users:
+            return
+        self._stored_users[user_id] = stored
+        if stored:
+            # Уже записанное в этом процессе не затираем
+            for key, value in json.loads(stored).items():
+                user_data.setdefault(key, value)
+
+    async def update_user_data(self, user_id: int, data: dict[str, Any]) -> None:
+        """Сохранение user_data пользователя, если оно изменилось."""
+        encoded = json.dumps(data, ensure_ascii=False, sort_keys=True) if data else None
+        # Пустые данные незагруженного пользователя не должны стереть запись в БД
+        if encoded is None and user_id not in self._stored_users:
+            return
+        self._mark(self._stored_users, self._dirty_users, user_id, encoded)
+        await self._flush_soon()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        """Удаление user_data пользователя."""
+        self._dirty_users[user_id] = None
+        await self._flush_soon()
+
+    async def get_conversations(self, name: str) -> dict[tuple, object]:
+        """Загрузка незавершённых диалогов ConversationHandler name."""
+        stored = await self.db.get_conversations(name)
+        conversations = {}
+        for key, state in stored.items():
+            self._stored_conversations[(name, key)] = state
+            conversations[tuple(json.loads(key))] = json.loads(state)
+        return conversations
+
+    async def update_conversation(
+        self, name: str, key: tuple, new_state: Optional[object]
+    ) -> None:
+        """Сохранение состояния диалога (None — диалог завершён)."""
+        state = None if new_state is None else json.dumps(new_state)
+        self._mark(
+            self._stored_conversations,
+            self._dirty_conversations,
+            (name, json.dumps(list(key))),
+            state,
+        )
+        await self._flush_soon()
+
+    async def flush(self) -> None:
+        """Запись всех накопленных изменений."""
+        await self._flush_soon()
+
+    # ─── Отложенная запись ──────────────────────────────────────────
+
+    @staticmethod
+    def _mark(
+        stored: dict[Any, Optional[str]],
+        dirty: dict[Any, Optional[str]],
+        key: Hashable,
+        value: Optional[str],
+    ) -> None:
+        """Отмечает значение для записи, если оно отличается от сохранённого."""
+        if key in stored and stored[key] == value:
+            dirty.pop(key, None)
+        else:
+            dirty[key] = value
+
+    async def _flush_soon(self) -> None:
+        """
+        Ждёт записи накопленных изменений.
+        Application вызывает update_* сразу для всех пользователей; запись
+        запускается отдельной задачей, поэтому начинается, когда все они
+        уже отметили свои изменения, и пишет их одной транзакцией.
+        """
+        if self._flush_task is None or self._flush_task.done():
+            if not self._dirty_users and not self._dirty_conversations:
+                return
+            self._flush_task = asyncio.create_task(self._write_dirty())
+        await asyncio.shield(self._flush_task)
+
+    async def _write_dirty(self) -> None:
+        """Пишет накопленные изменения, пока они есть."""
+        while self._dirty_users or self._dirty_conversations:
+            users, self._dirty_users = self._dirty_users, {}
+            conversations, self._dirty_conversations = self._dirty_conversations, {}
+            # Сохранённой считаем версию, отправленную в БД: изменения,
+            # пришедшие во время записи, сравниваются уже с ней
+            previous_users = {key: self._stored_users.get(key) for key in users}
+            previous_conversations = {
+                key: self._stored_conversations.get(key) for key in conversations
+            }
+            self._stored_users.update(users)
+            self._stored_conversations.update(conversations)
+
+            saved = await self.db.save_dialog_state(
+                list(users.items()),
+                [(name, key, state) for (name, key), state in conversations.items()],
+            )
+            if not saved:
+                # Вернём изменения в очередь (если их не заменили более новые)
+                # и повторим при следующем обновлении или flush()
+                self._stored_users.update(previous_users)
+                self._stored_conversations.update(previous_conversations)
+                for key, value in users.items():
+                    self._dirty_users.setdefault(key, value)
+                for key, value in conversations.items():
+                    self._dirty_conversations.setdefault(key, value)
+                return
+            logger.debug(
+                "Состояние диалогов сохранено: пользователей %s, диалогов %s",
+                len(users),
+                len(conversations),
+            )
+
+    # chat_data, bot_data и callback_data не хранятся
+
+    async def get_chat_data(self) -> dict[int, Any]:
+        return {}
+
+    async def update_chat_data(self, chat_id: int, data: Any) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Any) -> None:
+        pass
+
+    async def get_bot_data(self) -> Any:
+        return {}
+
+    async def update_bot_data(self, data: Any) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: Any) -> None:
+        pass
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def update_callback_data(self, data: Any) -> None:
+        pass
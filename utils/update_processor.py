@@ -0,0 +1,77 @@
+"""
+Модуль параллельной обработки обновлений.
+Обновления разных пользователей выполняются параллельно, обновления одного
+пользователя (или чата, если пользователя нет) — строго по очереди, чтобы
+не ломать ConversationHandler и состояние в user_data.
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Hashable, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+class KeyedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Обработчик обновлений с очередью на каждый ключ.
+
+    Ключ — ID пользователя обновления, без пользователя — ID чата; обновления
+    без обоих выполняются без очереди. Не больше max_in_flight обновлений
+    выполняются одновременно. Слот берётся только когда подошла очередь
+    ключа, поэтому поток обновлений от одного пользователя не занимает
+    слоты остальных. Семафор базового класса ограничивает число принятых
+    обновлений (выполняемых и ждущих в очередях) значением max_pending.
+    """
+
+    def __init__(self, max_in_flight: int = 16, max_pending: int = 4096) -> None:
+        super().__init__(max(max_pending, max_in_flight))
+        self.max_in_flight = max_in_flight
+        self._slots = asyncio.Semaphore(max_in_flight)
+        # Очереди ключей: asyncio.Lock пропускает ожидающих по порядку;
+        # рядом — число обновлений ключа в работе и в ожидании
+        self._locks: dict[Hashable, tuple[asyncio.Lock, int]] = {}
+
+    @staticmethod
+    def update_key(update: object) -> Optional[Hashable]:
+        """Ключ очереди обновления (None — обновление ни с кем не упорядочено)."""
+        if not isinstance(update, Update):
+            return None
+        if update.effective_user is not None:
+            return ("user", update.effective_user.id)
+        if update.effective_chat is not None:
+            return ("chat", update.effective_chat.id)
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        """Выполняет обновление после предыдущих обновлений того же ключа."""
+        key = self.update_key(update)
+        if key is None:
+            async with self._slots:
+                await coroutine
+            return
+
+        lock, waiting = self._locks.get(key, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._locks[key] = (lock, waiting + 1)
+        try:
+            async with lock, self._slots:
+                await coroutine
+        finally:
+            lock, waiting = self._locks[key]
+            if waiting == 1:
+                del self._locks[key]
+            else:
+                self._locks[key] = (lock, waiting - 1)
+
+    async def initialize(self) -> None:
+        """Ресурсов для подготовки нет."""
+
+    async def shutdown(self) -> None:
+        """Application.stop() уже дождался всех обновлений."""
+        if self._locks:
+            logger.warning("Остались незавершённые очереди обновлений: %s", len(self._locks))
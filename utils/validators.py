@@ -101,6 +101,29 @@ def validate_deadline(text: str) -> datetime | None:
     return None
 
 
+# Разбор смещений напоминаний
+def parse_reminder_offsets(args: list[str]) -> list[int] | None:
+    """
+    Парсит смещения напоминаний вида 24h, 3h, 30m, 1d, now (или 0).
+    Возвращает минуты до дедлайна по убыванию или None при ошибке.
+    Допускается не более 5 напоминаний и не раньше чем за 7 дней.
+    """
+    units = {"m": 1, "h": 60, "d": 1440}
+    offsets = set()
+    for arg in args:
+        token = arg.strip().lower()
+        # Напоминание в момент дедлайна
+        if token in ("0", "now"):
+            offsets.add(0)
+            continue
+        if len(token) < 2 or token[-1] not in units or not token[:-1].isdigit():
+            return None
+        offsets.add(int(token[:-1]) * units[token[-1]])
+    if not offsets or len(offsets) > 5 or max(offsets) > 7 * 1440:
+        return None
+    return sorted(offsets, reverse=True)
+
+
 # Валидация длины текста
 def validate_text_length(text: str, max_length: int) -> bool:
     """Проверяет, не превышает ли текст максимальную длину."""
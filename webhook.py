@@ -0,0 +1,158 @@
+"""
+Режим webhook: локальный HTTP-сервер aiohttp вместо long polling.
+Telegram (или обратный прокси перед ботом) присылает обновления POST-запросами;
+сервер проверяет секретный токен и кладёт обновления в очередь Application.
+"""
+
+import asyncio
+import json
+import logging
+import secrets
+import signal
+from typing import Any, Awaitable, Callable, Optional
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+# Заголовок, в котором Telegram передаёт secret_token из setWebhook
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+# Приёмник обновлений: получает разобранный JSON одного Update
+UpdateReceiver = Callable[[dict[str, Any]], Awaitable[None]]
+
+
+class WebhookServer:
+    """
+    HTTP-сервер приёма обновлений.
+
+    Запросы обрабатываются параллельно: сервер только проверяет секретный
+    токен и передаёт JSON приёмнику on_update (по умолчанию — в очередь
+    Application, см. application_receiver). Запрос без верного токена
+    отклоняется с 403, некорректное обновление — с 400 (Telegram такие
+    запросы не повторяет бесконечно). Ошибка приёмника даёт 503, и Telegram
+    повторит доставку позже.
+    """
+
+    def __init__(
+        self,
+        on_update: UpdateReceiver,
+        listen: str,
+        port: int,
+        path: str,
+        secret_token: str,
+    ) -> None:
+        self.on_update = on_update
+        self.listen = listen
+        self.port = port
+        self.path = path
+        self.secret_token = secret_token
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self) -> None:
+        """Запускает HTTP-сервер."""
+        app = web.Application()
+        app.router.add_post(self.path, self._handle_update)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.listen, self.port).start()
+        logger.info("Webhook слушает http://%s:%s%s", self.listen, self.port, self.path)
+
+    async def stop(self) -> None:
+        """Останавливает HTTP-сервер."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle_update(self, request: web.Request) -> web.Response:
+        """Приём одного обновления."""
+        token = request.headers.get(SECRET_HEADER, "")
+        if not secrets.compare_digest(token, self.secret_token):
+            logger.warning("Webhook: запрос с неверным секретным токеном от %s", request.remote)
+            return web.Response(status=403)
+        try:
+            data = await request.json()
+            if not isinstance(data, dict):
+                raise ValueError("ожидался объект Update")
+            await self.on_update(data)
+        except (json.JSONDecodeError, TypeError, ValueError, KeyError) as e:
+            logger.warning("Webhook: некорректное обновление: %s", e)
+            return web.Response(status=400)
+        except Exception as e:
+            logger.error("Webhook: обновление не принято: %s", e)
+            return web.Response(status=503)
+        return web.Response()
+
+
+# Приёмник, передающий обновления в Application
+def application_receiver(application: Application) -> UpdateReceiver:
+    """Разбирает Update и ставит его в application.update_queue."""
+
+    async def receive(data: dict[str, Any]) -> None:
+        update = Update.de_json(data, application.bot)
+        if update is None:
+            raise ValueError("пустое обновление")
+        await application.update_queue.put(update)
+
+    return receive
+
+
+# Запуск приложения в режиме webhook
+def run_webhook(
+    application: Application,
+    server: WebhookServer,
+    webhook_url: str = "",
+    max_connections: int = 40,
+) -> None:
+    """
+    Запускает Application и сервер webhook до SIGINT/SIGTERM.
+
+    Жизненный цикл повторяет run_polling: initialize → post_init → start,
+    при остановке — stop → post_stop → shutdown. Если задан webhook_url,
+    бот регистрирует его через setWebhook; накопившиеся за время
+    перезапуска обновления не сбрасываются, а обрабатываются.
+    """
+    asyncio.run(_serve(application, server, webhook_url, max_connections))
+
+
+async def _serve(
+    application: Application,
+    server: WebhookServer,
+    webhook_url: str,
+    max_connections: int,
+) -> None:
+    """Асинхронная часть run_webhook."""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        # Сервер поднимается до setWebhook: Telegram сразу начнёт слать очередь
+        await server.start()
+        if webhook_url:
+            await application.bot.set_webhook(
+                url=webhook_url,
+                secret_token=server.secret_token,
+                allowed_updates=Update.ALL_TYPES,
+                max_connections=max_connections,
+                drop_pending_updates=False,
+            )
+            logger.info("Webhook зарегистрирован: %s", webhook_url)
+        await application.start()
+        await stop_event.wait()
+        logger.info("Получен сигнал остановки")
+    finally:
+        # Новые обновления не принимаем; уже принятые обработает stop()
+        await server.stop()
+        if application.running:
+            await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()